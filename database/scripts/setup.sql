@@ -1,11 +1,12 @@
 -- Switch to the desired database
 USE template_db;
 
--- Drop the existing table
---DROP TABLE note;
-
--- Create the new table
--- Create the table (if not exists)
+-- The tables in their original shape, the same as the ingester's schema
+-- migration 1 (ingester/src/SchemaMigrations.py). The ingester's later
+-- migrations upgrade them when it connects, so the backend can start against
+-- this database before the ingester has run. To inspect or apply them by hand:
+--   python src/DataIngester.py migrate --dry-run
+--   python src/DataIngester.py migrate
 CREATE TABLE IF NOT EXISTS housing_data (
     id INT AUTO_INCREMENT PRIMARY KEY COMMENT 'Primary Key',
     jsonid INT DEFAULT 0 COMMENT 'JSON ID',
@@ -29,4 +30,4 @@ CREATE TABLE IF NOT EXISTS labour_market_data (
     province INT DEFAULT 0 COMMENT 'Province',
     education_level INT DEFAULT 0 COMMENT 'Education Level',
     labour_force_status INT DEFAULT 0 COMMENT 'Labour Force Status'
-);
\ No newline at end of file
+);
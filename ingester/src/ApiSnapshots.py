@@ -0,0 +1,266 @@
+"""
+ApiSnapshots.py: Pre-rendered payloads of the backend's read endpoints.
+After a successful run the ingester renders exactly what the dashboard asks the
+backend for & writes it as static, precompressed JSON files the web tier can
+serve directly:
+
+    housingStats.json                       GET /api/housingStats
+    housingStats/starts/<slug>.json         GET /api/housingStats/starts/{censusArea}
+    housingStats/completions/<slug>.json    GET /api/housingStats/completions/{censusArea}
+    labourMarket.json                       GET /api/labourMarket
+
+CMA files are named with a slug of [a-z0-9-] only ("St. John's" becomes
+st-john-s.json), which a static server finds whatever it decodes;
+housingStats/areas.json maps every CMA name to its file name.
+Tables are read page by page & streamed to disk, so no payload is ever held in
+memory as a whole. Each file is written with .gz (and .br when the brotli
+package is installed) siblings. manifest.json lists every file's content hash,
+usable as an ETag; files whose content didn't change are left untouched.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import unicodedata
+import zlib
+from contextlib import ExitStack
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# (column, JSON property) pairs, named like the backend's Data & LabourData entities
+HOUSING_PROPERTIES = [
+    ("id", "id"),
+    ("census_metropolitan_area", "censusArea"),
+    ("total_starts", "totalStarts"),
+    ("total_complete", "totalComplete"),
+    ("month", "month"),
+    ("singles_starts", "singleStarts"),
+    ("semis_starts", "semisStarts"),
+    ("row_starts", "rowStarts"),
+    ("apartment_starts", "apartmentStarts"),
+    ("singles_complete", "singlesComplete"),
+    ("semis_complete", "semisComplete"),
+    ("row_complete", "rowComplete"),
+    ("apartment_complete", "apartmentComplete"),
+]
+
+LABOUR_PROPERTIES = [
+    ("id", "id"),
+    ("province", "province"),
+    ("education_level", "educationLevel"),
+    ("labour_force_status", "labourForceStatus"),
+]
+
+
+def select_sql(table, properties):
+    """
+    select_sql: Returns the statement reading the page of a table's rows after
+    a given id, in id order.
+    """
+    return (
+        f"SELECT {', '.join(column for column, _ in properties)} FROM {table} "
+        f"WHERE id > ? ORDER BY id LIMIT ?"
+    )
+
+
+def slug(name):
+    """
+    slug: Returns a file name stem for a CMA name made of [a-z0-9-] only.
+    """
+    ascii_name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", "-", ascii_name.lower()).strip("-") or "area"
+
+
+def area_files(areas):
+    """
+    area_files: Returns {CMA name: file name}. Names whose slugs collide get
+    a suffix from their checksum.
+    """
+    files = {}
+    used = set()
+    for area in sorted(areas):
+        stem = slug(area)
+        if stem in used:
+            stem = f"{stem}-{zlib.crc32(area.encode('utf-8')):08x}"
+        used.add(stem)
+        files[area] = f"{stem}.json"
+    return files
+
+
+def encode(payload):
+    """
+    encode: Returns the compact JSON encoding of a payload.
+    """
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+def json_array(objects):
+    """
+    json_array: Yields the JSON encoding of a list of objects chunk by chunk.
+    """
+    yield b"["
+    for index, obj in enumerate(objects):
+        yield b"," + encode(obj) if index else encode(obj)
+    yield b"]"
+
+
+class ApiSnapshots:
+    """
+    ApiSnapshots class: Renders the read endpoints' payloads from the database
+    & publishes them atomically.
+    """
+
+    def __init__(self, db, directory=None, page_rows=10000):
+        """
+        __init__: Initializes the publisher for a storage backend. The directory
+        defaults to API_SNAPSHOT_DIR, or "api_snapshots"; an empty
+        API_SNAPSHOT_DIR disables publishing. Tables are read `page_rows` rows
+        at a time.
+        """
+        self.db = db
+        self.directory = directory if directory is not None else os.getenv(
+            "API_SNAPSHOT_DIR", "api_snapshots"
+        )
+        self.enabled = bool(self.directory)
+        self.page_rows = page_rows
+        self.manifest_path = os.path.join(self.directory, "manifest.json")
+
+    def rows(self, table, properties):
+        """
+        rows: Yields a table's rows as endpoint objects, reading it page by
+        page after the last id seen. The id must be the first property.
+        """
+        names = [name for _, name in properties]
+        last_id = 0
+        while True:
+            page = self.db.query(select_sql(table, properties), (last_id, self.page_rows))
+            for row in page:
+                yield dict(zip(names, row))
+            if len(page) < self.page_rows:
+                return
+            last_id = page[-1][0]
+
+    def documents(self):
+        """
+        documents: Yields (relative path, chunks) for every endpoint. The per-CMA
+        totals are summed while the housing rows stream by, so one scan per
+        table is enough; each document must be consumed before the next.
+        """
+        starts = {}
+        completions = {}
+
+        def housing():
+            for record in self.rows("housing_data", HOUSING_PROPERTIES):
+                area = record["censusArea"]
+                starts[area] = starts.get(area, 0) + (record["totalStarts"] or 0)
+                completions[area] = completions.get(area, 0) + (record["totalComplete"] or 0)
+                yield record
+
+        yield "housingStats.json", json_array(housing())
+        yield "labourMarket.json", json_array(self.rows("labour_market_data", LABOUR_PROPERTIES))
+        files = area_files(starts)
+        yield "housingStats/areas.json", [encode(files)]
+        for area, file_name in files.items():
+            yield f"housingStats/starts/{file_name}", [encode(starts[area])]
+            yield f"housingStats/completions/{file_name}", [encode(completions[area])]
+
+    def load_manifest(self):
+        """
+        load_manifest: Returns the manifest of the previous publish.
+        """
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    @staticmethod
+    def write_atomic(path, content):
+        """
+        write_atomic: Writes bytes to a temporary file & moves it into place,
+        so the web tier never serves a partial file.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def stream(full_path, chunks):
+        """
+        stream: Writes a document & its precompressed variants to temporary
+        files next to `full_path`, hashing it on the way. Returns (hash, bytes).
+        If rendering or writing fails, the temporary files are removed.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        compressor = brotli.Compressor() if brotli is not None else None
+        tmp_paths = [f"{full_path}{suffix}.tmp" for suffix in ("", ".gz", ".br")]
+        streamed = False
+        try:
+            with ExitStack() as files:
+                plain = files.enter_context(open(tmp_paths[0], "wb"))
+                gz_file = files.enter_context(open(tmp_paths[1], "wb"))
+                gz = files.enter_context(gzip.GzipFile("", "wb", 9, gz_file, mtime=0))
+                br = files.enter_context(open(tmp_paths[2], "wb")) if compressor else None
+                for chunk in chunks:
+                    digest.update(chunk)
+                    size += len(chunk)
+                    plain.write(chunk)
+                    gz.write(chunk)
+                    if br:
+                        br.write(compressor.process(chunk))
+                if br:
+                    br.write(compressor.finish())
+            streamed = True
+        finally:
+            if not streamed:
+                for tmp_path in tmp_paths:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+        return digest.hexdigest()[:16], size
+
+    def write(self, path, chunks, etag=None):
+        """
+        write: Streams a document & its precompressed variants. Unless its hash
+        is still `etag`, the files replace the published ones, compressed ones
+        first so the plain file never advertises missing siblings.
+        Returns (etag, bytes, written).
+        """
+        full_path = os.path.join(self.directory, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        targets = [full_path, f"{full_path}.gz"] + ([f"{full_path}.br"] if brotli else [])
+        new_etag, size = self.stream(full_path, chunks)
+        if new_etag == etag and os.path.exists(full_path):
+            for target in targets:
+                os.remove(f"{target}.tmp")
+            return new_etag, size, False
+        for target in reversed(targets):
+            os.replace(f"{target}.tmp", target)
+        return new_etag, size, True
+
+    def publish(self):
+        """
+        publish: Renders & writes every payload whose content changed, then the
+        manifest. Returns the number of files written.
+        """
+        if not self.enabled:
+            return 0
+        previous = self.load_manifest()
+        manifest = {}
+        written = 0
+        for path, chunks in self.documents():
+            etag, size, changed = self.write(path, chunks, previous.get(path, {}).get("etag"))
+            manifest[path] = {"etag": etag, "bytes": size}
+            written += changed
+        self.write_atomic(self.manifest_path,
+                          json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+        print(f"Published API snapshots: {written} of {len(manifest)} files changed")
+        return written
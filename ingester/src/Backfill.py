@@ -0,0 +1,254 @@
+"""
+Backfill.py: Parallel historical rebuilds.
+The requested date range is split into windows using the API's date filter,
+each window is ingested by its own worker process (own HTTP session & DB
+connections), and the parent merges their progress into one checkpoint &
+summary. Windows already in the checkpoint are skipped, so an interrupted
+backfill resumes where it stopped.
+
+With --distributed the windows are queued in the database instead & every
+replica running the same command claims them one at a time, see WorkQueue.
+
+Usage: python src/DataIngester.py backfill --from 2020-01-01 [--to 2024-12-31] [--workers N]
+                                           [--distributed]
+"""
+
+import json
+import os
+import shutil
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from contextlib import ExitStack
+from datetime import datetime, timedelta, timezone
+from src.DatasetRegistry import DATASETS
+
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def date_windows(start, end, days):
+    """
+    date_windows: Splits [start, end) into (after, before) windows of `days`
+    days, as YYYY-MM-DD strings.
+    """
+    first = datetime.strptime(start, DATE_FORMAT)
+    last = datetime.strptime(end, DATE_FORMAT)
+    windows = []
+    while first < last:
+        upper = min(first + timedelta(days=days), last)
+        windows.append((first.strftime(DATE_FORMAT), upper.strftime(DATE_FORMAT)))
+        first = upper
+    return windows
+
+
+def window_params(after, before):
+    """
+    window_params: Returns the API query parameters selecting one window. The
+    upper bound's name comes from API_BEFORE_PARAM (default "before"); if the
+    API ignores it windows overlap, which the natural-key upserts absorb.
+    """
+    return {"after": after, os.getenv("API_BEFORE_PARAM", "before"): before}
+
+
+class Backfill:
+    """
+    Backfill class: Plans the windows of a backfill, runs them on a pool of
+    worker processes & keeps the shared checkpoint.
+    """
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+
+    def __init__(self, dead_letters, workers=None, window_days=30, checkpoint_file=None,
+                 newest_first=True, run_window=None):
+        """
+        __init__: Initializes the backfill. Windows are ingested by
+        `run_window(name, after, before, dead_letter_dir)`, which returns
+        (processed, dead-lettered entries) & must be a module-level function
+        so it can be sent to the worker processes, see
+        DataIngester.run_backfill_window. Rejected records of every window end
+        up in `dead_letters`. The checkpoint defaults to BACKFILL_CHECKPOINT or
+        "backfill_checkpoint.json". With `newest_first` the most recent windows
+        are handed to the workers first, so dashboards are useful long before
+        the older history is in.
+        """
+        self.dead_letters = dead_letters
+        self.workers = workers or os.cpu_count() or 1
+        self.window_days = window_days
+        self.newest_first = newest_first
+        self.run_window = run_window
+        self.checkpoint_file = checkpoint_file or os.getenv(
+            "BACKFILL_CHECKPOINT", "backfill_checkpoint.json"
+        )
+        self.checkpoint = self.load_checkpoint()
+
+    def load_checkpoint(self):
+        """
+        load_checkpoint: Returns the finished windows of earlier runs.
+        """
+        try:
+            with open(self.checkpoint_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def save_checkpoint(self):
+        """
+        save_checkpoint: Atomically rewrites the checkpoint file.
+        """
+        tmp_path = f"{self.checkpoint_file}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.checkpoint, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.checkpoint_file)
+
+    def plan(self, names, start, end):
+        """
+        plan: Returns the (dataset, after, before) windows not finished yet, in
+        the order they are run: by period (newest first unless disabled), the
+        datasets of one period together.
+        """
+        windows = date_windows(start, end, self.window_days)
+        if self.newest_first:
+            windows.reverse()
+        return [
+            (name, after, before)
+            for after, before in windows
+            for name in names
+            if f"{name}:{after}:{before}" not in self.checkpoint
+        ]
+
+    def record(self, window, processed, rejected):
+        """
+        record: Merges a finished window into the checkpoint & the dead-letter store.
+        """
+        name, after, before = window
+        for entry in rejected:
+            self.dead_letters.add(name, entry["record"], entry["reason"], entry.get("offset"))
+        self.dead_letters.flush(name)
+        self.checkpoint[f"{name}:{after}:{before}"] = {
+            "processed": processed,
+            "rejected": len(rejected),
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+        }
+        self.save_checkpoint()
+        print(f"Backfilled {name} {after}..{before}: processed={processed}, "
+              f"rejected={len(rejected)}")
+
+    def add_to_summary(self, summary, window, processed, rejected):
+        """
+        add_to_summary: Adds a finished window to the per-dataset summary.
+        """
+        totals = summary.setdefault(window[0], {"processed": 0, "rejected": 0, "windows": 0})
+        totals["processed"] += processed
+        totals["rejected"] += len(rejected)
+        totals["windows"] += 1
+
+    def run_distributed(self, start, end, queue, names=None):
+        """
+        run_distributed: Queues [start, end) for the given datasets (default
+        all) & works through the queue until nothing is left to claim, on up to
+        `workers` processes, holding each window's lease while it runs. A
+        failed window goes back to the queue for any replica to retry.
+        Returns this replica's summary.
+        """
+        queue.enqueue(self.plan(names or list(DATASETS), start, end))
+        work_dir = os.path.join(self.dead_letters.directory, "backfill")
+        summary = {}
+
+        def finished(unit_id, window, result):
+            try:
+                processed, rejected = result()
+            except Exception as window_error:
+                queue.fail(unit_id, window_error)
+                print(f"Backfill window {window} failed: {window_error}")
+                return
+            if not queue.complete(unit_id, processed):
+                print(f"Backfill window {window} lost its lease, not recording it")
+                return
+            self.record(window, processed, rejected)
+            self.add_to_summary(summary, window, processed, rejected)
+
+        try:
+            if self.workers == 1:
+                for unit in iter(queue.claim, None):
+                    unit_id, window = unit[0], tuple(unit[1:])
+                    with queue.hold(unit_id):
+                        finished(unit_id, window, lambda window=window: self.run_window(
+                            *window, os.path.join(work_dir, "-".join(window))))
+            else:
+                self.run_claimed(queue, work_dir, finished)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        print(f"Backfill summary of {queue.owner}: {summary}, queue={queue.counts()}")
+        return summary
+
+    def run_claimed(self, queue, work_dir, finished):
+        """
+        run_claimed: Keeps `workers` claimed windows running on a process pool
+        until the queue is drained, holding each lease until its window ends.
+        """
+        running = {}
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                while True:
+                    while len(running) < self.workers:
+                        unit = queue.claim()
+                        if unit is None:
+                            break
+                        unit_id, window = unit[0], tuple(unit[1:])
+                        lease = ExitStack()
+                        lease.enter_context(queue.hold(unit_id))
+                        future = pool.submit(
+                            self.run_window, *window, os.path.join(work_dir, "-".join(window))
+                        )
+                        running[future] = (unit_id, window, lease)
+                    if not running:
+                        break
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        unit_id, window, lease = running.pop(future)
+                        lease.close()
+                        finished(unit_id, window, future.result)
+        finally:
+            for _, _, lease in running.values():
+                lease.close()
+
+    def run(self, start, end, names=None):
+        """
+        run: Backfills [start, end) for the given datasets (default all) & returns
+        the per-dataset summary. A window that fails is left out of the
+        checkpoint, so the next run retries it.
+        """
+        windows = self.plan(names or list(DATASETS), start, end)
+        print(f"Backfill: {len(windows)} windows on {self.workers} workers")
+        work_dir = os.path.join(self.dead_letters.directory, "backfill")
+        summary = {}
+        failed = []
+
+        def finished(window, result):
+            try:
+                processed, rejected = result()
+            except Exception as window_error:
+                failed.append(window)
+                print(f"Backfill window {window} failed: {window_error}")
+                return
+            self.record(window, processed, rejected)
+            self.add_to_summary(summary, window, processed, rejected)
+
+        try:
+            if self.workers == 1:
+                for window in windows:
+                    finished(window, lambda window=window: self.run_window(
+                        *window, os.path.join(work_dir, "-".join(window))))
+            else:
+                with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                    futures = {
+                        pool.submit(
+                            self.run_window, *window, os.path.join(work_dir, "-".join(window))
+                        ): window
+                        for window in windows
+                    }
+                    for future in as_completed(futures):
+                        finished(futures[future], future.result)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        print(f"Backfill summary: {summary}, failed windows={len(failed)}")
+        return summary
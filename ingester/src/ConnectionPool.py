@@ -0,0 +1,118 @@
+"""
+ConnectionPool.py: Small thread-safe pool of database connections.
+"""
+
+import queue
+import threading
+import time
+
+
+class ConnectionPool:
+    """
+    ConnectionPool class: Hands out up to `size` connections created by
+    `factory`. Connections idle for longer than `health_check_interval`
+    seconds are pinged before being handed out, and dead ones are replaced.
+    """
+
+    def __init__(self, factory, size=4, health_check_interval=30):
+        """
+        __init__: Initializes an empty pool, connections are created on demand.
+        """
+        self.factory = factory
+        self.size = size
+        self.health_check_interval = health_check_interval
+        self.idle = []
+        self.last_used = {}
+        self.created = 0
+        self.available = threading.Condition()
+
+    def acquire(self, timeout=None):
+        """
+        acquire: Returns a healthy connection, creating one if the pool isn't
+        full yet, otherwise waiting up to `timeout` seconds for one to be
+        released or discarded. Raises queue.Empty if the wait times out.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            conn = self._take_or_reserve(deadline)
+            if conn is None:
+                return self._create()
+            if self.is_healthy(conn):
+                return conn
+            self.discard(conn)
+
+    def _take_or_reserve(self, deadline):
+        """
+        _take_or_reserve: Pops an idle connection, or reserves a slot for a new
+        one (returning None) once `created < size`, waiting until either happens.
+        """
+        with self.available:
+            while True:
+                if self.idle:
+                    return self.idle.pop()
+                if self.created < self.size:
+                    self.created += 1
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise queue.Empty
+                self.available.wait(remaining)
+
+    def _create(self):
+        """
+        _create: Creates a connection for a reserved slot, freeing the slot if it fails.
+        """
+        try:
+            return self.factory()
+        except Exception:
+            with self.available:
+                self.created -= 1
+                self.available.notify()
+            raise
+
+    def is_healthy(self, conn):
+        """
+        is_healthy: Pings connections that have been idle for a while.
+        """
+        idle_since = self.last_used.get(conn, 0)
+        if time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        try:
+            conn.ping()
+            return True
+        except Exception:
+            return False
+
+    def release(self, conn, broken=False):
+        """
+        release: Returns a connection to the pool, or drops it if it is broken.
+        """
+        if broken:
+            self.discard(conn)
+            return
+        with self.available:
+            self.last_used[conn] = time.monotonic()
+            self.idle.append(conn)
+            self.available.notify()
+
+    def discard(self, conn):
+        """
+        discard: Closes a connection & frees its slot in the pool, waking a waiter.
+        """
+        with self.available:
+            self.last_used.pop(conn, None)
+            self.created -= 1
+            self.available.notify()
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """
+        close: Closes every idle connection.
+        """
+        with self.available:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            self.discard(conn)
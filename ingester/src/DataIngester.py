@@ -2,81 +2,199 @@
 DataIngester.py: Receives data from data service & stores in database.
 """
 
+import argparse
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import signal
+import threading
 import time
 from datetime import datetime, timedelta, timezone
+from itertools import groupby
 import requests
-from src.DatabaseHandler import DatabaseHandler
-from src.housingdata.HousingData import HousingData
-from src.labourMarketData.LabourMarketData import LabourMarketData
+from src.ApiSnapshots import ApiSnapshots
+from src.Backfill import Backfill, date_windows, window_params
+from src.DatasetRegistry import COMBINED_STATS, DATASETS, HOUSING, LABOUR_MARKET
+from src.DeadLetterStore import DeadLetterStore
+from src.FileSource import FileSource
+from src.GapStore import GapStore
+from src.JsonDecoder import loads
+from src.RateController import RateController, parse_retry_after
+from src.RecordFilter import RecordFilter
+from src.Reconciler import Reconciler
+from src.RunLock import LOCK_MODES, RunLock
+from src.Scheduler import Scheduler
+from src.ShardedWriter import ShardedWriter
+from src.SnapshotWriter import SnapshotWriter
+from src.WorkQueue import WorkQueue
+from src.WriteSpool import WriteSpool
+
+
+def storage_class():
+    """
+    storage_class: Returns the storage backend class selected by DB_BACKEND
+    (mariadb or sqlite, default mariadb).
+    """
+    # Imported here so each backend only loads its own driver
+    # pylint: disable=import-outside-toplevel
+    if os.getenv("DB_BACKEND", "mariadb").lower() == "sqlite":
+        from src.SqliteHandler import SqliteHandler
+        return SqliteHandler
+    from src.DatabaseHandler import DatabaseHandler
+    return DatabaseHandler
+
+
+class PageFetchError(Exception):
+    """
+    PageFetchError class: Raised when a page still can't be fetched after every retry.
+    """
 
 
 class DataIngester:
     """
-    DataIngester class: Receives data from the data service using joblen's 
+    DataIngester class: Receives data from the data service using joblen's
     API key.
     """
-    def __init__(self, connect):
+    def __init__(self, connect, writers=None, migrate_on_connect=True):
         """
         __init__: Creates a Database Handler & initializes the data ingester
-        with the joblen API key & URL.
+        with the joblen API key & URL. With more than one writer (`writers` or
+        INGEST_WRITERS) batches are written by a ShardedWriter in parallel.
         """
-        self.db = DatabaseHandler(connect)
+        self.db = storage_class()(connect, migrate_on_connect=migrate_on_connect)
+        # Batches are written through the spool; it only queues them on disk while
+        # the DB is down once an ingest run begins, see begin_writes
+        self.spool = WriteSpool(self.db, directory="", on_written=self.rows_written)
+        self.run_lock = RunLock(self.db)
+        self.filters = {name: RecordFilter.from_env(dataset) for name, dataset in DATASETS.items()}
+        self.writers = writers or int(os.getenv("INGEST_WRITERS", "1"))
+        self.writer = None
         self.api_labour_market = os.getenv("API_URL_LABOUR_MARKET")
         self.api_housing = os.getenv("API_URL_HOUSING")
         self.api_key = os.getenv("API_KEY")
         self.last_update_file = "lastUpdated.txt"
+        self.dead_letters = DeadLetterStore()
+        self.snapshots = SnapshotWriter()
+        self.api_snapshots = ApiSnapshots(self.db)
+        # CMAs whose combined_stats rows are stale, refreshed after the writes
+        self.combined_changes = set()
+        self.current_offset = None
+        self.page_size = 5000
+        self.session = requests.Session()
+        # One controller governs the fetches of every endpoint
+        self.rate = RateController(
+            maximum=int(os.getenv("API_MAX_CONCURRENCY", "4")),
+            latency_target=float(os.getenv("API_LATENCY_TARGET", "10")),
+        )
+        self.page_retries = int(os.getenv("API_PAGE_RETRIES", "5"))
+        self.retry_backoff = 1.0
+        self.max_consecutive_gaps = 3
+        self.gaps = GapStore()
+        # "offset" pages through everything after the last update, "newest"
+        # ingests date windows from the most recent one backwards
+        self.order = os.getenv("INGEST_ORDER", "offset")
+        self.history_start = os.getenv("INGEST_HISTORY_START", "2010-01-01")
+        self.window_days = int(os.getenv("INGEST_WINDOW_DAYS", "30"))
+        # "offset" pages with offset=; "keyset" pages by the last id seen
+        # (sent as API_KEYSET_PARAM) & falls back to offsets if the API ignores it
+        self.paging = os.getenv("API_PAGING", "offset")
+        self.keyset_param = os.getenv("API_KEYSET_PARAM", "after_id")
+        self.stop_event = threading.Event()
 
-    def get_last_update(self):
+    def last_update_path(self, dataset=None):
+        """
+        last_update_path: Returns the last-update file of a dataset, or the
+        shared lastUpdated.txt when no dataset is given.
+        """
+        if dataset is None:
+            return self.last_update_file
+        root, ext = os.path.splitext(self.last_update_file)
+        return f"{root}_{dataset}{ext}"
+
+    def get_last_update(self, dataset=None):
         """
         get_last_update: Attempts to read lastUpdated.txt to get the last ingestion date.
+        With a dataset its own file is read first, falling back to lastUpdated.txt.
         Returns date in YYYY-MM-DD format, or None if file doesn't exist.
         """
-        try:
-            with open(self.last_update_file, "r", encoding='utf-8') as f:
-                date_str = f.read().strip()
-                return date_str if date_str else None
-        except FileNotFoundError:
-            return None
+        paths = [self.last_update_path(dataset)]
+        if dataset is not None:
+            paths.append(self.last_update_file)
+        for path in paths:
+            try:
+                with open(path, "r", encoding='utf-8') as f:
+                    date_str = f.read().strip()
+                    return date_str if date_str else None
+            except FileNotFoundError:
+                continue
+        return None
 
-    def save_last_update(self):
+    def save_last_update(self, dataset=None):
         """
-        save_last_update: Saves current UTC date in last_update_file, formatted as YYYY-MM-DD.
+        save_last_update: Saves current UTC date in last_update_file (or the
+        dataset's own file), formatted as YYYY-MM-DD.
         """
         current_date = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-        with open(self.last_update_file, "w", encoding='utf-8') as f:
+        with open(self.last_update_path(dataset), "w", encoding='utf-8') as f:
             f.write(current_date)
 
     def fetch_batch(self, url, offset, params=None):
         """
         fetch_batch: Fetches a single batch of data from the API.
-        Returns a single batch rather than accumulating all data.
+        Returns a single batch rather than accumulating all data; an empty batch
+        means there is no more data. Every request goes through the rate
+        controller. Throttled requests are retried after the controller's
+        Retry-After pause, errors & 5xx responses with exponential backoff.
+        Raises PageFetchError once `page_retries` attempts have failed, or at
+        once for other 4xx responses, which a retry can't fix. Keyset pages are
+        fetched with offset None, which sends no offset.
         """
         if params is None:
             params = {}
-        
-        params["offset"] = offset
+
+        if offset is not None:
+            params["offset"] = offset
         headers = {"Apikey": self.api_key}
-        
-        try:
-            response = requests.get(url, headers=headers, params=params, timeout=100)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as parse_error:
-            print(f"Error fetching batch with offset {offset} from {url}: {parse_error}")
-            return []
+        error = None
 
-    def fetch_and_process_data(self, url, processor_func):
+        for attempt in range(self.page_retries):
+            if attempt:
+                time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+            self.rate.acquire()
+            started = time.monotonic()
+            try:
+                response = self.session.get(url, headers=headers, params=params, timeout=100)
+            except requests.exceptions.RequestException as request_error:
+                self.rate.release(time.monotonic() - started)
+                error = request_error
+                print(f"Error fetching batch with offset {offset} from {url} "
+                      f"(attempt {attempt + 1}): {request_error}")
+                continue
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            self.rate.release(time.monotonic() - started, response.status_code, retry_after)
+            if response.status_code == 429 or response.status_code >= 500:
+                error = f"HTTP {response.status_code}"
+                print(f"HTTP {response.status_code} fetching offset {offset} "
+                      f"(attempt {attempt + 1}), retrying with limit={self.rate.window()}")
+                continue
+            try:
+                response.raise_for_status()
+                return loads(response.content)
+            except requests.exceptions.HTTPError as http_error:
+                raise PageFetchError(f"offset {offset}: {http_error}") from http_error
+            except ValueError as parse_error:
+                error = parse_error
+                print(f"Invalid JSON at offset {offset} (attempt {attempt + 1}): {parse_error}")
+        raise PageFetchError(f"offset {offset}: {error} after {self.page_retries} attempts")
+
+    def request_params(self, dataset=None, params=None):
         """
-        fetch_and_process_data: Orchestrates fetching and processing in batches.
-        Takes a processor function that handles a single record.
+        request_params: Returns the query parameters of a run: explicit `params`
+        (e.g. a backfill window), or the date filter from the last update, plus
+        the dataset's pushed down filter, see RecordFilter.
         """
-        params = {}
-        offset = 0
-        total_processed = 0
-        
-        # Add date filtering if available
-        last_update = self.get_last_update()
+        last_update = None if params else self.get_last_update(dataset)
+        params = dict(params or {})
         if last_update:
             try:
                 last_update_formatted = datetime.strptime(last_update, '%Y-%m-%d')
@@ -85,112 +203,684 @@ class DataIngester:
             except ValueError as parse_error:
                 print(f"Error parsing last ingestion date: {parse_error}")
                 params["after"] = last_update
+        record_filter = self.filters.get(dataset)
+        if record_filter:
+            after = record_filter.start_date(params.get("after"))
+            if after:
+                params["after"] = after
+            params.update(record_filter.params())
+        return params
 
-        start_time = time.time()
-        
+    @staticmethod
+    def drop_seen(records, key, seen):
+        """
+        drop_seen: Returns the records whose `key` value isn't in `seen`, then
+        replaces `seen` with this page's values. Rows shifting across a page
+        boundary while paging show up on both pages; only the first copy is kept.
+        """
+        fresh = [record for record in records
+                 if not isinstance(record, dict) or record.get(key) not in seen]
+        seen.clear()
+        seen.update(record.get(key) for record in records if isinstance(record, dict))
+        return fresh
+
+    def fetch_keyset(self, url, processor_func, dataset, params):
+        """
+        fetch_keyset: Pages through a dataset by the largest id of the previous
+        page, so each page costs the same however deep the scan. Pages depend on
+        each other, so they're fetched one at a time & a page that still fails
+        after its retries raises. Returns (rows stored, seen ids, offset to
+        continue from), the offset being None unless the API ignored the keyset
+        parameter, which shows as a page with no id beyond the previous one.
+        """
+        key = DATASETS[dataset].id_field if dataset in DATASETS else "id"
+        total_processed = 0
+        last_key = None
+        seen = set()
+        position = 0
         while True:
-            # Fetch a single batch
-            data_batch = self.fetch_batch(url, offset, params)
-            
-            # Break if no more data
+            page_params = dict(params)
+            if last_key is not None:
+                page_params[self.keyset_param] = last_key
+            data_batch = self.fetch_batch(url, None, page_params)
             if not data_batch:
-                break
-            
-            # Process each record in this batch
-            batch_processed = 0
-            for record in data_batch:
-                if processor_func(record):
-                    batch_processed += 1
-            
+                return total_processed, seen, None
+            keys = [record.get(key) for record in data_batch if isinstance(record, dict)]
+            newest = max((value for value in keys if isinstance(value, int)), default=None)
+            if newest is None or (last_key is not None and newest <= last_key):
+                print(f"{url} ignores {self.keyset_param}, falling back to offset paging "
+                      f"at offset {position}")
+                return total_processed, seen, position
+            records = self.drop_seen(data_batch, key, seen)
+            self.current_offset = position
+            batch_processed = processor_func(records) if records else 0
             total_processed += batch_processed
-            
-            print(f"Batch: offset={offset}, fetched={len(data_batch)}, processed={batch_processed}, "
-                f"elapsed={time.time()-start_time:.2f}s")
-            
-            # Move to next batch
-            offset += 5000
-        
+            self.dead_letters.flush()
+            print(f"Batch: after {self.keyset_param}={last_key}, fetched={len(data_batch)}, "
+                  f"processed={batch_processed}")
+            position += len(data_batch)
+            last_key = newest
+            if self.stop_event.is_set():
+                print(f"Stop requested, stopping after batch ending at id {newest}")
+                return total_processed, seen, None
+
+    def fetch_and_process_data(self, url, processor_func, dataset=None, params=None):
+        """
+        fetch_and_process_data: Orchestrates fetching and processing in batches.
+        Takes a processor function that handles a whole batch of records and
+        returns how many of them were stored. Explicit `params` (e.g. a backfill
+        window) replace the last-update date filter. With keyset paging see
+        fetch_keyset(). Otherwise up to the rate controller's limit of pages are
+        fetched ahead by offset while a batch is processed; batches are still
+        processed in offset order & records repeated from the previous page are
+        dropped. A page that can't be fetched is recorded as a gap & skipped,
+        see fill_gaps(); after `max_consecutive_gaps` failed pages in a row the
+        run is aborted. Stops after the current batch once a stop has been
+        requested (e.g. SIGTERM in daemon mode).
+        """
+        total_processed = 0
+        consecutive_gaps = 0
+        params = self.request_params(dataset, params)
+        key = DATASETS[dataset].id_field if dataset in DATASETS else "id"
+
+        start_time = time.time()
+        next_offset = 0
+        seen = set()
+        if self.paging == "keyset":
+            total_processed, seen, next_offset = self.fetch_keyset(
+                url, processor_func, dataset, params
+            )
+            if next_offset is None:
+                print(f"Total processed: {total_processed}, "
+                      f"total time: {time.time()-start_time:.2f}s")
+                return total_processed
+        pending = deque()
+
+        with ThreadPoolExecutor(max_workers=self.rate.maximum, thread_name_prefix="fetch") as pool:
+            while True:
+                # Keep as many pages in flight as the controller currently allows
+                while len(pending) < self.rate.window():
+                    pending.append((next_offset, pool.submit(
+                        self.fetch_batch, url, next_offset, dict(params)
+                    )))
+                    next_offset += self.page_size
+                offset, future = pending.popleft()
+                try:
+                    data_batch = future.result()
+                    consecutive_gaps = 0
+                except PageFetchError as fetch_error:
+                    self.gaps.add(dataset, offset, params, fetch_error)
+                    consecutive_gaps += 1
+                    seen.clear()
+                    print(f"Recorded gap at offset {offset}: {fetch_error}")
+                    if consecutive_gaps >= self.max_consecutive_gaps:
+                        for _, other in pending:
+                            other.cancel()
+                        raise
+                    continue
+
+                # Break if no more data
+                if not data_batch:
+                    break
+
+                # Process the whole batch at once
+                self.current_offset = offset
+                records = self.drop_seen(data_batch, key, seen)
+                batch_processed = processor_func(records) if records else 0
+
+                total_processed += batch_processed
+                self.dead_letters.flush()
+
+                print(f"Batch: offset={offset}, fetched={len(data_batch)}, "
+                    f"processed={batch_processed}, duplicates={len(data_batch) - len(records)}, "
+                    f"limit={self.rate.window()}, elapsed={time.time()-start_time:.2f}s")
+
+                if self.stop_event.is_set():
+                    print(f"Stop requested, stopping after batch at offset {offset}")
+                    break
+            for _, future in pending:
+                future.cancel()
+
         print(f"Total processed: {total_processed}, total time: {time.time()-start_time:.2f}s")
         return total_processed
 
+    def reject_record(self, dataset, record, reason):
+        """
+        reject_record: Prints why a record was rejected & sends it to the
+        dead-letter store instead of dropping it.
+        """
+        print(f"Skipping invalid {dataset} record: {reason}")
+        self.dead_letters.add(dataset, record, reason, self.current_offset)
+
+    def process_batch(self, dataset, records):
+        """
+        process_batch: Converts a batch of API records to rows with the dataset's
+        extractor & writes them in one batched insert. Invalid records, or the
+        whole batch if the write fails, are sent to the dead-letter store; a
+        rejected record's reason names every failing field & the batch's failures
+        are summarized per field. Records outside the dataset's filter are
+        dropped first.
+        Returns the number of rows committed; a batch spooled while the
+        database is down counts nowhere until rows_written hears it was drained.
+        """
+        records = self.filters[dataset.name].apply(records)
+        extract = dataset.extract
+        rows = []
+        accepted = []
+        failed_fields = {}
+        for record in records:
+            try:
+                rows.append(extract(record))
+                accepted.append(record)
+            except (KeyError, TypeError, ValueError) as extract_error:
+                errors = dataset.field_errors(record) or {"record": str(extract_error)}
+                for field in errors:
+                    failed_fields[field] = failed_fields.get(field, 0) + 1
+                self.reject_record(dataset.name, record, "; ".join(
+                    f"Missing field {field!r}" if error == "missing"
+                    else f"Invalid value for {field!r}: {error}"
+                    for field, error in errors.items()
+                ))
+        if failed_fields:
+            counts = ", ".join(f"{field}={count}" for field, count in sorted(failed_fields.items()))
+            print(f"Rejected {len(records) - len(rows)} of {len(records)} {dataset.name} records "
+                  f"at offset {self.current_offset}: {counts}")
+
+        if self.writer:
+            # Written asynchronously, failures come back through writer_failed
+            self.writer.submit(dataset, rows, accepted)
+            return len(rows)
+
+        try:
+            return self.spool.insert_rows(dataset, rows)
+        except Exception as write_error:
+            self.writer_failed(dataset, accepted, write_error)
+            return 0
+
+    def rows_written(self, dataset, rows):
+        """
+        rows_written: Called by the spool with every committed batch; adds it
+        to the Parquet snapshots & marks the CMAs whose combined rows it changed.
+        """
+        self.snapshots.add(dataset, rows)
+        self.combined_changes.update(COMBINED_STATS.changed_cmas(dataset, rows))
+
+    def writer_failed(self, dataset, records, write_error):
+        """
+        writer_failed: Dead-letters the records of a batch that couldn't be stored.
+        """
+        for record in records:
+            self.reject_record(dataset.name, record, f"Error storing record: {write_error}")
+
+    def process_dataset(self, dataset, url=None, params=None):
+        """
+        process_dataset: Fetches & stores every record of a registered dataset,
+        then fills any page gaps it (or an earlier run) left. Incremental runs
+        (without explicit `params`) hold the dataset's run lock, see RunLock.
+        """
+        url = url or dataset.endpoint()
+        if params is not None:
+            return self.ingest_dataset(dataset, url, params)
+        return self.run_lock.run(dataset, lambda: self.ingest_dataset(dataset, url))
+
+    def ingest_dataset(self, dataset, url, params=None):
+        """
+        ingest_dataset: process_dataset without the run lock.
+        """
+        if params is None and self.order == "newest":
+            processed = self.process_newest_first(dataset, url)
+        else:
+            processed = self.fetch_and_process_data(
+                url, lambda records: self.process_batch(dataset, records),
+                dataset=dataset.name, params=params
+            )
+        return processed + self.fill_gaps(dataset, url)
+
+    def process_newest_first(self, dataset, url):
+        """
+        process_newest_first: Ingests everything since the last update (or since
+        INGEST_HISTORY_START) in date windows, most recent window first, so
+        current data lands before history after a wipe or a long outage.
+        Reports progress per window.
+        """
+        last_update = self.get_last_update(dataset.name)
+        start = self.filters[dataset.name].start_date(self.history_start)
+        if last_update:
+            start = (
+                datetime.strptime(last_update, '%Y-%m-%d') - timedelta(days=1)
+            ).strftime('%Y-%m-%d')
+        # The upper bound is exclusive, so end tomorrow to include today
+        end = (datetime.now(timezone.utc) + timedelta(days=1)).strftime('%Y-%m-%d')
+        windows = date_windows(start, end, self.window_days)
+        total_processed = 0
+        for done, (after, before) in enumerate(reversed(windows), start=1):
+            processed = self.fetch_and_process_data(
+                url, lambda records: self.process_batch(dataset, records),
+                dataset=dataset.name, params=window_params(after, before)
+            )
+            total_processed += processed
+            print(f"Period {after}..{before} of {dataset.name}: processed={processed} "
+                  f"({done}/{len(windows)} periods)")
+            if self.stop_event.is_set():
+                break
+        return total_processed
+
+    def fill_gaps(self, dataset, url=None):
+        """
+        fill_gaps: Fetches & processes only the pages recorded as gaps for a
+        dataset. Pages that still fail stay recorded. Returns the rows stored.
+        """
+        gaps = self.gaps.for_dataset(dataset.name)
+        if not gaps:
+            return 0
+        url = url or dataset.endpoint()
+        processed = 0
+        for gap in gaps:
+            try:
+                data_batch = self.fetch_batch(url, gap["offset"], dict(gap["params"]))
+            except PageFetchError as fetch_error:
+                print(f"Gap at offset {gap['offset']} of {dataset.name} still failing: "
+                      f"{fetch_error}")
+                continue
+            self.current_offset = gap["offset"]
+            if data_batch:
+                processed += self.process_batch(dataset, data_batch)
+            self.gaps.remove(gap)
+        self.dead_letters.flush()
+        filled = len(gaps) - len(self.gaps.for_dataset(dataset.name))
+        print(f"Filled gaps of {dataset.name}: {filled} of {len(gaps)} pages, "
+              f"processed={processed}")
+        return processed
+
+    def ingest_file(self, dataset, path, batch_size=5000):
+        """
+        ingest_file: Loads a local CSV/NDJSON/JSON dump of a dataset through the
+        same batched write path as API data, without touching the network.
+        Lines that can't be parsed are dead-lettered like invalid records.
+        """
+        start_time = time.time()
+        total_processed = 0
+
+        def reject_line(offset, line, reason):
+            self.current_offset = offset
+            self.reject_record(dataset.name, line, reason)
+
+        self.begin_writes()
+        source = FileSource(dataset, path, batch_size, on_invalid=reject_line)
+        for offset, records in source.batches():
+            self.current_offset = offset
+            total_processed += self.process_batch(dataset, records)
+            self.dead_letters.flush()
+            print(f"File batch: offset={offset}, read={len(records)}, "
+                  f"elapsed={time.time()-start_time:.2f}s")
+        summary = self.finish_writes()
+        if summary is not None:
+            total_processed = summary.get(dataset.name, {}).get("written", 0)
+        print(f"Loaded {path}: processed={total_processed}, "
+              f"total time: {time.time()-start_time:.2f}s")
+        return total_processed
+
     def process_housing_data(self):
         """
         process_housing_data: Process housing data from the API.
         """
-        def process_housing_record(record):
-            try:
-                housing_data = HousingData(
-                    jsonid=record["id"],
-                    census_metropolitan_area=record["CMA"],
-                    month=record["Month"],
-                    total_starts=record["Total_starts"],
-                    total_complete=record["Total_complete"],
-                    singles_starts=record["Singles_starts"],
-                    semis_starts=record["Semis_starts"],
-                    row_starts=record["Row_starts"],
-                    apartment_starts=record["Apt_Other_starts"],
-                    singles_complete=record["Singles_complete"],
-                    semis_complete=record["Semis_complete"],
-                    row_complete=record["Row_complete"],
-                    apartment_complete=record["Apt_other_complete"]
-                )
-                self.db.insert_housing_data(housing_data)
-                return True
-            except KeyError as key_error:
-                print(f"Skipping invalid housing data: Missing field {key_error}")
-                return False
-            except Exception as process_error:
-                print(f"Error processing housing data: {process_error}")
-                return False
-        
-        return self.fetch_and_process_data(self.api_housing, process_housing_record)
+        return self.process_dataset(HOUSING, self.api_housing)
 
     def process_labour_market_data(self):
         """
         process_labour_market_data: Process labour market data from API.
         """
-        def process_labour_record(record):
-            try:
-                labour_market_data = LabourMarketData(
-                    jsonid=record["id"],
-                    province=record["PROV"],
-                    education_level=record["EDUC"],
-                    labour_force_status=record["LFSSTAT"]
+        return self.process_dataset(LABOUR_MARKET, self.api_labour_market)
+
+    def replay_dead_letters(self, dataset=None):
+        """
+        replay_dead_letters: Re-runs only the dead-lettered records of one dataset
+        (or all of them) through the normal batch path. Records that fail again
+        are kept in the store with their new reason. The writes are finished
+        even if a replay fails.
+        """
+        names = [dataset] if dataset else list(DATASETS)
+        replayed = {}
+        try:
+            for name in names:
+                entries = self.dead_letters.read(name)
+                recovered = 0
+                # Replay records grouped by their original offset to keep it on re-rejects
+                for offset, group in groupby(entries, key=lambda entry: entry.get("offset")):
+                    self.current_offset = offset
+                    records = [entry["record"] for entry in group]
+                    recovered += self.process_batch(DATASETS[name], records)
+                # Only the records that failed again are left in the store
+                self.dead_letters.replace_replayed(name, entries)
+                replayed[name] = recovered
+                print(f"Replayed {name}: recovered={recovered}, "
+                      f"still failing={len(entries) - recovered}")
+        finally:
+            self.finish_writes()
+        return replayed
+
+    def begin_writes(self):
+        """
+        begin_writes: Opens the on-disk spool (INGEST_SPOOL_DIR) for an ingest
+        run & starts the sharded writer if more than one writer is configured.
+        Other commands write straight to the database.
+        """
+        if not self.spool.enabled:
+            self.spool = WriteSpool(self.db, on_written=self.rows_written)
+        if self.writers > 1:
+            self.writer = ShardedWriter(
+                self.spool, self.writers, on_error=self.writer_failed
+            ).start()
+
+    def finish_writes(self):
+        """
+        finish_writes: Waits for the sharded writer to commit everything, writes
+        the run's Parquet snapshots, refreshes the changed combined rows &
+        returns the writer's summary, or None when writes were synchronous.
+        """
+        summary = None
+        if self.writer:
+            summary = self.writer.close()
+            self.writer = None
+            self.dead_letters.flush()
+        self.spool.close()
+        self.snapshots.flush()
+        self.refresh_combined()
+        return summary
+
+    def refresh_combined(self, full=False):
+        """
+        refresh_combined: Rebuilds the combined_stats rows of the CMAs changed
+        since the last refresh, or of every stored CMA with `full`. A failure is
+        reported & the CMAs stay marked, so the next refresh retries them.
+        """
+        if full:
+            self.combined_changes.update(
+                name for name, in self.db.query(
+                    f"SELECT DISTINCT census_metropolitan_area FROM {HOUSING.table}"
                 )
-                self.db.insert_labour_market_data(labour_market_data)
-                return True
-            except KeyError as key_error:
-                print(f"Skipping invalid labour market data: Missing field {key_error}")
-                return False
-            except Exception as exception_error:
-                print(f"Error processing labour market data: {exception_error}")
-                return False
-        
-        return self.fetch_and_process_data(self.api_labour_market, process_labour_record)
+            )
+        if not self.combined_changes:
+            return 0
+        cmas = sorted(self.combined_changes)
+        try:
+            self.db.refresh_combined(cmas)
+        except Exception as refresh_error:
+            print(f"Error refreshing combined stats: {refresh_error}")
+            return 0
+        self.combined_changes.difference_update(cmas)
+        print(f"Refreshed combined stats of {len(cmas)} CMAs")
+        return len(cmas)
+
+    def publish_api_snapshots(self):
+        """
+        publish_api_snapshots: Re-renders the static API payloads after a
+        successful run. A failure is reported but doesn't fail the run, the
+        previous files keep being served.
+        """
+        try:
+            self.api_snapshots.publish()
+        except Exception as publish_error:
+            print(f"Error publishing API snapshots: {publish_error}")
+
+    def run_scheduled(self, dataset):
+        """
+        run_scheduled: One scheduled daemon run of a single dataset. Its own
+        last-update date is only saved if the run completed; the writes queued
+        before a failure are finished either way.
+        """
+        self.begin_writes()
+        try:
+            processed = self.process_dataset(dataset)
+        finally:
+            summary = self.finish_writes()
+        if summary is not None:
+            processed = summary.get(dataset.name, {}).get("written", 0)
+        if processed > 0 and not self.stop_event.is_set():
+            self.save_last_update(dataset.name)
+            self.publish_api_snapshots()
+        print(f"Scheduled run of {dataset.name} done: processed={processed}")
+        return processed
+
+    def request_stop(self, signum=None, _frame=None):
+        """
+        request_stop: Signal handler asking the daemon to finish the current
+        batch & exit.
+        """
+        print(f"Received signal {signum}, finishing the current batch before exiting")
+        self.stop_event.set()
+
+    def run_daemon(self, intervals=None):
+        """
+        run_daemon: Keeps the ingester running, polling each dataset on its own
+        interval (seconds, from `intervals` or INGEST_INTERVAL_<DATASET>, default
+        daily like the old cron job). The HTTP session, the DB pool & their caches stay warm between
+        runs. SIGTERM & SIGINT stop it after the current batch.
+        """
+        intervals = intervals or {}
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+        scheduler = Scheduler()
+        for name, dataset in DATASETS.items():
+            interval = intervals.get(name) or int(
+                os.getenv(f"INGEST_INTERVAL_{name.upper()}", "86400")
+            )
+            scheduler.every(name, interval, lambda dataset=dataset: self.run_scheduled(dataset))
+            print(f"Scheduled {name} every {interval}s")
+        scheduler.run_forever(self.stop_event)
+        self.dead_letters.flush()
+        self.db.close()
+        print("Daemon stopped")
 
     def process_and_store(self):
         """
         process_and_store: Process and store both housing and labour market data.
+        A dataset that fails doesn't stop the other one; its error is raised
+        once the queued writes are finished, without saving the last update date.
         """
-        housing_records = self.process_housing_data()
-        labour_records = self.process_labour_market_data()
+        self.begin_writes()
+        housing_records = labour_records = 0
+        errors = []
+        try:
+            try:
+                housing_records = self.process_housing_data()
+            except Exception as housing_error:
+                print(f"Error ingesting {HOUSING.name}: {housing_error}")
+                errors.append(housing_error)
+            try:
+                labour_records = self.process_labour_market_data()
+            except Exception as labour_error:
+                print(f"Error ingesting {LABOUR_MARKET.name}: {labour_error}")
+                errors.append(labour_error)
+        finally:
+            summary = self.finish_writes()
+        if summary is not None:
+            # Report what was committed rather than what was queued
+            housing_records = summary.get(HOUSING.name, {}).get("written", 0)
+            labour_records = summary.get(LABOUR_MARKET.name, {}).get("written", 0)
 
-        if housing_records > 0 or labour_records > 0:
+        if self.stop_event.is_set():
+            print("Run interrupted, last update date not saved")
+        elif errors:
+            print("Run failed, last update date not saved")
+        elif housing_records > 0 or labour_records > 0:
             self.save_last_update()
+            self.publish_api_snapshots()
 
         print(f"Total records processed: Housing={housing_records}, Labour Market={labour_records}")
+        if errors:
+            raise errors[0]
 
 
-if __name__ == "__main__":
-    max_retries = 5
-    for attempt in range(max_retries):
+def run_backfill_window(name, after, before, dead_letter_dir):
+    """
+    run_backfill_window: Backfill worker process entry point. Ingests one
+    window of a dataset with a fresh ingester & returns (processed,
+    dead-lettered entries). Schema migrations were already applied by the parent.
+    """
+    ingester = DataIngester(True, writers=1, migrate_on_connect=False)
+    ingester.dead_letters = DeadLetterStore(dead_letter_dir)
+    ingester.gaps = GapStore(os.path.join(dead_letter_dir, "gaps.json"))
+    # No begin_writes(): a failed window is retried as a whole, so workers don't spool
+    try:
+        processed = ingester.process_dataset(DATASETS[name], params=window_params(after, before))
+        ingester.finish_writes()
+        if ingester.gaps.for_dataset(name):
+            # Leave the window out of the checkpoint so the next backfill redoes it
+            raise RuntimeError(f"{len(ingester.gaps.for_dataset(name))} pages could not be fetched")
+        return processed, ingester.dead_letters.read(name)
+    finally:
+        ingester.db.close()
+
+
+def main(argv=None):
+    """
+    main: Command line entry point. Runs a full ingestion by default (or keeps
+    ingesting on a schedule with `daemon` / --daemon), rebuilds a date range
+    in parallel with `backfill`, repairs drift from upstream with `verify`,
+    seeds a dataset from a local dump with `load-file`, replays dead-lettered records with `replay`,
+    writes quarantined spool batches again with `replay-quarantine`, folds
+    Parquet snapshot parts with `compact-snapshots`, rebuilds the whole
+    combined_stats table with `refresh-combined`, or applies schema migrations
+    with `migrate`.
+    """
+    parser = argparse.ArgumentParser(description="Metropolitan data ingester")
+    parser.add_argument("command", nargs="?", default="ingest",
+                        choices=["ingest", "daemon", "backfill", "verify", "load-file", "replay",
+                                 "replay-quarantine", "migrate", "compact-snapshots",
+                                 "refresh-combined"])
+    parser.add_argument("--dataset", choices=list(DATASETS),
+                        help="Only replay, backfill, verify or compact this dataset; "
+                             "with load-file: the dataset of the file")
+    parser.add_argument("--file", help="With load-file: CSV, NDJSON or JSON dump to load")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="With migrate: print pending migrations without applying them; "
+                             "with verify: report differing ranges without repairing them; "
+                             "with replay-quarantine: list the quarantined batches")
+    parser.add_argument("--bucket-size", type=int, default=1000,
+                        help="With verify: jsonid values per checksum bucket (default 1000)")
+    parser.add_argument("--writers", type=int,
+                        help="Number of parallel sharded DB writers (default INGEST_WRITERS or 1)")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Keep running & ingest each dataset on its own schedule")
+    parser.add_argument("--from", dest="start",
+                        help="With backfill: first day of the range (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="end",
+                        help="With backfill: day after the range (YYYY-MM-DD, default today)")
+    parser.add_argument("--workers", type=int,
+                        help="With backfill: number of worker processes (default CPU count)")
+    parser.add_argument("--window-days", type=int, default=30,
+                        help="With backfill: days per window (default 30)")
+    parser.add_argument("--distributed", action="store_true",
+                        help="With backfill: share the windows with other replicas through "
+                             "the database's work queue")
+    parser.add_argument("--order", choices=["newest", "oldest"],
+                        help="Ingest & backfill date windows newest first (the backfill default) "
+                             "or oldest first")
+    parser.add_argument("--lock", choices=LOCK_MODES,
+                        help="When another instance is ingesting a dataset: skip it, wait for "
+                             "it or hand the run off to that instance (default INGEST_LOCK_MODE "
+                             "or skip)")
+    parser.add_argument("--paging", choices=["offset", "keyset"],
+                        help="Page through the API by offset or by last id seen "
+                             "(default API_PAGING or offset)")
+    args = parser.parse_args(argv)
+    if args.daemon:
+        args.command = "daemon"
+
+    if args.command == "migrate":
+        db = storage_class()(False, migrate_on_connect=False)
+        db.connect()
+        db.migrate(dry_run=args.dry_run)
+        db.close()
+        return
+
+    if args.command == "backfill":
+        if not args.start:
+            parser.error("backfill requires --from")
+        # Migrate once here so the workers don't all contend for the migration lock
+        db = storage_class()(True)
+        end = args.end or datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        names = [args.dataset] if args.dataset else None
+        backfill = Backfill(DeadLetterStore(), args.workers, args.window_days,
+                            newest_first=args.order != "oldest", run_window=run_backfill_window)
+        if args.distributed:
+            if not db.shared:
+                parser.error("--distributed needs the mariadb backend")
+            backfill.run_distributed(args.start, end, WorkQueue(db), names)
+        else:
+            backfill.run(args.start, end, names)
+        db.close()
+        return
+
+    if args.command == "compact-snapshots":
+        snapshots = SnapshotWriter()
+        for name in [args.dataset] if args.dataset else list(DATASETS):
+            snapshots.compact(DATASETS[name])
+        return
+
+    if args.command == "verify":
+        ingester = DataIngester(True)
         try:
-            ingester = DataIngester(True)
-            ingester.process_and_store()
-            break
-        except Exception as e:
-            print(f"Attempt {attempt + 1} failed: {e}")
-            if attempt < max_retries - 1:
-                time.sleep(5)
-                continue
-            raise
+            reconciler = Reconciler(ingester, args.bucket_size, args.dry_run)
+            try:
+                summaries = [reconciler.verify(DATASETS[name])
+                             for name in ([args.dataset] if args.dataset else list(DATASETS))]
+            finally:
+                # Snapshots the repairs
+                ingester.finish_writes()
+            # Deleted keys don't say which CMA they belonged to, so rebuild every CMA
+            if any(summary["upserted"] or summary["deleted"] for summary in summaries):
+                ingester.refresh_combined(full=True)
+        finally:
+            ingester.db.close()
+        return
+
+    if args.command == "refresh-combined":
+        ingester = DataIngester(True)
+        ingester.refresh_combined(full=True)
+        ingester.db.close()
+        return
+
+    if args.command == "load-file":
+        if not args.dataset or not args.file:
+            parser.error("load-file requires --dataset and --file")
+        ingester = DataIngester(True, writers=args.writers)
+        ingester.ingest_file(DATASETS[args.dataset], args.file)
+        ingester.db.close()
+        return
+
+    if args.command == "replay":
+        ingester = DataIngester(True)
+        try:
+            ingester.replay_dead_letters(args.dataset)
+        finally:
+            ingester.db.close()
+        return
+
+    if args.command == "replay-quarantine":
+        ingester = DataIngester(True, writers=1)
+        try:
+            ingester.begin_writes()
+            ingester.spool.replay_quarantine(dry_run=args.dry_run)
+        finally:
+            ingester.finish_writes()
+            ingester.db.close()
+        return
+
+    # Failed pages are retried individually & recorded as gaps, so the run isn't restarted
+    ingester = DataIngester(True, writers=args.writers)
+    if args.order == "newest":
+        ingester.order = "newest"
+    if args.paging:
+        ingester.paging = args.paging
+    if args.lock:
+        ingester.run_lock.mode = args.lock
+    if args.command == "daemon":
+        ingester.run_daemon()
+    else:
+        ingester.process_and_store()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,255 +3,515 @@ DatabaseHandler.py: OO object to handle putting data into the database.
 """
 import os
 import sys
+import threading
 import time
+from datetime import datetime, timezone
 import mariadb
-class DatabaseHandler:
+from src.ConnectionPool import ConnectionPool
+from src.DatasetRegistry import (
+    COMBINED_STATS, DATA_VERSIONS, DATASETS, HOUSING, LABOUR_MARKET, to_int
+)
+from src.SchemaMigrations import SchemaMigrator
+from src.StorageBackend import StorageBackend, StorageUnavailable
+
+# Lock wait timeout & deadlock, the same batch succeeds when retried
+TRANSIENT_ERRNOS = {1205, 1213}
+
+class DatabaseHandler(StorageBackend):
     """
-    DatabaseHandler class: Handles connection & data transfer to the database.
+    DatabaseHandler class: Handles connection & data transfer to the MariaDB database.
+    Batches are written through a pool of connections (DB_POOL_SIZE, default 4)
+    so the handler can be shared by several writer threads; `conn` is kept for
+    schema work at startup.
     """
-    def __init__(self, connect, max_retries=5, retry_delay=5):
+    shared = True
+    def __init__(self, connect, max_retries=5, retry_delay=5, migrate_on_connect=True):
         """
-        __init__: Initializes the object & tries to connect.
+        __init__: Initializes the object & tries to connect. Pending schema
+        migrations are applied on connect unless `migrate_on_connect` is False.
         """
         self.conn = None
+        self.pool = None
+        # Named locks belong to a session, so each is held on its own connection
+        self.locks = {}
+        # Dictionary names known to be committed, shared by every writer thread
+        self.dictionary_names = {}
+        self.dictionary_lock = threading.Lock()
+        self.partitions = {}
+        self.partition_lock = threading.Lock()
         self.max_retries = max_retries
         self.retry_delay = retry_delay
+        self.migrate_on_connect = migrate_on_connect
         if connect:
             self.connect()
 
+    def open_connection(self):
+        """
+        open_connection: Opens a new connection with the DB_* environment settings.
+        """
+        return mariadb.connect(
+            user=os.getenv("DB_USER", "root"),
+            password=os.getenv("DB_PASSWORD", "pwd"),
+            host=os.getenv("DB_HOST", "database"),
+            port=3306,
+            database=os.getenv("DB_DATABASE", "template_db"),
+        )
+
+    def reconnect(self):
+        """
+        reconnect: Opens a pooled connection, retrying `max_retries` times so a
+        database restart is waited out instead of failing the run.
+        """
+        for attempt in range(self.max_retries):
+            try:
+                return self.open_connection()
+            except mariadb.Error as e:
+                print(f"Reconnect attempt {attempt + 1} failed: {e}")
+                if attempt == self.max_retries - 1:
+                    raise
+                time.sleep(self.retry_delay)
+        return None
+
     def connect(self):
         """
         connect: Attempts to establish a connection to the database `max_retries` times.
         """
         for attempt in range(self.max_retries):
             try:
-                self.conn = mariadb.connect(
-                    user=os.getenv("DB_USER", "root"),
-                    password=os.getenv("DB_PASSWORD", "pwd"),
-                    host=os.getenv("DB_HOST", "database"),
-                    port=3306,
-                    database=os.getenv("DB_DATABASE", "template_db"),
-                )
+                self.conn = self.open_connection()
+                self.pool = ConnectionPool(self.reconnect, size=int(os.getenv("DB_POOL_SIZE", "4")))
                 print("Successfully connected to MariaDB database")
-                self.create_table()
-                return
+                break
             except mariadb.Error as e:
                 print(f"Connection attempt {attempt + 1} failed: {e}")
                 if attempt < self.max_retries - 1:
                     time.sleep(self.retry_delay)
-        sys.exit("FATAL: Failed to connect to database after multiple attempts")
+        else:
+            sys.exit("FATAL: Failed to connect to database after multiple attempts")
+        # Outside the retry loop, a failed migration stops the ingester
+        if self.migrate_on_connect:
+            self.migrate()
+            self.maintain_partitions()
 
+    def acquire(self):
+        """
+        acquire: Returns a connection for one unit of work, from the pool if
+        there is one, otherwise the handler's own connection.
+        """
+        return self.pool.acquire() if self.pool else self.conn
 
-    def create_table(self):
+    def release(self, conn, broken=False):
         """
-        create_table: Creates the database tables if they don't exist.
+        release: Gives a connection from acquire() back.
         """
-        self.create_housing_data_table()
-        self.create_labour_market_data_table()
+        if self.pool:
+            self.pool.release(conn, broken=broken)
 
-    def create_housing_data_table(self):
+    @staticmethod
+    def is_alive(conn):
         """
-        create_housing_data_table: Creates the housing_data table if it doesn't exist.
+        is_alive: Returns whether the server still answers on a connection.
         """
-        cursor = self.conn.cursor()
         try:
-            cursor.execute(
-                """
-                CREATE TABLE IF NOT EXISTS housing_data (
-                    id INT AUTO_INCREMENT PRIMARY KEY COMMENT 'Primary Key',
-                    jsonid INT DEFAULT 0 COMMENT 'JSON ID',
-                    census_metropolitan_area VARCHAR(255) COMMENT 'Census Metropolitan Area',
-                    month INT DEFAULT NULL COMMENT 'Month',
-                    total_starts INT DEFAULT 0 COMMENT 'Total Starts',
-                    total_complete INT DEFAULT 0 COMMENT 'Total Complete',
-                    singles_starts INT DEFAULT 0 COMMENT 'Singles Starts',
-                    semis_starts INT DEFAULT 0 COMMENT 'Semis Starts',
-                    row_starts INT DEFAULT 0 COMMENT 'Row Starts',
-                    apartment_starts INT DEFAULT 0 COMMENT 'Apartment Starts',
-                    singles_complete INT DEFAULT 0 COMMENT 'Singles Complete',
-                    semis_complete INT DEFAULT 0 COMMENT 'Semis Complete',
-                    row_complete INT DEFAULT 0 COMMENT 'Row Complete',
-                    apartment_complete INT DEFAULT 0 COMMENT 'Apartment Complete'
-                )
-                """
-            )
-            self.conn.commit()
-        except mariadb.Error as e:
-            print(f"Error creating housing_data table: {e}")
+            conn.ping()
+            return True
+        except Exception:
+            return False
+
+    def query(self, sql, params=()):
+        """
+        query: Runs a read-only statement on a pooled connection & returns every row.
+        """
+        conn = self.acquire()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
         finally:
             cursor.close()
+            self.release(conn)
+
+    def execute(self, sql, params=()):
+        """
+        execute: Runs & commits one write statement on a pooled connection.
+        """
+        conn = self.acquire()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            conn.commit()
+            return cursor.rowcount
+        except mariadb.Error:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            self.release(conn)
+
+    def lock(self, name, timeout=0):
+        """
+        lock: Takes a GET_LOCK advisory lock on a connection of its own, so it
+        is held until unlock() or until this process's session ends.
+        """
+        conn = self.open_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT GET_LOCK(?, ?)", (name, timeout))
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+        if row and row[0] == 1:
+            self.locks[name] = conn
+            return True
+        conn.close()
+        return False
+
+    def unlock(self, name):
+        """
+        unlock: Releases a lock taken with lock() & closes its connection.
+        """
+        conn = self.locks.pop(name, None)
+        if conn is None:
+            return
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT RELEASE_LOCK(?)", (name,))
+            cursor.fetchone()
+            cursor.close()
+        finally:
+            conn.close()
+
+    def checksums(self, dataset, bucket_size, where=("", ())):
+        """
+        checksums: Returns {bucket: (count, checksum)} from one set-based aggregate.
+        """
+        condition, params = where
+        rows = self.query(self.checksum_sql(dataset, condition), (bucket_size, *params))
+        return {int(bucket): (int(count), int(checksum)) for bucket, count, checksum in rows}
+
+    def bucket_keys(self, dataset, bucket_size, bucket):
+        """
+        bucket_keys: Returns the natural keys stored in one checksum bucket.
+        """
+        sql = self.bucket_keys_sql(dataset)
+        return [tuple(key) for key in self.query(sql, (bucket_size, bucket))]
+
+    def delete_keys(self, dataset, keys):
+        """
+        delete_keys: Deletes rows by natural key in one batch & returns how many keys were given.
+        """
+        if not keys:
+            return 0
+        conn = self.acquire()
+        cursor = conn.cursor()
+        try:
+            cursor.executemany(dataset.delete_sql(), list(keys))
+            conn.commit()
+            return len(keys)
+        except mariadb.Error:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            self.release(conn)
+
+    def refresh_combined(self, cmas):
+        """
+        refresh_combined: Replaces the combined rows of some CMAs & bumps their
+        versions in one transaction, so readers never see a CMA half rebuilt.
+        """
+        if not cmas:
+            return 0
+        cmas = list(cmas)
+        conn = self.acquire()
+        cursor = conn.cursor()
+        try:
+            cursor.executemany(COMBINED_STATS.delete_sql(), [(cma,) for cma in cmas])
+            refreshed = {}
+            for params in COMBINED_STATS.refresh_params(cmas):
+                cursor.execute(COMBINED_STATS.refresh_sql(), params)
+                refreshed[params[1]] = cursor.rowcount
+            cursor.executemany(DATA_VERSIONS.bump_sql(), COMBINED_STATS.bump_params(refreshed))
+            conn.commit()
+            return len(cmas)
+        except mariadb.Error:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            self.release(conn)
+
+    def migrate(self, dry_run=False):
+        """
+        migrate: Applies any pending schema migrations, see SchemaMigrations.
+        With `dry_run` the pending migrations are only printed.
+        """
+        return SchemaMigrator(self.conn, dry_run=dry_run).migrate()
+
+    def create_table(self):
+        """
+        create_table: Creates the tables of every registered dataset if they don't exist.
+        Normal runs rely on migrate() instead; this is kept for tests & tooling.
+        """
+        for dataset in DATASETS.values():
+            self.create_dataset_table(dataset)
 
-    def create_labour_market_data_table(self):
+    def create_dataset_table(self, dataset):
         """
-        create_labour_market_data_table: Creates the labour_market_data table if it doesn't exist.
+        create_dataset_table: Creates a dataset's table from its registry declaration.
         """
         cursor = self.conn.cursor()
         try:
-            cursor.execute(
-                """
-                CREATE TABLE IF NOT EXISTS labour_market_data (
-                    id INT AUTO_INCREMENT PRIMARY KEY COMMENT 'Primary Key',
-                    jsonid INT DEFAULT 0 COMMENT 'JSON ID',
-                    province INT DEFAULT 0 COMMENT 'Province',
-                    education_level INT DEFAULT 0 COMMENT 'Education Level',
-                    labour_force_status INT DEFAULT 0 COMMENT 'Labour Force Status'
-                )
-                """
-            )
+            for _, dictionary in dataset.dictionary_fields:
+                cursor.execute(dictionary.create_table_sql())
+            cursor.execute(dataset.create_table_sql())
             self.conn.commit()
         except mariadb.Error as e:
-            print(f"Error creating labour_market_data table: {e}")
+            print(f"Error creating {dataset.table} table: {e}")
         finally:
             cursor.close()
-    
+
     # Helper function to safely convert values with potential commas
     def safe_convert(self, value):
-        if value == "" or value is None:
+        """
+        safe_convert: Converts a value to an integer, see DatasetRegistry.to_int.
+        """
+        return to_int(value)
+
+    def insert_rows(self, dataset, rows):
+        """
+        insert_rows: Writes a batch of extracted rows with a single executemany
+        & one commit. Rows whose natural key is already stored are updated.
+        If the connection is lost mid-batch, the uncommitted batch is replayed
+        on a fresh connection (the upsert makes this safe). If the database
+        can't be reached at all, or the connection is lost on the last attempt,
+        StorageUnavailable is raised. On any other
+        database error the batch is rolled back & the error re-raised so the
+        caller can dead-letter it.
+        """
+        if not rows:
             return 0
-        # Remove commas and convert to integer
-        return int(str(value).replace(',', ''))
+        if dataset.partitioning:
+            # Partition DDL commits implicitly, so it has to happen before the batch
+            try:
+                self.ensure_partitions(dataset, dataset.partition_years(rows))
+            except mariadb.Error as e:
+                # Failed splits are handled inside, so this is reading the partition list
+                raise StorageUnavailable(f"can't read partitions of {dataset.table}: {e}") from e
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                conn = self.acquire()
+            except mariadb.Error as e:
+                raise StorageUnavailable(f"can't connect to write {dataset.name} batch: {e}") from e
+            try:
+                self.write_batch(conn, dataset, rows)
+                self.release(conn)
+                return len(rows)
+            except mariadb.Error as e:
+                if not self.is_alive(conn):
+                    self.release(conn, broken=True)
+                    if self.pool and attempt < self.max_retries:
+                        print(f"Lost database connection writing {dataset.name} batch ({e}), "
+                              f"replaying it (attempt {attempt + 1})")
+                        continue
+                    raise StorageUnavailable(
+                        f"lost database connection writing {dataset.name} batch: {e}"
+                    ) from e
+                print(f"Error inserting {dataset.name} batch: {e}")
+                try:
+                    conn.rollback()
+                except mariadb.Error as rollback_error:
+                    # The transaction's state is unknown, so drop the connection
+                    self.release(conn, broken=True)
+                    raise StorageUnavailable(
+                        f"can't roll back {dataset.name} batch: {rollback_error}"
+                    ) from e
+                self.release(conn)
+                raise
+        return 0
 
-    def insert_housing_data(self, housing_data):
+    def is_transient(self, error):
         """
-        insert_housing_data: Insert a new housing data if it doesn't exist.
+        is_transient: Returns whether a write error is a lock wait timeout or a deadlock.
         """
-        cursor = self.conn.cursor()
+        return (isinstance(error, mariadb.Error)
+                and getattr(error, "errno", None) in TRANSIENT_ERRNOS)
+
+    def write_batch(self, conn, dataset, rows):
+        """
+        write_batch: Writes & commits one batch on the given connection with
+        write_rows(), which bumps the data versions in the same transaction, so
+        readers never see new data under an old version.
+        """
+        cursor = conn.cursor()
         try:
+            registered = self.write_rows(cursor, dataset, rows)
+            conn.commit()
+            self.remember_dictionary_names(registered)
+        finally:
+            cursor.close()
+
+    def group_by_partition(self, dataset, rows):
+        """
+        group_by_partition: Splits a batch by target partition so each group can be
+        written straight to its partition. Unpartitioned datasets give one group
+        keyed by None. Partitions that don't exist yet (e.g. the table is not
+        partitioned) are also written without partition selection.
+        """
+        if not dataset.partitioning:
+            return {None: rows}
+        known = {name for _, name in self.partitions.get(dataset.table, [])}
+        groups = {}
+        for row in rows:
+            partition = dataset.partition_of(row)
+            groups.setdefault(partition if partition in known else None, []).append(row)
+        return groups
 
-            # Convert empty strings to integers for numeric fields
-            month = self.safe_convert(housing_data.month)
-            total_starts = self.safe_convert(housing_data.total_starts)
-            total_complete = self.safe_convert(housing_data.total_complete)
-            singles_starts = self.safe_convert(housing_data.singles_starts)
-            semis_starts = self.safe_convert(housing_data.semis_starts)
-            row_starts = self.safe_convert(housing_data.row_starts)
-            apartment_starts = self.safe_convert(housing_data.apartment_starts)
-            singles_complete = self.safe_convert(housing_data.singles_complete)
-            semis_complete = self.safe_convert(housing_data.semis_complete)
-            row_complete = self.safe_convert(housing_data.row_complete)
-            apartment_complete = self.safe_convert(housing_data.apartment_complete)
-
-            # First execute the query to check if housing data exists with all fields
+    def load_partitions(self, dataset):
+        """
+        load_partitions: Reads the table's partitions as a list of
+        (upper bound, name) sorted by bound, None standing for MAXVALUE.
+        """
+        conn = self.acquire()
+        cursor = conn.cursor()
+        try:
             cursor.execute(
-                """SELECT id FROM housing_data 
-                WHERE jsonid = ?
-                AND census_metropolitan_area = ? 
-                AND month = ? 
-                AND total_starts = ? 
-                AND total_complete = ? 
-                AND singles_starts = ? 
-                AND semis_starts = ? 
-                AND row_starts = ? 
-                AND apartment_starts = ? 
-                AND singles_complete = ? 
-                AND semis_complete = ? 
-                AND row_complete = ? 
-                AND apartment_complete = ?""",
-                (
-                    housing_data.jsonid,
-                    housing_data.census_metropolitan_area,
-                    month,
-                    total_starts,
-                    total_complete,
-                    singles_starts,
-                    semis_starts,
-                    row_starts,
-                    apartment_starts,
-                    singles_complete,
-                    semis_complete,
-                    row_complete,
-                    apartment_complete
-                )
+                """SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = ?
+                AND PARTITION_NAME IS NOT NULL""",
+                (dataset.table,)
             )
-
-            # Now we can safely call fetchone() after executing a query
-            result = cursor.fetchone()
-
-            if result is None:
-                # Insert new record if no exact match exists
-                cursor.execute(
-                    """INSERT INTO housing_data 
-                    (jsonid, census_metropolitan_area, month, total_starts, total_complete, 
-                    singles_starts, semis_starts, row_starts, apartment_starts,
-                    singles_complete, semis_complete, row_complete, apartment_complete)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                    (
-                        housing_data.jsonid,
-                        housing_data.census_metropolitan_area,
-                        month,
-                        total_starts,
-                        total_complete,
-                        singles_starts,
-                        semis_starts,
-                        row_starts,
-                        apartment_starts,
-                        singles_complete,
-                        semis_complete,
-                        row_complete,
-                        apartment_complete
-                    )
-                )
-                # Print detailed information including original values for debugging
-                print(f"Inserted jsonid: {housing_data.jsonid}, housing data: ")
-                self.conn.commit()
-        except mariadb.Error as e:
-            print(f"Error inserting housing data: {e}")
+            partitions = []
+            for name, description in cursor.fetchall():
+                bound = None if description == "MAXVALUE" else int(description)
+                partitions.append((bound, name))
+            partitions.sort(key=lambda partition: (partition[0] is None, partition[0] or 0))
+            self.partitions[dataset.table] = partitions
+            return partitions
         finally:
             cursor.close()
+            self.release(conn)
 
-    def insert_labour_market_data(self, labour_market_data):
+    def ensure_partitions(self, dataset, years):
         """
-        insert_labour_market_data: Insert new labour market data if it doesn't exist.
+        ensure_partitions: Makes sure every year has its own partition by
+        splitting the partition currently holding it. Known partitions are
+        cached, so this only touches the server for new years.
         """
-        cursor = self.conn.cursor()
-        try:
-            # Convert empty strings to integers for numeric fields
-            jsonid = self.safe_convert(labour_market_data.jsonid)
-            province = self.safe_convert(labour_market_data.province)
-            education_level = self.safe_convert(labour_market_data.education_level)
-            labour_force_status = self.safe_convert(labour_market_data.labour_force_status)
-    
-            # First check if this exact record already exists
-            cursor.execute(
-                """SELECT id FROM labour_market_data 
-                WHERE jsonid = ?
-                AND province = ? 
-                AND education_level = ? 
-                AND labour_force_status = ?""",
-                (
-                    jsonid,
-                    province,
-                    education_level,
-                    labour_force_status
-                )
+        with self.partition_lock:
+            self._ensure_partitions(dataset, years)
+
+    def _ensure_partitions(self, dataset, years):
+        """
+        _ensure_partitions: ensure_partitions without the lock.
+        """
+        if dataset.table not in self.partitions:
+            self.load_partitions(dataset)
+        partitioning = dataset.partitioning
+        for year in sorted(years):
+            name = partitioning.partition_name(year)
+            partitions = self.partitions[dataset.table]
+            if not partitions or any(existing == name for _, existing in partitions):
+                continue
+            bound, containing = next(
+                partition for partition in partitions
+                if partition[0] is None or partition[0] > year
             )
-    
-            result = cursor.fetchone()
-    
-            if result is None:
-                # Insert new record if no exact match exists
-                cursor.execute(
-                    """INSERT INTO labour_market_data 
-                    (jsonid, province, education_level, labour_force_status)
-                    VALUES (?, ?, ?, ?)""",
-                    (
-                        jsonid,
-                        province,
-                        education_level,
-                        labour_force_status
-                    )
-                )
-                # print(f"Inserted labour market data for jsonid: {jsonid}")
-                self.conn.commit()
+            conn = self.acquire()
+            cursor = conn.cursor()
+            try:
+                cursor.execute(partitioning.split_sql(dataset.table, year, containing, bound))
+                print(f"Added partition {name} to {dataset.table}")
+            except mariadb.Error as e:
+                print(f"Error adding partition {name} to {dataset.table}: {e}")
+                return
+            finally:
+                cursor.close()
+                self.release(conn)
+            self.load_partitions(dataset)
+
+    def partition_table(self, dataset):
+        """
+        partition_table: Partitions a dataset's table if it isn't yet, e.g.
+        once HOUSING_YEAR_FIELD is set. This rebuilds the table, so it only
+        happens when partitioning is first enabled.
+        """
+        if self.load_partitions(dataset):
+            return
+        conn = self.acquire()
+        cursor = conn.cursor()
+        try:
+            print(f"Partitioning {dataset.table} by {dataset.partitioning.column}")
+            for statement in dataset.partition_table_sql():
+                cursor.execute(statement)
         except mariadb.Error as e:
-            print(f"Error inserting labour market data: {e}")
+            print(f"Error partitioning {dataset.table}: {e}")
         finally:
             cursor.close()
+            self.release(conn)
+        self.load_partitions(dataset)
+
+    def maintain_partitions(self):
+        """
+        maintain_partitions: Partitions the tables of partitioned datasets if
+        needed & creates the partitions for the current year and the configured
+        number of years ahead.
+        """
+        current_year = datetime.now(timezone.utc).year
+        for dataset in DATASETS.values():
+            if dataset.partitioning:
+                self.partition_table(dataset)
+                years = range(current_year, current_year + dataset.partitioning.years_ahead + 1)
+                self.ensure_partitions(dataset, years)
+
+    def register_dictionary_names(self, cursor, dataset, rows):
+        """
+        register_dictionary_names: Adds names used by a batch that aren't in
+        their dictionary table yet & returns {table: names} it added. Known
+        names are cached, so after the first batches this is usually a no-op.
+        """
+        registered = {}
+        for dictionary, names in dataset.dictionary_names(rows).items():
+            with self.dictionary_lock:
+                new_names = names - self.dictionary_names.get(dictionary.table, set())
+            if new_names:
+                cursor.executemany(
+                    self.dictionary_insert_sql(dictionary), [(name,) for name in sorted(new_names)]
+                )
+                registered[dictionary.table] = new_names
+        return registered
+
+    def remember_dictionary_names(self, registered):
+        """
+        remember_dictionary_names: Caches names registered by a committed batch.
+        Names only count as known once committed, so a writer never skips the
+        INSERT IGNORE of a name another writer's open transaction may roll back.
+        """
+        with self.dictionary_lock:
+            for table, names in registered.items():
+                self.dictionary_names.setdefault(table, set()).update(names)
+
+    def insert_housing_data(self, housing_data):
+        """
+        insert_housing_data: Insert a new housing data if it doesn't exist.
+        """
+        self.insert_rows(HOUSING, [HOUSING.row_from_object(housing_data)])
+
+    def insert_labour_market_data(self, labour_market_data):
+        """
+        insert_labour_market_data: Insert new labour market data if it doesn't exist.
+        """
+        self.insert_rows(LABOUR_MARKET, [LABOUR_MARKET.row_from_object(labour_market_data)])
 
     def close(self):
         """
-        close: Close database connection.
+        close: Close database connection & every pooled connection.
         """
+        for name in list(self.locks):
+            self.unlock(name)
+        if self.pool:
+            self.pool.close()
+            self.pool = None
         if self.conn:
             self.conn.close()
             print("Closed database connection\n")
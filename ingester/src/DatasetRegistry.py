@@ -0,0 +1,744 @@
+"""
+DatasetRegistry.py: Declarative description of every dataset the ingester loads.
+The table DDL, the row extractor & the batched write statements are all derived
+from these declarations, so onboarding a new feed only means adding an entry here.
+"""
+
+import json
+import os
+import zlib
+
+# Stands for a NULL column in row checksums, CONCAT_WS would skip it otherwise
+CHECKSUM_NULL = "NULL"
+
+
+def to_int(value):
+    """
+    to_int: Converts an API value to an integer. Empty values become 0 and
+    comma-grouped numbers such as "1,234" are accepted. Integers, what the
+    API sends for most numbers, are returned as they are.
+    """
+    if type(value) is int:  # pylint: disable=unidiomatic-typecheck
+        return value
+    if value == "" or value is None:
+        return 0
+    return int(str(value).replace(',', ''))
+
+
+def to_year(value):
+    """
+    to_year: Converts an API year or date ("2024", "2024-03", "2024-03-15")
+    to its year. Empty values become 0.
+    """
+    if type(value) is int:  # pylint: disable=unidiomatic-typecheck
+        return value
+    if value == "" or value is None:
+        return 0
+    return int(str(value).strip()[:4])
+
+
+def to_str(value):
+    """
+    to_str: Converts an API value to a stripped string, empty values become "".
+    """
+    if value is None:
+        return ""
+    return str(value).strip()
+
+
+class Dictionary:
+    """
+    Dictionary class: A lookup table mapping repeated string values (e.g. CMA
+    names) to small integer ids, so rows can reference them by id.
+    """
+
+    def __init__(self, table, id_column, sql_type="SMALLINT UNSIGNED", name_type="VARCHAR(64)"):
+        """
+        __init__: Declares the dictionary table, the id column it adds to the
+        dataset's table & the id/name types.
+        """
+        self.table = table
+        self.id_column = id_column
+        self.sql_type = sql_type
+        self.name_type = name_type
+
+    def create_table_sql(self):
+        """
+        create_table_sql: Returns the CREATE TABLE statement for the dictionary.
+        """
+        return (
+            f"CREATE TABLE IF NOT EXISTS {self.table} (\n"
+            f"    id {self.sql_type} AUTO_INCREMENT PRIMARY KEY COMMENT 'Primary Key',\n"
+            f"    name {self.name_type} NOT NULL COMMENT 'Name',\n"
+            f"    UNIQUE KEY uq_{self.table}_name (name)\n"
+            f")"
+        )
+
+    def insert_sql(self):
+        """
+        insert_sql: Returns the statement registering names not yet in the dictionary.
+        """
+        return f"INSERT IGNORE INTO {self.table} (name) VALUES (?)"
+
+    def lookup_sql(self):
+        """
+        lookup_sql: Returns the sub-select resolving a name to its id.
+        """
+        return f"(SELECT id FROM {self.table} WHERE name = ?)"
+
+
+class DataVersions:
+    """
+    DataVersions class: Change counters readers can key their caches on. Every
+    committed batch that changed rows bumps its dataset's row (scope '') and
+    one row per CMA (dictionary name) whose rows it changed, in the same
+    transaction as the batch.
+    """
+
+    def __init__(self, table="data_version"):
+        """
+        __init__: Declares the version table.
+        """
+        self.table = table
+
+    def create_table_sql(self):
+        """
+        create_table_sql: Returns the CREATE TABLE statement for the version table.
+        """
+        return (
+            f"CREATE TABLE IF NOT EXISTS {self.table} (\n"
+            f"    dataset VARCHAR(32) NOT NULL COMMENT 'Dataset',\n"
+            f"    scope VARCHAR(64) NOT NULL DEFAULT '' "
+            f"COMMENT 'CMA name, empty for the whole dataset',\n"
+            f"    version BIGINT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'Version',\n"
+            f"    changed_rows INT UNSIGNED NOT NULL DEFAULT 0 "
+            f"COMMENT 'Rows changed by the last bump',\n"
+            f"    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP "
+            f"COMMENT 'Updated At',\n"
+            f"    PRIMARY KEY (dataset, scope)\n"
+            f")"
+        )
+
+    def bump_sql(self):
+        """
+        bump_sql: Returns the upsert incrementing a (dataset, scope) version.
+        """
+        return (
+            f"INSERT INTO {self.table} (dataset, scope, version, changed_rows) VALUES (?, ?, 1, ?) "
+            f"ON DUPLICATE KEY UPDATE version = version + 1, changed_rows = VALUES(changed_rows)"
+        )
+
+    @staticmethod
+    def scopes(dataset, rows):
+        """
+        scopes: Splits a batch by the CMAs (dictionary names) of its rows, so
+        the rows each scope changed can be counted on their own. Returns
+        {tuple of names: rows}; datasets without a dictionary give one group.
+        """
+        groups = {}
+        for row in rows:
+            key = tuple(row[index] for index, _ in dataset.dictionary_fields)
+            groups.setdefault(key, []).append(row)
+        return groups
+
+    @staticmethod
+    def bump_params(dataset, changed):
+        """
+        bump_params: Returns the bump_sql() parameters for a batch, given the
+        rows changed per scope ({tuple of names: count}, see scopes()): the
+        dataset itself & every CMA whose rows changed. Scopes that changed
+        nothing keep their version.
+        """
+        by_name = {}
+        for names, count in changed.items():
+            for name in names:
+                by_name[name] = by_name.get(name, 0) + count
+        total = sum(changed.values())
+        if not total:
+            return []
+        return [(dataset.name, "", total)] + [
+            (dataset.name, name, count) for name, count in sorted(by_name.items()) if count
+        ]
+
+
+class YearPartitioning:
+    """
+    YearPartitioning class: Range-partitions a table by a year column, one
+    partition per year. Rows without a year go to p_unknown and p_max catches
+    anything beyond the newest year partition, so inserts never fail.
+    """
+
+    def __init__(self, column="year", years_ahead=1):
+        """
+        __init__: Declares the partitioning column & how many future years
+        get a partition ahead of time.
+        """
+        self.column = column
+        self.years_ahead = years_ahead
+
+    @staticmethod
+    def partition_name(year):
+        """
+        partition_name: Returns the name of the partition holding a year.
+        """
+        return "p_unknown" if year < 1 else f"p{year}"
+
+    def create_clause(self):
+        """
+        create_clause: Returns the initial PARTITION BY clause.
+        """
+        return (
+            f"PARTITION BY RANGE ({self.column}) (\n"
+            f"    PARTITION p_unknown VALUES LESS THAN (1),\n"
+            f"    PARTITION p_max VALUES LESS THAN MAXVALUE\n"
+            f")"
+        )
+
+    def split_sql(self, table, year, containing, bound):
+        """
+        split_sql: Returns the statement carving the partition for `year` out of
+        the partition currently containing it, whose upper bound is `bound`
+        (None for MAXVALUE).
+        """
+        upper = "MAXVALUE" if bound is None else f"({bound})"
+        return (
+            f"ALTER TABLE {table} REORGANIZE PARTITION {containing} INTO ("
+            f"PARTITION {self.partition_name(year)} VALUES LESS THAN ({year + 1}), "
+            f"PARTITION {containing} VALUES LESS THAN {upper})"
+        )
+
+
+class Field:
+    """
+    Field class: Maps one API field to a table column.
+    """
+    # pylint: disable=too-many-arguments,too-many-positional-arguments,too-few-public-methods
+
+    def __init__(self, api_name, column, sql_type, converter=to_int, comment="",
+                 required=True, dictionary=None):
+        """
+        __init__: Declares the API field name, the column it is stored in,
+        the column's SQL type & the converter applied to the raw API value.
+        Optional fields are converted from None when the API omits them.
+        A field with a dictionary also stores the value's dictionary id.
+        """
+        self.api_name = api_name
+        self.column = column
+        self.sql_type = sql_type
+        self.converter = converter
+        self.comment = comment
+        self.required = required
+        self.dictionary = dictionary
+
+    def column_sql(self):
+        """
+        column_sql: Returns the column definition used in CREATE TABLE.
+        """
+        return f"{self.column} {self.sql_type} COMMENT '{self.comment}'"
+
+
+class Dataset:
+    """
+    Dataset class: Declares a dataset's table, fields, natural key, secondary
+    indexes, optional partitioning & the environment variable holding its API endpoint.
+    """
+    # pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-instance-attributes
+
+    def __init__(self, name, table, fields, natural_key, endpoint_env, indexes=None,
+                 partitioning=None):
+        """
+        __init__: Declares the dataset & precompiles its row extractor.
+        `indexes` maps index names to the columns they cover. With partitioning
+        the partition column must be part of the natural key, as MariaDB
+        requires every unique key to include it.
+        """
+        self.name = name
+        self.table = table
+        self.fields = tuple(fields)
+        self.natural_key = tuple(natural_key)
+        self.endpoint_env = endpoint_env
+        self.indexes = dict(indexes or {})
+        self.partitioning = partitioning
+        self.columns = tuple(field.column for field in self.fields)
+        self.key_indexes = tuple(self.columns.index(column) for column in self.natural_key)
+        self.dictionary_fields = tuple(
+            (index, field.dictionary) for index, field in enumerate(self.fields) if field.dictionary
+        )
+        self.partition_index = (
+            self.columns.index(partitioning.column) if partitioning else None
+        )
+        # API field of the leading key column, which pages are keyed & deduplicated by
+        self.id_field = self.fields[self.key_indexes[0]].api_name
+        self.extract = self._compile_extractor()
+
+    def _compile_extractor(self):
+        """
+        _compile_extractor: Generates a function turning an API record into a row
+        tuple in column order. The lookups & converter calls are unrolled into a
+        single expression so no per-record loop or attribute access is needed.
+        A missing API field raises KeyError, a malformed value ValueError.
+        """
+        namespace = {}
+        items = []
+        for index, field in enumerate(self.fields):
+            namespace[f"convert_{index}"] = field.converter
+            if field.required:
+                items.append(f"convert_{index}(record[{field.api_name!r}])")
+            else:
+                items.append(f"convert_{index}(record.get({field.api_name!r}))")
+        source = f"def extract(record):\n    return ({', '.join(items)},)\n"
+        exec(compile(source, f"<{self.name} extractor>", "exec"), namespace)  # pylint: disable=exec-used
+        return namespace["extract"]
+
+    def field_errors(self, record):
+        """
+        field_errors: Returns {API field name: error} for every field of a
+        record the extractor can't convert. Only used for records the compiled
+        extractor rejected, to report each failing field rather than the first.
+        """
+        if not isinstance(record, dict):
+            return {"record": f"expected an object, got {type(record).__name__}"}
+        errors = {}
+        for field in self.fields:
+            if field.required and field.api_name not in record:
+                errors[field.api_name] = "missing"
+                continue
+            try:
+                field.converter(record.get(field.api_name))
+            except (TypeError, ValueError) as convert_error:
+                errors[field.api_name] = str(convert_error)
+        return errors
+
+    def endpoint(self):
+        """
+        endpoint: Returns the dataset's API URL from the environment.
+        """
+        return os.getenv(self.endpoint_env)
+
+    def key_of(self, row):
+        """
+        key_of: Returns the natural key of an extracted row.
+        """
+        return tuple(row[index] for index in self.key_indexes)
+
+    def row_from_object(self, obj):
+        """
+        row_from_object: Builds a row from a model object (e.g. HousingData)
+        whose attributes are named after the table columns. Optional fields
+        the object doesn't have are converted from None.
+        """
+        return tuple(
+            field.converter(getattr(obj, field.column) if field.required
+                            else getattr(obj, field.column, None))
+            for field in self.fields
+        )
+
+    def create_table_sql(self):
+        """
+        create_table_sql: Returns the CREATE TABLE statement for the dataset,
+        including dictionary id columns, the natural key & secondary indexes.
+        """
+        definitions = [field.column_sql() for field in self.fields]
+        definitions += [
+            f"{dictionary.id_column} {dictionary.sql_type} DEFAULT NULL "
+            f"COMMENT '{dictionary.table} id'"
+            for _, dictionary in self.dictionary_fields
+        ]
+        definitions.append(f"UNIQUE KEY uq_{self.table}_key ({', '.join(self.natural_key)})")
+        definitions += [
+            f"KEY {index_name} ({', '.join(columns)})"
+            for index_name, columns in self.indexes.items()
+        ]
+        if not self.partitioning:
+            body = ",\n    ".join(definitions)
+            return (
+                f"CREATE TABLE IF NOT EXISTS {self.table} (\n"
+                f"    id INT AUTO_INCREMENT PRIMARY KEY COMMENT 'Primary Key',\n"
+                f"    {body}\n"
+                f")"
+            )
+        definitions.insert(0, "id INT AUTO_INCREMENT NOT NULL COMMENT 'Primary Key'")
+        definitions.append(f"PRIMARY KEY (id, {self.partitioning.column})")
+        body = ",\n    ".join(definitions)
+        return (
+            f"CREATE TABLE IF NOT EXISTS {self.table} (\n"
+            f"    {body}\n"
+            f")\n{self.partitioning.create_clause()}"
+        )
+
+    def partition_of(self, row):
+        """
+        partition_of: Returns the name of the partition a row belongs to,
+        None if the dataset isn't partitioned.
+        """
+        if not self.partitioning:
+            return None
+        return self.partitioning.partition_name(row[self.partition_index])
+
+    def partition_years(self, rows):
+        """
+        partition_years: Returns the set of partition years used by a batch of rows.
+        """
+        return {row[self.partition_index] for row in rows}
+
+    def partition_table_sql(self):
+        """
+        partition_table_sql: Returns the statements partitioning an existing,
+        unpartitioned table, moving the keys onto the partition column first.
+        """
+        column = self.partitioning.column
+        return [
+            f"ALTER TABLE {self.table} DROP PRIMARY KEY, ADD PRIMARY KEY (id, {column}), "
+            f"DROP KEY IF EXISTS uq_{self.table}_key, "
+            f"ADD UNIQUE KEY uq_{self.table}_key ({', '.join(self.natural_key)})",
+            f"ALTER TABLE {self.table} {self.partitioning.create_clause()}",
+        ]
+
+    def insert_sql(self, partition=None):
+        """
+        insert_sql: Returns the upsert used with executemany. A row whose natural
+        key is already stored is updated in place rather than duplicated.
+        With `partition` the insert targets that partition only, so the server
+        neither routes nor locks rows in any other partition.
+        Parameters are the row followed by its dictionary names (see insert_params).
+        """
+        columns = list(self.columns)
+        values = ["?" for _ in self.columns]
+        for _, dictionary in self.dictionary_fields:
+            columns.append(dictionary.id_column)
+            values.append(dictionary.lookup_sql())
+        updates = ", ".join(
+            f"{column} = VALUES({column})" for column in columns if column not in self.natural_key
+        )
+        target = f"{self.table} PARTITION ({partition})" if partition else self.table
+        return (
+            f"INSERT INTO {target} ({', '.join(columns)}) "
+            f"VALUES ({', '.join(values)}) "
+            f"ON DUPLICATE KEY UPDATE {updates}"
+        )
+
+    def checksum_sql(self, div="DIV", charset="utf8mb4", where=""):
+        """
+        checksum_sql: Returns the set-based aggregate giving (bucket, row count,
+        checksum) per bucket of the first natural key column; the bucket size is
+        the only parameter. The checksum XORs a CRC32 per row, matching
+        row_checksum(): NULL columns are written as CHECKSUM_NULL & the row is
+        converted to `charset` so it is hashed as UTF-8 whatever the column
+        charset. Backends with other dialects pass their integer division &
+        charset=None if their strings are UTF-8 already. An optional `where`
+        condition limits the rows compared, see RecordFilter.where().
+        """
+        bucket_column = self.natural_key[0]
+        values = ", ".join(f"COALESCE({column}, '{CHECKSUM_NULL}')" for column in self.columns)
+        row = f"CONCAT_WS('|', {values})"
+        if charset:
+            row = f"CONVERT({row} USING {charset})"
+        where = f"WHERE {where} " if where else ""
+        return (
+            f"SELECT {bucket_column} {div} ? AS bucket, COUNT(*), BIT_XOR(CRC32({row})) "
+            f"FROM {self.table} {where}GROUP BY bucket"
+        )
+
+    @staticmethod
+    def row_checksum(row):
+        """
+        row_checksum: Returns the CRC32 of a row as computed by checksum_sql().
+        """
+        return zlib.crc32("|".join(
+            CHECKSUM_NULL if value is None else str(value) for value in row
+        ).encode("utf-8"))
+
+    def bucket_of(self, row, bucket_size):
+        """
+        bucket_of: Returns the checksum bucket of a row.
+        """
+        return row[self.key_indexes[0]] // bucket_size
+
+    def bucket_keys_sql(self, div="DIV"):
+        """
+        bucket_keys_sql: Returns the query listing the natural keys stored in one
+        bucket; backends with other dialects pass their integer division.
+        """
+        return (
+            f"SELECT {', '.join(self.natural_key)} FROM {self.table} "
+            f"WHERE {self.natural_key[0]} {div} ? = ?"
+        )
+
+    def delete_sql(self):
+        """
+        delete_sql: Returns the statement deleting one row by natural key.
+        """
+        conditions = " AND ".join(f"{column} = ?" for column in self.natural_key)
+        return f"DELETE FROM {self.table} WHERE {conditions}"
+
+    def insert_params(self, rows):
+        """
+        insert_params: Returns the executemany parameters for insert_sql().
+        """
+        if not self.dictionary_fields:
+            return list(rows)
+        positions = tuple(index for index, _ in self.dictionary_fields)
+        return [row + tuple(row[index] for index in positions) for row in rows]
+
+    def dictionary_names(self, rows):
+        """
+        dictionary_names: Returns {Dictionary: set of names} used by a batch of rows.
+        """
+        return {
+            dictionary: {row[index] for row in rows}
+            for index, dictionary in self.dictionary_fields
+        }
+
+
+class CombinedStats:
+    """
+    CombinedStats class: A materialized table joining housing & labour data,
+    one row per (CMA, year, month, education level) with the CMA's housing
+    totals for the period next to its province's labour force counts by
+    status. Rows are rebuilt per CMA from the CMAs a run changed, so combined
+    views read one indexed key range instead of aggregating both tables.
+
+    The labour feed's records carry no period, so its counts are a snapshot of
+    every stored record of the province: each housing period of a CMA repeats
+    the same counts, which change for all periods when labour data is written.
+    """
+
+    def __init__(self, housing, labour, provinces, table="combined_stats"):
+        """
+        __init__: Declares the table & the default {CMA name: province code}
+        mapping; CMA_PROVINCE_FILE can name a JSON file extending it.
+        """
+        self.housing = housing
+        self.labour = labour
+        self.default_provinces = dict(provinces)
+        self.provinces = None
+        self.table = table
+
+    def load_provinces(self):
+        """
+        load_provinces: Returns the CMA to province mapping, read once.
+        """
+        if self.provinces is None:
+            provinces = dict(self.default_provinces)
+            path = os.getenv("CMA_PROVINCE_FILE")
+            if path:
+                with open(path, "r", encoding="utf-8") as f:
+                    provinces.update(json.load(f))
+            self.provinces = provinces
+        return self.provinces
+
+    def province_of(self, cma):
+        """
+        province_of: Returns a CMA's province code, None if it isn't mapped.
+        """
+        return self.load_provinces().get(cma)
+
+    def create_table_sql(self):
+        """
+        create_table_sql: Returns the CREATE TABLE statement for the combined table.
+        """
+        return (
+            f"CREATE TABLE IF NOT EXISTS {self.table} (\n"
+            f"    census_metropolitan_area VARCHAR(64) NOT NULL "
+            f"COMMENT 'Census Metropolitan Area',\n"
+            f"    year SMALLINT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'Year',\n"
+            f"    month TINYINT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'Month',\n"
+            f"    education_level TINYINT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'Education Level',\n"
+            f"    province TINYINT UNSIGNED DEFAULT NULL COMMENT 'Province',\n"
+            f"    total_starts INT DEFAULT 0 COMMENT 'Total Starts',\n"
+            f"    total_complete INT DEFAULT 0 COMMENT 'Total Complete',\n"
+            f"    employed INT DEFAULT 0 COMMENT 'Employed',\n"
+            f"    unemployed INT DEFAULT 0 COMMENT 'Unemployed',\n"
+            f"    not_in_labour_force INT DEFAULT 0 COMMENT 'Not in Labour Force',\n"
+            f"    PRIMARY KEY (census_metropolitan_area, year, month, education_level)\n"
+            f")"
+        )
+
+    def delete_sql(self):
+        """
+        delete_sql: Returns the statement removing one CMA's rows before its refresh.
+        """
+        return f"DELETE FROM {self.table} WHERE census_metropolitan_area = ?"
+
+    def refresh_sql(self):
+        """
+        refresh_sql: Returns the statement rebuilding one CMA's rows; see
+        refresh_params(). A CMA without a province or labour data still gets
+        its housing totals, with education level 0 & no labour counts.
+        """
+        return (
+            f"INSERT INTO {self.table} (census_metropolitan_area, year, month, education_level, "
+            f"province, total_starts, total_complete, employed, unemployed, not_in_labour_force) "
+            f"SELECT h.census_metropolitan_area, h.year, h.month, "
+            f"COALESCE(l.education_level, 0), ?, h.total_starts, h.total_complete, "
+            f"COALESCE(l.employed, 0), COALESCE(l.unemployed, 0), "
+            f"COALESCE(l.not_in_labour_force, 0) "
+            f"FROM (SELECT census_metropolitan_area, year, COALESCE(month, 0) AS month, "
+            f"SUM(total_starts) AS total_starts, SUM(total_complete) AS total_complete "
+            f"FROM {self.housing.table} WHERE census_metropolitan_area = ? "
+            f"GROUP BY census_metropolitan_area, year, COALESCE(month, 0)) h "
+            f"LEFT JOIN (SELECT education_level, "
+            f"SUM(labour_force_status = 1) AS employed, "
+            f"SUM(labour_force_status = 2) AS unemployed, "
+            f"SUM(labour_force_status = 3) AS not_in_labour_force "
+            f"FROM {self.labour.table} WHERE province = ? GROUP BY education_level) l ON 1 = 1"
+        )
+
+    def refresh_params(self, cmas):
+        """
+        refresh_params: Returns the refresh_sql() parameters for some CMAs.
+        """
+        return [(self.province_of(cma), cma, self.province_of(cma)) for cma in cmas]
+
+    def bump_params(self, refreshed):
+        """
+        bump_params: Returns the DataVersions.bump_sql() parameters for a
+        refresh from {CMA: rows rebuilt}: the combined table itself with the
+        total & every refreshed CMA with its own count.
+        """
+        return [(self.table, "", sum(refreshed.values()))] + [
+            (self.table, cma, rows) for cma, rows in refreshed.items()
+        ]
+
+    def changed_cmas(self, dataset, rows):
+        """
+        changed_cmas: Returns the CMAs whose combined rows a written batch
+        changed: the batch's CMAs for housing, the CMAs of its provinces for
+        labour data.
+        """
+        if dataset is self.housing:
+            index = dataset.columns.index("census_metropolitan_area")
+            return {row[index] for row in rows}
+        if dataset is self.labour:
+            index = dataset.columns.index("province")
+            provinces = {row[index] for row in rows}
+            return {cma for cma, province in self.load_provinces().items() if province in provinces}
+        return set()
+
+
+CMA_DICTIONARY = Dictionary(table="cma_dictionary", id_column="cma_id")
+
+DATA_VERSIONS = DataVersions()
+
+def housing_dataset(year_field=None):
+    """
+    housing_dataset: Declares the housing dataset. The feed's records carry no
+    year, so by default the year column is only filled from an optional Year
+    field & the table isn't partitioned. With `year_field` naming the API
+    field that holds a record's year or date (HOUSING_YEAR_FIELD), the field is
+    required, the year joins the natural key & the table is partitioned by
+    year. Rows stored before that keep year 0 in p_unknown until re-ingested.
+    """
+    if year_field:
+        year = Field(year_field, "year", "SMALLINT UNSIGNED NOT NULL DEFAULT 0", to_year,
+                     comment="Year")
+    else:
+        year = Field("Year", "year", "SMALLINT UNSIGNED NOT NULL DEFAULT 0", to_year,
+                     comment="Year", required=False)
+    return Dataset(
+        name="housing",
+        table="housing_data",
+        fields=[
+            Field("id", "jsonid", "INT NOT NULL DEFAULT 0", comment="JSON ID"),
+            Field("CMA", "census_metropolitan_area", "VARCHAR(64) NOT NULL DEFAULT ''", to_str,
+                  comment="Census Metropolitan Area", dictionary=CMA_DICTIONARY),
+            Field("Month", "month", "TINYINT UNSIGNED DEFAULT NULL", comment="Month"),
+            year,
+            Field("Total_starts", "total_starts", "INT DEFAULT 0", comment="Total Starts"),
+            Field("Total_complete", "total_complete", "INT DEFAULT 0", comment="Total Complete"),
+            Field("Singles_starts", "singles_starts", "INT DEFAULT 0", comment="Singles Starts"),
+            Field("Semis_starts", "semis_starts", "INT DEFAULT 0", comment="Semis Starts"),
+            Field("Row_starts", "row_starts", "INT DEFAULT 0", comment="Row Starts"),
+            Field("Apt_Other_starts", "apartment_starts", "INT DEFAULT 0",
+                  comment="Apartment Starts"),
+            Field("Singles_complete", "singles_complete", "INT DEFAULT 0",
+                  comment="Singles Complete"),
+            Field("Semis_complete", "semis_complete", "INT DEFAULT 0", comment="Semis Complete"),
+            Field("Row_complete", "row_complete", "INT DEFAULT 0", comment="Row Complete"),
+            Field("Apt_other_complete", "apartment_complete", "INT DEFAULT 0",
+                  comment="Apartment Complete"),
+        ],
+        # A partitioned table's unique key has to include the partition column
+        natural_key=["jsonid", "year"] if year_field else ["jsonid"],
+        endpoint_env="API_URL_HOUSING",
+        partitioning=YearPartitioning(column="year", years_ahead=1) if year_field else None,
+        indexes={
+            # Covers DataDao's SUM(total_starts|total_complete) WHERE census_metropolitan_area = ?
+            "idx_housing_data_cma_totals": [
+                "census_metropolitan_area", "total_starts", "total_complete"
+            ],
+            "idx_housing_data_cma_id_period": ["cma_id", "year", "month"],
+        },
+    )
+
+
+HOUSING = housing_dataset(os.getenv("HOUSING_YEAR_FIELD"))
+
+LABOUR_MARKET = Dataset(
+    name="labour_market",
+    table="labour_market_data",
+    fields=[
+        Field("id", "jsonid", "INT NOT NULL DEFAULT 0", comment="JSON ID"),
+        Field("PROV", "province", "TINYINT UNSIGNED DEFAULT 0", comment="Province"),
+        Field("EDUC", "education_level", "TINYINT UNSIGNED DEFAULT 0", comment="Education Level"),
+        Field("LFSSTAT", "labour_force_status", "TINYINT UNSIGNED DEFAULT 0",
+              comment="Labour Force Status"),
+    ],
+    natural_key=["jsonid"],
+    endpoint_env="API_URL_LABOUR_MARKET",
+    indexes={
+        "idx_labour_market_data_prov_status_educ": [
+            "province", "labour_force_status", "education_level"
+        ],
+        "idx_labour_market_data_educ_status": ["education_level", "labour_force_status"],
+    },
+)
+
+DATASETS = {dataset.name: dataset for dataset in (HOUSING, LABOUR_MARKET)}
+
+# Statistics Canada province codes, as used by the labour market feed's PROV field
+CMA_PROVINCES = {
+    "St. John's": 10,
+    "Halifax": 12,
+    "Moncton": 13,
+    "Saint John": 13,
+    "Fredericton": 13,
+    "Saguenay": 24,
+    "Québec": 24,
+    "Sherbrooke": 24,
+    "Trois-Rivières": 24,
+    "Drummondville": 24,
+    "Montréal": 24,
+    "Ottawa-Gatineau": 35,
+    "Kingston": 35,
+    "Belleville - Quinte West": 35,
+    "Peterborough": 35,
+    "Oshawa": 35,
+    "Toronto": 35,
+    "Hamilton": 35,
+    "St. Catharines-Niagara": 35,
+    "Kitchener-Cambridge-Waterloo": 35,
+    "Brantford": 35,
+    "Guelph": 35,
+    "London": 35,
+    "Windsor": 35,
+    "Barrie": 35,
+    "Greater Sudbury": 35,
+    "Thunder Bay": 35,
+    "Winnipeg": 46,
+    "Regina": 47,
+    "Saskatoon": 47,
+    "Lethbridge": 48,
+    "Calgary": 48,
+    "Red Deer": 48,
+    "Edmonton": 48,
+    "Kelowna": 59,
+    "Kamloops": 59,
+    "Chilliwack": 59,
+    "Abbotsford-Mission": 59,
+    "Vancouver": 59,
+    "Nanaimo": 59,
+    "Victoria": 59,
+}
+
+COMBINED_STATS = CombinedStats(HOUSING, LABOUR_MARKET, CMA_PROVINCES)
@@ -0,0 +1,128 @@
+"""
+DeadLetterStore.py: Keeps records the ingester rejected so they can be replayed later.
+"""
+
+import gzip
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+
+class DeadLetterStore:
+    """
+    DeadLetterStore class: Buffers rejected records & writes them in bulk to a
+    gzip-compressed JSONL file per dataset, together with the rejection reason,
+    the batch offset the record came from & when it was rejected.
+    """
+    def __init__(self, directory=None):
+        """
+        __init__: Initializes the store. The directory defaults to the
+        DEAD_LETTER_DIR environment variable, or "deadletter".
+        """
+        self.directory = directory or os.getenv("DEAD_LETTER_DIR", "deadletter")
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def path_for(self, dataset):
+        """
+        path_for: Returns the dead-letter file path for a dataset.
+        """
+        return os.path.join(self.directory, f"{dataset}.jsonl.gz")
+
+    def add(self, dataset, record, reason, offset=None):
+        """
+        add: Queues a rejected record. Nothing is written until flush(), so a
+        whole batch of rejects costs a single file append.
+        """
+        entry = {
+            "dataset": dataset,
+            "offset": offset,
+            "reason": str(reason),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "record": record,
+        }
+        with self.lock:
+            self.pending.setdefault(dataset, []).append(entry)
+
+    def flush(self, dataset=None):
+        """
+        flush: Writes pending entries for one dataset (or all of them) as a
+        single gzip member appended to the dataset's file.
+        """
+        with self.lock:
+            self._append_pending([dataset] if dataset else list(self.pending))
+
+    def _append_pending(self, datasets):
+        """
+        _append_pending: Appends & clears the pending entries of some datasets.
+        The caller holds the lock, so appends never interleave with a rewrite.
+        """
+        for name in datasets:
+            entries = self.pending.pop(name, [])
+            if not entries:
+                continue
+            os.makedirs(self.directory, exist_ok=True)
+            lines = "".join(json.dumps(entry, default=str) + "\n" for entry in entries)
+            with gzip.open(self.path_for(name), "at", encoding="utf-8") as f:
+                f.write(lines)
+            print(f"Dead-lettered {len(entries)} {name} records to {self.path_for(name)}")
+
+    def _load(self, dataset):
+        """
+        _load: Returns the entries in a dataset's file, oldest first.
+        """
+        try:
+            with gzip.open(self.path_for(dataset), "rt", encoding="utf-8") as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def _rewrite(self, dataset, entries):
+        """
+        _rewrite: Atomically rewrites a dataset's file with `entries`, removing
+        it when nothing is left. The caller holds the lock.
+        """
+        path = self.path_for(dataset)
+        if not entries:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            f.write("".join(json.dumps(entry, default=str) + "\n" for entry in entries))
+        os.replace(tmp_path, path)
+
+    def read(self, dataset):
+        """
+        read: Returns every dead-lettered entry for a dataset, oldest first.
+        """
+        with self.lock:
+            self._append_pending([dataset])
+            return self._load(dataset)
+
+    def count(self, dataset):
+        """
+        count: Returns the number of dead-lettered entries for a dataset.
+        """
+        return len(self.read(dataset))
+
+    def replace(self, dataset, entries):
+        """
+        replace: Atomically rewrites a dataset's dead-letter file with `entries`,
+        removing the file when nothing is left.
+        """
+        with self.lock:
+            self._rewrite(dataset, entries)
+
+    def replace_replayed(self, dataset, replayed):
+        """
+        replace_replayed: Ends a replay of entries returned by read(). In one
+        rewrite under the lock, the replayed entries are dropped from the front
+        of the file, while entries appended since & pending ones, such as the
+        records rejected again by the replay, are kept.
+        """
+        with self.lock:
+            kept = self._load(dataset)[len(replayed):] + self.pending.pop(dataset, [])
+            self._rewrite(dataset, kept)
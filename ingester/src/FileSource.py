@@ -0,0 +1,137 @@
+"""
+FileSource.py: Reads local CSV, NDJSON or JSON dumps of a dataset in batches.
+CSV & NDJSON files are memory-mapped and parsed a line at a time, so memory
+stays bounded by the batch size whatever the dump's size; a .json file is one
+document, a JSON array of records, and is parsed whole. Columns are matched to
+the API field names of the dataset (ignoring case, spaces & dashes), so the
+records go through the same extractors & batched writes as records from the
+API. Records that aren't objects are passed on for the extractors to reject,
+and NDJSON lines that aren't valid JSON are reported through `on_invalid`, so
+both end up dead-lettered instead of aborting the load.
+
+Usage: python src/DataIngester.py load-file --dataset housing --file housing.csv
+"""
+
+import codecs
+import csv
+import mmap
+import os
+from src.JsonDecoder import loads
+
+
+def normalize(name):
+    """
+    normalize: Returns a column name reduced to lowercase with underscores.
+    """
+    return name.strip().lower().replace(" ", "_").replace("-", "_")
+
+
+class InvalidLine:
+    """
+    InvalidLine class: An NDJSON line that couldn't be parsed & why.
+    """
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, line, reason):
+        """
+        __init__: Keeps the line & the parse error.
+        """
+        self.line = line
+        self.reason = reason
+
+
+class FileSource:
+    """
+    FileSource class: Yields batches of API-shaped records from a dump file.
+    """
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+
+    def __init__(self, dataset, path, batch_size=5000, column_map=None, on_invalid=None):
+        """
+        __init__: Initializes the source. `column_map` maps dump column names to
+        API field names for columns that don't match by name. `on_invalid` is
+        called as on_invalid(offset, line, reason) with every NDJSON line that
+        isn't valid JSON; without it such a line raises ValueError.
+        """
+        self.dataset = dataset
+        self.path = path
+        self.batch_size = batch_size
+        self.on_invalid = on_invalid
+        self.fields = {normalize(field.api_name): field.api_name for field in dataset.fields}
+        for column, api_name in (column_map or {}).items():
+            self.fields[normalize(column)] = api_name
+
+    def rename(self, record):
+        """
+        rename: Returns a record keyed by API field names; unknown columns are
+        dropped. Anything but an object is returned as it is for the extractor
+        to reject.
+        """
+        if not isinstance(record, dict):
+            return record
+        renamed = {}
+        for column, value in record.items():
+            api_name = self.fields.get(normalize(column)) if column is not None else None
+            if api_name is not None:
+                renamed[api_name] = value
+        return renamed
+
+    @staticmethod
+    def lines(mapped):
+        """
+        lines: Yields the decoded lines of a memory-mapped file.
+        """
+        for line in iter(mapped.readline, b""):
+            yield line.decode("utf-8-sig" if mapped.tell() == len(line) else "utf-8")
+
+    def records(self, mapped):
+        """
+        records: Yields the file's records, parsed as a JSON array for .json
+        files, as NDJSON for .ndjson/.jsonl files and as CSV with a header row
+        otherwise. NDJSON lines that aren't valid JSON are yielded as
+        InvalidLine.
+        """
+        if self.path.endswith(".json"):
+            document = mapped[:]
+            if document.startswith(codecs.BOM_UTF8):
+                document = document[len(codecs.BOM_UTF8):]
+            records = loads(document)
+            if not isinstance(records, list):
+                raise ValueError(f"{self.path}: expected a JSON array of records, "
+                                 f"got {type(records).__name__}")
+            yield from records
+        elif self.path.endswith((".ndjson", ".jsonl")):
+            for line in self.lines(mapped):
+                if line.strip():
+                    try:
+                        yield loads(line)
+                    except ValueError as parse_error:
+                        yield InvalidLine(line.strip(), f"Invalid JSON: {parse_error}")
+        else:
+            yield from csv.DictReader(self.lines(mapped))
+
+    def batches(self):
+        """
+        batches: Yields (offset of the first record, records) batches of at most
+        `batch_size` records.
+        """
+        if os.path.getsize(self.path) == 0:
+            return
+        with open(self.path, "rb") as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            batch = []
+            offset = 0
+            for record in self.records(mapped):
+                if isinstance(record, InvalidLine):
+                    if self.on_invalid is None:
+                        raise ValueError(f"{self.path}: {record.reason}")
+                    self.on_invalid(offset + len(batch), record.line, record.reason)
+                    continue
+                batch.append(self.rename(record))
+                if len(batch) >= self.batch_size:
+                    yield offset, batch
+                    offset += len(batch)
+                    batch = []
+            if batch:
+                yield offset, batch
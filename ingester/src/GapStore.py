@@ -0,0 +1,89 @@
+"""
+GapStore.py: Remembers API pages that couldn't be fetched so they can be filled later.
+"""
+
+import json
+import os
+from datetime import datetime, timezone
+
+
+class GapStore:
+    """
+    GapStore class: Keeps the pages (dataset, offset & query parameters) a run
+    had to skip in a JSON file, so a follow-up pass fetches only those pages.
+    """
+
+    def __init__(self, path=None):
+        """
+        __init__: Initializes the store. The file defaults to the INGEST_GAP_FILE
+        environment variable, or "gaps.json".
+        """
+        self.path = path or os.getenv("INGEST_GAP_FILE", "gaps.json")
+        self.gaps = self.load()
+
+    def load(self):
+        """
+        load: Returns the gaps recorded by earlier runs.
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def save(self):
+        """
+        save: Atomically rewrites the gap file, removing it when no gap is left.
+        """
+        if not self.gaps:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.gaps, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def same_page(gap, dataset, offset, params):
+        """
+        same_page: Returns whether a gap stands for the given page.
+        """
+        return (gap["dataset"], gap["offset"], gap["params"]) == (dataset, offset, params)
+
+    def add(self, dataset, offset, params, error):
+        """
+        add: Records a page that couldn't be fetched. Recording a page again
+        only updates its error.
+        """
+        params = {key: value for key, value in params.items() if key != "offset"}
+        self.gaps = [gap for gap in self.gaps if not self.same_page(gap, dataset, offset, params)]
+        self.gaps.append({
+            "dataset": dataset,
+            "offset": offset,
+            "params": params,
+            "error": str(error),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+        })
+        self.save()
+
+    def remove(self, gap):
+        """
+        remove: Forgets a gap once its page was fetched & processed.
+        """
+        self.gaps = [
+            other for other in self.gaps
+            if not self.same_page(other, gap["dataset"], gap["offset"], gap["params"])
+        ]
+        self.save()
+
+    def for_dataset(self, dataset):
+        """
+        for_dataset: Returns the open gaps of a dataset, lowest offset first.
+        """
+        return sorted(
+            (gap for gap in self.gaps if gap["dataset"] == dataset), key=lambda gap: gap["offset"]
+        )
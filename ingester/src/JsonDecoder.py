@@ -0,0 +1,22 @@
+"""
+JsonDecoder.py: Decodes API & dump payloads.
+Uses orjson when it is installed, which parses the raw response bytes directly
+without first decoding them to a str, and falls back to the standard library.
+Both raise a ValueError subclass on malformed input.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(content):
+    """
+    loads: Decodes a JSON document given as bytes or str.
+    """
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
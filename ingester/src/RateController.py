@@ -0,0 +1,107 @@
+"""
+RateController.py: Adaptive limit on concurrent requests to the data service.
+The limit grows additively while responses come back fast & successful and
+is cut multiplicatively on 429/5xx responses, errors or slow responses (AIMD),
+so the ingester settles at what the shared service can sustain. A Retry-After
+header pauses every request until it has passed.
+"""
+
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+
+def parse_retry_after(value, now=None):
+    """
+    parse_retry_after: Returns the seconds a Retry-After header asks to wait,
+    given either as seconds or as an HTTP date. None if absent or malformed.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    now = now or datetime.now(timezone.utc)
+    return max(0.0, (retry_at - now).total_seconds())
+
+
+class RateController:
+    """
+    RateController class: Thread-safe AIMD limit on in-flight requests.
+    Callers wrap each request in acquire() / release().
+    """
+    # pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-instance-attributes
+
+    def __init__(self, initial=1, minimum=1, maximum=8, latency_target=10.0,
+                 decrease=0.5, cooldown=1.0, clock=time.monotonic):
+        """
+        __init__: Initializes the controller. Responses slower than
+        `latency_target` seconds count as congestion; the limit is cut at most
+        once per `cooldown` seconds so one burst of 429s doesn't collapse it.
+        """
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.clock = clock
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.last_decrease = None
+        self.condition = threading.Condition()
+
+    def window(self):
+        """
+        window: Returns the current number of requests allowed in flight.
+        """
+        return max(self.minimum, int(self.limit))
+
+    def acquire(self):
+        """
+        acquire: Waits until a request may be sent, honoring any Retry-After pause.
+        """
+        with self.condition:
+            while True:
+                pause = self.paused_until - self.clock()
+                if pause > 0:
+                    self.condition.wait(pause)
+                elif self.in_flight < self.window():
+                    break
+                else:
+                    self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency, status=None, retry_after=None):
+        """
+        release: Reports a finished request: its latency in seconds, its HTTP
+        status (None if it failed without a response) & any Retry-After delay.
+        """
+        with self.condition:
+            self.in_flight -= 1
+            congested = (status is None or status == 429 or status >= 500
+                         or latency > self.latency_target)
+            if congested:
+                self._decrease()
+            else:
+                # Additive increase: about one more slot per window of successful requests
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            if retry_after:
+                self.paused_until = max(self.paused_until, self.clock() + retry_after)
+            self.condition.notify_all()
+
+    def _decrease(self):
+        """
+        _decrease: Cuts the limit, once per cooldown period.
+        """
+        now = self.clock()
+        if self.last_decrease is not None and now - self.last_decrease < self.cooldown:
+            return
+        self.last_decrease = now
+        self.limit = max(self.minimum, self.limit * self.decrease)
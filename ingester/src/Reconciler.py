@@ -0,0 +1,134 @@
+"""
+Reconciler.py: Detects & repairs drift between the data service and the database.
+Rows are grouped into buckets of the first natural key column (jsonid). Each
+bucket gets a (row count, XOR of row CRC32s) checksum, computed upstream while
+streaming the pages and in the database with one set-based aggregate. Only
+buckets whose checksums differ are repaired: the pages that held their rows
+are fetched again & upserted, and stored rows missing upstream are deleted.
+Rows outside the dataset's RecordFilter are left out on both sides, so rows
+stored before the filter was narrowed don't make their buckets differ.
+
+Usage: python src/DataIngester.py verify [--dataset housing] [--dry-run]
+"""
+
+
+class Reconciler:
+    """
+    Reconciler class: Compares & repairs one dataset at a time through a
+    DataIngester, reusing its fetching & batch writing.
+    """
+
+    def __init__(self, ingester, bucket_size=1000, dry_run=False):
+        """
+        __init__: Initializes the reconciler. With `dry_run` differing buckets
+        are only reported.
+        """
+        self.ingester = ingester
+        self.bucket_size = bucket_size
+        self.dry_run = dry_run
+
+    def database_checksums(self, dataset):
+        """
+        database_checksums: Returns {bucket: (count, checksum)} of the stored
+        rows passing the dataset's filter.
+        """
+        where = self.ingester.filters[dataset.name].where()
+        return self.ingester.db.checksums(dataset, self.bucket_size, where)
+
+    def pages(self, dataset, offsets=None):
+        """
+        pages: Yields (offset, records) for every upstream page, or only the
+        pages at `offsets`.
+        """
+        url = dataset.endpoint()
+        page_size = self.ingester.page_size
+        params = self.ingester.filters[dataset.name].params()
+        if offsets is not None:
+            for offset in sorted(offsets):
+                yield offset, self.ingester.fetch_batch(url, offset, dict(params))
+            return
+        offset = 0
+        while True:
+            records = self.ingester.fetch_batch(url, offset, dict(params))
+            if not records:
+                return
+            yield offset, records
+            offset += page_size
+
+    def upstream_checksums(self, dataset):
+        """
+        upstream_checksums: Streams every upstream page & returns
+        ({bucket: (count, checksum)}, {bucket: offsets of the pages holding it}).
+        Records that can't be extracted are skipped, ingestion dead-letters them,
+        and so are records outside the dataset's filter, which are never stored.
+        """
+        sums = {}
+        page_offsets = {}
+        record_filter = self.ingester.filters[dataset.name]
+        for offset, records in self.pages(dataset):
+            for record in record_filter.apply(records):
+                try:
+                    row = dataset.extract(record)
+                except (KeyError, TypeError, ValueError):
+                    continue
+                bucket = dataset.bucket_of(row, self.bucket_size)
+                count, checksum = sums.get(bucket, (0, 0))
+                sums[bucket] = (count + 1, checksum ^ dataset.row_checksum(row))
+                page_offsets.setdefault(bucket, set()).add(offset)
+        return sums, page_offsets
+
+    def repair(self, dataset, buckets, page_offsets):
+        """
+        repair: Re-fetches the pages holding the differing buckets, upserts
+        their rows & deletes stored rows of those buckets missing upstream.
+        Returns (rows upserted, rows deleted).
+        """
+        offsets = set().union(*(page_offsets.get(bucket, set()) for bucket in buckets))
+        upstream_keys = {bucket: set() for bucket in buckets}
+        upserted = 0
+        for offset, records in self.pages(dataset, offsets):
+            selected = []
+            for record in records:
+                try:
+                    row = dataset.extract(record)
+                except (KeyError, TypeError, ValueError):
+                    continue
+                bucket = dataset.bucket_of(row, self.bucket_size)
+                if bucket in upstream_keys:
+                    upstream_keys[bucket].add(dataset.key_of(row))
+                    selected.append(record)
+            self.ingester.current_offset = offset
+            upserted += self.ingester.process_batch(dataset, selected)
+        self.ingester.dead_letters.flush()
+
+        stale = []
+        for bucket, keys in upstream_keys.items():
+            stored = self.ingester.db.bucket_keys(dataset, self.bucket_size, bucket)
+            stale += [key for key in stored if key not in keys]
+        deleted = self.ingester.db.delete_keys(dataset, stale)
+        return upserted, deleted
+
+    def verify(self, dataset):
+        """
+        verify: Compares a dataset's buckets & repairs the differing ones.
+        Returns a summary of what was compared & fixed.
+        """
+        stored = self.database_checksums(dataset)
+        upstream, page_offsets = self.upstream_checksums(dataset)
+        differing = sorted(
+            bucket for bucket in set(stored) | set(upstream)
+            if stored.get(bucket) != upstream.get(bucket)
+        )
+        summary = {
+            "buckets": len(set(stored) | set(upstream)),
+            "differing": len(differing),
+            "upserted": 0,
+            "deleted": 0,
+        }
+        print(f"Verified {dataset.name}: {summary['differing']} of {summary['buckets']} "
+              f"buckets of {self.bucket_size} differ")
+        if differing and not self.dry_run:
+            summary["upserted"], summary["deleted"] = self.repair(dataset, differing, page_offsets)
+            print(f"Repaired {dataset.name}: upserted={summary['upserted']}, "
+                  f"deleted={summary['deleted']}")
+        return summary
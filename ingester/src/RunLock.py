@@ -0,0 +1,114 @@
+"""
+RunLock.py: Keeps ingestion runs of a dataset from overlapping.
+An incremental run holds a per-dataset lock in the storage backend (a MariaDB
+GET_LOCK advisory lock, a lock file next to a SQLite database) for as long as
+it runs. A second instance finding the lock taken either skips the dataset,
+waits for the lock, or hands off: it leaves a request in the run_request table
+& the instance holding the lock runs the dataset once more before releasing it.
+"""
+
+import os
+import socket
+
+RUN_REQUEST_TABLE = "run_request"
+
+LOCK_MODES = ("skip", "wait", "handoff")
+
+
+def create_table_sql():
+    """
+    create_table_sql: Returns the CREATE TABLE statement for handed off runs.
+    """
+    return (
+        f"CREATE TABLE IF NOT EXISTS {RUN_REQUEST_TABLE} (\n"
+        f"    dataset VARCHAR(32) NOT NULL PRIMARY KEY COMMENT 'Dataset',\n"
+        f"    requested_by VARCHAR(128) DEFAULT NULL COMMENT 'Instance handing the run off',\n"
+        f"    requested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT 'Requested At'\n"
+        f")"
+    )
+
+
+class RunLock:
+    """
+    RunLock class: Runs a dataset's ingestion under its lock, applying the
+    configured mode when another instance holds it.
+    """
+
+    def __init__(self, db, mode=None, timeout=None):
+        """
+        __init__: Initializes the lock for a storage backend. `mode` defaults to
+        INGEST_LOCK_MODE (skip), the wait timeout to INGEST_LOCK_TIMEOUT
+        (3600 seconds).
+        """
+        self.db = db
+        self.mode = mode or os.getenv("INGEST_LOCK_MODE", "skip")
+        if self.mode not in LOCK_MODES:
+            raise ValueError(f"Unknown lock mode {self.mode!r}, expected one of {LOCK_MODES}")
+        self.timeout = (
+            timeout if timeout is not None else int(os.getenv("INGEST_LOCK_TIMEOUT", "3600"))
+        )
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    @staticmethod
+    def lock_name(dataset):
+        """
+        lock_name: Returns the name of a dataset's lock.
+        """
+        return f"metropolitan_ingest_{dataset.name}"
+
+    def request_run(self, dataset):
+        """
+        request_run: Asks the instance holding the lock to run the dataset again.
+        """
+        self.db.execute(
+            f"REPLACE INTO {RUN_REQUEST_TABLE} (dataset, requested_by) VALUES (?, ?)",
+            (dataset.name, self.owner)
+        )
+
+    def take_request(self, dataset):
+        """
+        take_request: Removes a handed off run of the dataset & returns whether there was one.
+        """
+        return self.db.execute(
+            f"DELETE FROM {RUN_REQUEST_TABLE} WHERE dataset = ?", (dataset.name,)
+        ) > 0
+
+    def has_request(self, dataset):
+        """
+        has_request: Returns whether a run of the dataset was handed off.
+        """
+        return bool(self.db.query(
+            f"SELECT 1 FROM {RUN_REQUEST_TABLE} WHERE dataset = ?", (dataset.name,)
+        ))
+
+    def run(self, dataset, func):
+        """
+        run: Calls func() under the dataset's lock & returns its result, or 0
+        when the run was skipped or handed off. Runs handed off meanwhile are
+        done before the lock is released; one handed off while it was being
+        released is done by taking the lock again.
+        """
+        name = self.lock_name(dataset)
+        if not self.db.lock(name, self.timeout if self.mode == "wait" else 0):
+            if self.mode != "handoff":
+                print(f"{dataset.name} is being ingested by another instance, skipping it")
+                return 0
+            self.request_run(dataset)
+            # The holder may have finished between the two steps, then run it here
+            if not self.db.lock(name, 0):
+                print(f"{dataset.name} is being ingested by another instance, handed the run off")
+                return 0
+        processed = 0
+        while True:
+            try:
+                self.take_request(dataset)
+                processed += func()
+                while self.take_request(dataset):
+                    print(f"Running {dataset.name} again, handed off by another instance")
+                    processed += func()
+            finally:
+                self.db.unlock(name)
+            # The requester may have found the lock still taken just before it was released
+            if not self.has_request(dataset) or not self.db.lock(name, 0):
+                return processed
+            print(f"Running {dataset.name} again, handed off while releasing the lock")
@@ -0,0 +1,81 @@
+"""
+Scheduler.py: Minimal in-process scheduler used by the ingester's daemon mode.
+"""
+
+import threading
+import time
+
+
+class Job:
+    """
+    Job class: A named function run every `interval` seconds.
+    """
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, name, interval, func, next_run):
+        """
+        __init__: Declares the job & when it first runs.
+        """
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.next_run = next_run
+
+
+class Scheduler:
+    """
+    Scheduler class: Runs jobs one at a time when they are due. Jobs are
+    rescheduled from when they finish, so a slow run is never overlapped
+    by the next one.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        """
+        __init__: Initializes an empty schedule.
+        """
+        self.clock = clock
+        self.jobs = []
+
+    def every(self, name, interval, func, run_now=True):
+        """
+        every: Schedules `func` every `interval` seconds, first run immediately
+        unless `run_now` is False.
+        """
+        first_run = self.clock() if run_now else self.clock() + interval
+        self.jobs.append(Job(name, interval, func, first_run))
+
+    def seconds_until_next(self):
+        """
+        seconds_until_next: Returns how long until the next job is due.
+        """
+        if not self.jobs:
+            return None
+        return max(0, min(job.next_run for job in self.jobs) - self.clock())
+
+    def run_pending(self, stop_event=None):
+        """
+        run_pending: Runs every due job, earliest first. Returns the names run.
+        """
+        ran = []
+        for job in sorted(self.jobs, key=lambda job: job.next_run):
+            if stop_event is not None and stop_event.is_set():
+                break
+            if job.next_run > self.clock():
+                continue
+            try:
+                job.func()
+            except Exception as job_error:
+                print(f"Scheduled job {job.name} failed: {job_error}")
+            job.next_run = self.clock() + job.interval
+            ran.append(job.name)
+        return ran
+
+    def run_forever(self, stop_event=None):
+        """
+        run_forever: Runs jobs as they become due until `stop_event` is set.
+        """
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            self.run_pending(stop_event)
+            wait = self.seconds_until_next()
+            stop_event.wait(wait if wait is not None else 60)
@@ -0,0 +1,477 @@
+"""
+SchemaMigrations.py: Versioned schema owned by the ingester.
+
+Migration 1 creates the tables in their original shape, the same as
+database/scripts/setup.sql, and every later migration upgrades them from
+there, so a fresh database & an old one go through the same steps. A released
+migration is never changed; schema changes go in a new migration. Every step
+is written to be idempotent (IF [NOT] EXISTS), so re-running a migration that
+was interrupted half way is safe.
+
+Usage: python src/DataIngester.py migrate [--dry-run]
+"""
+
+import mariadb
+
+
+MIGRATION_LOCK = "metropolitan_schema_migration"
+
+
+class Sql:
+    """
+    Sql class: A migration step running a single SQL statement.
+    """
+
+    def __init__(self, statement):
+        """
+        __init__: Declares the statement.
+        """
+        self.statement = statement
+
+    def describe(self):
+        """
+        describe: Returns what the step runs, for dry runs & logs.
+        """
+        return self.statement
+
+    def run(self, cursor):
+        """
+        run: Executes the statement.
+        """
+        cursor.execute(self.statement)
+
+
+class AlterTable:
+    """
+    AlterTable class: A migration step altering a table with the least locking
+    the server allows. Changes made in place run with LOCK=NONE, so the backend
+    keeps reading & the ingester keeps writing; changes needing a table copy,
+    such as column type changes, fall back to LOCK=SHARED, which still lets the
+    backend read while writes wait.
+    """
+    fallback = "LOCK=SHARED"
+
+    def __init__(self, table, clauses):
+        """
+        __init__: Declares the table & the ALTER TABLE clauses.
+        """
+        self.table = table
+        self.clauses = clauses
+
+    def sql(self, options="ALGORITHM=INPLACE, LOCK=NONE"):
+        """
+        sql: Returns the ALTER TABLE statement with the given algorithm & lock options.
+        """
+        return f"ALTER TABLE {self.table} {self.clauses}, {options}"
+
+    def describe(self):
+        """
+        describe: Returns what the step runs, for dry runs & logs.
+        """
+        return self.sql()
+
+    def run(self, cursor):
+        """
+        run: Alters the table online, or with the fallback lock if the server
+        can't do this change online.
+        """
+        try:
+            cursor.execute(self.sql())
+        except mariadb.Error as e:
+            print(f"Online ALTER of {self.table} not supported ({e}), "
+                  f"retrying with {self.fallback}")
+            cursor.execute(self.sql(self.fallback))
+
+
+class AddIndex(AlterTable):
+    """
+    AddIndex class: A migration step building an index online, so the backend
+    can keep reading & the ingester keep writing while it is built.
+    """
+    fallback = "ALGORITHM=INPLACE, LOCK=SHARED"
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(self, table, name, columns, unique=False):
+        """
+        __init__: Declares the table, index name, indexed columns & uniqueness.
+        """
+        kind = "UNIQUE KEY" if unique else "KEY"
+        super().__init__(table, f"ADD {kind} IF NOT EXISTS {name} ({', '.join(columns)})")
+        self.name = name
+        self.columns = list(columns)
+        self.unique = unique
+
+
+class Deduplicate:
+    """
+    Deduplicate class: A migration step keeping only the newest row (highest
+    id) per key. Duplicates are looked up in key order through an index on the
+    key column & deleted in batches, each committed on its own, so neither a
+    self-join over the table nor one long transaction is needed.
+    """
+
+    def __init__(self, table, column="jsonid", batch_size=1000):
+        """
+        __init__: Declares the table, the key column & the number of duplicated
+        keys handled per batch. The key column must be indexed.
+        """
+        self.table = table
+        self.column = column
+        self.batch_size = batch_size
+
+    def find_sql(self):
+        """
+        find_sql: Returns the query listing (key, newest id) of the next
+        duplicated keys after a given key.
+        """
+        return (
+            f"SELECT {self.column}, MAX(id) FROM {self.table} WHERE {self.column} > ? "
+            f"GROUP BY {self.column} HAVING COUNT(*) > 1 ORDER BY {self.column} LIMIT ?"
+        )
+
+    def delete_sql(self):
+        """
+        delete_sql: Returns the statement deleting the older rows of one key.
+        """
+        return f"DELETE FROM {self.table} WHERE {self.column} = ? AND id < ?"
+
+    def describe(self):
+        """
+        describe: Returns what the step runs, for dry runs & logs.
+        """
+        return f"{self.find_sql()}; {self.delete_sql()} (batches of {self.batch_size} keys)"
+
+    def run(self, cursor):
+        """
+        run: Deletes the older duplicates batch by batch until none are left.
+        """
+        last_key = -2 ** 31 - 1
+        while True:
+            cursor.execute(self.find_sql(), (last_key, self.batch_size))
+            duplicates = [tuple(row) for row in cursor.fetchall()]
+            if not duplicates:
+                return
+            cursor.executemany(self.delete_sql(), duplicates)
+            cursor.connection.commit()
+            last_key = duplicates[-1][0]
+            if len(duplicates) < self.batch_size:
+                return
+
+
+class When:
+    """
+    When class: Runs its steps only if a condition query returns a true value.
+    Used for changes that have no IF [NOT] EXISTS form, such as partitioning.
+    """
+
+    def __init__(self, condition, steps):
+        """
+        __init__: Declares the condition query & the steps it guards.
+        """
+        self.condition = condition
+        self.steps = [Sql(step) if isinstance(step, str) else step for step in steps]
+
+    def describe(self):
+        """
+        describe: Returns what the step runs, for dry runs & logs.
+        """
+        steps = "\n".join(f"    {step.describe()}" for step in self.steps)
+        return f"WHEN {self.condition}:\n{steps}"
+
+    def run(self, cursor):
+        """
+        run: Evaluates the condition & runs the steps if it holds.
+        """
+        cursor.execute(self.condition)
+        row = cursor.fetchone()
+        if row and row[0]:
+            for step in self.steps:
+                step.run(cursor)
+
+
+class Migration:
+    """
+    Migration class: One schema version & the ordered steps that reach it.
+    """
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, version, description, steps):
+        """
+        __init__: Declares the version number, a short description & its steps.
+        Plain strings are treated as Sql steps.
+        """
+        self.version = version
+        self.description = description
+        self.steps = [Sql(step) if isinstance(step, str) else step for step in steps]
+
+
+MIGRATIONS = [
+    # The shape the tables had before the ingester owned its schema
+    Migration(1, "Create dataset tables", [
+        """CREATE TABLE IF NOT EXISTS housing_data (
+        id INT AUTO_INCREMENT PRIMARY KEY COMMENT 'Primary Key',
+        jsonid INT DEFAULT 0 COMMENT 'JSON ID',
+        census_metropolitan_area VARCHAR(255) COMMENT 'Census Metropolitan Area',
+        month INT DEFAULT NULL COMMENT 'Month',
+        total_starts INT DEFAULT 0 COMMENT 'Total Starts',
+        total_complete INT DEFAULT 0 COMMENT 'Total Complete',
+        singles_starts INT DEFAULT 0 COMMENT 'Singles Starts',
+        semis_starts INT DEFAULT 0 COMMENT 'Semis Starts',
+        row_starts INT DEFAULT 0 COMMENT 'Row Starts',
+        apartment_starts INT DEFAULT 0 COMMENT 'Apartment Starts',
+        singles_complete INT DEFAULT 0 COMMENT 'Singles Complete',
+        semis_complete INT DEFAULT 0 COMMENT 'Semis Complete',
+        row_complete INT DEFAULT 0 COMMENT 'Row Complete',
+        apartment_complete INT DEFAULT 0 COMMENT 'Apartment Complete'
+        )""",
+        """CREATE TABLE IF NOT EXISTS labour_market_data (
+        id INT AUTO_INCREMENT PRIMARY KEY COMMENT 'Primary Key',
+        jsonid INT DEFAULT 0 COMMENT 'JSON ID',
+        province INT DEFAULT 0 COMMENT 'Province',
+        education_level INT DEFAULT 0 COMMENT 'Education Level',
+        labour_force_status INT DEFAULT 0 COMMENT 'Labour Force Status'
+        )""",
+    ]),
+    Migration(2, "Right-size column types, add the CMA dictionary & secondary indexes", [
+        """CREATE TABLE IF NOT EXISTS cma_dictionary (
+        id SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY COMMENT 'Primary Key',
+        name VARCHAR(64) NOT NULL COMMENT 'Name',
+        UNIQUE KEY uq_cma_dictionary_name (name)
+        )""",
+        # The backend can create the tables itself (Hibernate ddl-auto) without jsonid
+        AlterTable("housing_data", "ADD COLUMN IF NOT EXISTS jsonid INT NOT NULL DEFAULT 0 "
+                                   "COMMENT 'JSON ID' AFTER id"),
+        AlterTable("labour_market_data", "ADD COLUMN IF NOT EXISTS jsonid INT NOT NULL DEFAULT 0 "
+                                         "COMMENT 'JSON ID' AFTER id"),
+        # Older versions inserted a new row whenever a record changed upstream;
+        # keep the newest row per jsonid so the natural key can be unique.
+        AddIndex("housing_data", "idx_housing_data_jsonid", ["jsonid"]),
+        Deduplicate("housing_data"),
+        AddIndex("labour_market_data", "idx_labour_market_data_jsonid", ["jsonid"]),
+        Deduplicate("labour_market_data"),
+        AlterTable("housing_data", ",\n        ".join([
+            "MODIFY jsonid INT NOT NULL DEFAULT 0 COMMENT 'JSON ID'",
+            "MODIFY census_metropolitan_area VARCHAR(64) NOT NULL DEFAULT '' "
+            "COMMENT 'Census Metropolitan Area'",
+            "MODIFY month TINYINT UNSIGNED DEFAULT NULL COMMENT 'Month'",
+            "ADD COLUMN IF NOT EXISTS year SMALLINT UNSIGNED NOT NULL DEFAULT 0 "
+            "COMMENT 'Year' AFTER month",
+            "ADD COLUMN IF NOT EXISTS cma_id SMALLINT UNSIGNED DEFAULT NULL "
+            "COMMENT 'cma_dictionary id'",
+        ])),
+        """INSERT IGNORE INTO cma_dictionary (name)
+        SELECT DISTINCT census_metropolitan_area FROM housing_data""",
+        """UPDATE housing_data h JOIN cma_dictionary c ON c.name = h.census_metropolitan_area
+        SET h.cma_id = c.id WHERE h.cma_id IS NULL""",
+        AddIndex("housing_data", "uq_housing_data_key", ["jsonid"], unique=True),
+        AlterTable("housing_data", "DROP KEY IF EXISTS idx_housing_data_jsonid"),
+        AddIndex("housing_data", "idx_housing_data_cma_totals",
+                 ["census_metropolitan_area", "total_starts", "total_complete"]),
+        AddIndex("housing_data", "idx_housing_data_cma_id_period", ["cma_id", "year", "month"]),
+        AlterTable("labour_market_data", ",\n        ".join([
+            "MODIFY jsonid INT NOT NULL DEFAULT 0 COMMENT 'JSON ID'",
+            "MODIFY province TINYINT UNSIGNED DEFAULT 0 COMMENT 'Province'",
+            "MODIFY education_level TINYINT UNSIGNED DEFAULT 0 COMMENT 'Education Level'",
+            "MODIFY labour_force_status TINYINT UNSIGNED DEFAULT 0 "
+            "COMMENT 'Labour Force Status'",
+        ])),
+        AddIndex("labour_market_data", "uq_labour_market_data_key", ["jsonid"], unique=True),
+        AlterTable("labour_market_data", "DROP KEY IF EXISTS idx_labour_market_data_jsonid"),
+        AddIndex("labour_market_data", "idx_labour_market_data_prov_status_educ",
+                 ["province", "labour_force_status", "education_level"]),
+        AddIndex("labour_market_data", "idx_labour_market_data_educ_status",
+                 ["education_level", "labour_force_status"]),
+    ]),
+    Migration(3, "Add the data_version table", [
+        """CREATE TABLE IF NOT EXISTS data_version (
+        dataset VARCHAR(32) NOT NULL COMMENT 'Dataset',
+        scope VARCHAR(64) NOT NULL DEFAULT '' COMMENT 'CMA name, empty for the whole dataset',
+        version BIGINT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'Version',
+        changed_rows INT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'Rows changed by the last bump',
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+            COMMENT 'Updated At',
+        PRIMARY KEY (dataset, scope)
+        )""",
+    ]),
+    # Filled per CMA by the next runs, or at once with the refresh-combined command
+    Migration(4, "Add the combined_stats table", [
+        """CREATE TABLE IF NOT EXISTS combined_stats (
+        census_metropolitan_area VARCHAR(64) NOT NULL COMMENT 'Census Metropolitan Area',
+        year SMALLINT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'Year',
+        month TINYINT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'Month',
+        education_level TINYINT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'Education Level',
+        province TINYINT UNSIGNED DEFAULT NULL COMMENT 'Province',
+        total_starts INT DEFAULT 0 COMMENT 'Total Starts',
+        total_complete INT DEFAULT 0 COMMENT 'Total Complete',
+        employed INT DEFAULT 0 COMMENT 'Employed',
+        unemployed INT DEFAULT 0 COMMENT 'Unemployed',
+        not_in_labour_force INT DEFAULT 0 COMMENT 'Not in Labour Force',
+        PRIMARY KEY (census_metropolitan_area, year, month, education_level)
+        )""",
+    ]),
+    Migration(5, "Add the ingest_work queue", [
+        """CREATE TABLE IF NOT EXISTS ingest_work (
+        id INT AUTO_INCREMENT PRIMARY KEY COMMENT 'Primary Key',
+        dataset VARCHAR(32) NOT NULL COMMENT 'Dataset',
+        after_date DATE NOT NULL COMMENT 'First day of the window',
+        before_date DATE NOT NULL COMMENT 'Day after the window',
+        position INT NOT NULL DEFAULT 0 COMMENT 'Claim order',
+        status ENUM('pending', 'leased', 'done', 'failed') NOT NULL DEFAULT 'pending'
+            COMMENT 'Status',
+        owner VARCHAR(128) DEFAULT NULL COMMENT 'Replica holding the lease',
+        lease_until DATETIME DEFAULT NULL COMMENT 'Lease expiry',
+        attempts INT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'Claims so far',
+        processed INT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'Rows stored',
+        error VARCHAR(255) DEFAULT NULL COMMENT 'Last error',
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+            COMMENT 'Updated At',
+        UNIQUE KEY uq_ingest_work_window (dataset, after_date, before_date),
+        KEY idx_ingest_work_claim (status, position)
+        )""",
+    ]),
+    Migration(6, "Add the run_request table", [
+        """CREATE TABLE IF NOT EXISTS run_request (
+        dataset VARCHAR(32) NOT NULL PRIMARY KEY COMMENT 'Dataset',
+        requested_by VARCHAR(128) DEFAULT NULL COMMENT 'Instance handing the run off',
+        requested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT 'Requested At'
+        )""",
+    ]),
+]
+
+
+class SchemaMigrator:
+    """
+    SchemaMigrator class: Applies pending migrations in version order &
+    records each applied version in the schema_version table. Concurrent
+    ingesters are serialized with a named lock, and a dry run only prints
+    what would be applied.
+    """
+
+    def __init__(self, conn, migrations=None, dry_run=False, lock_timeout=60):
+        """
+        __init__: Initializes the migrator for an open connection.
+        """
+        self.conn = conn
+        self.migrations = sorted(migrations or MIGRATIONS, key=lambda m: m.version)
+        self.dry_run = dry_run
+        self.lock_timeout = lock_timeout
+
+    def ensure_version_table(self):
+        """
+        ensure_version_table: Creates the schema_version table if it doesn't exist.
+        """
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INT PRIMARY KEY COMMENT 'Schema Version',
+                    description VARCHAR(255) COMMENT 'Description',
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT 'Applied At'
+                )
+                """
+            )
+            self.conn.commit()
+        finally:
+            cursor.close()
+
+    def current_version(self):
+        """
+        current_version: Returns the highest applied version, 0 for a new database.
+        """
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("SELECT MAX(version) FROM schema_version")
+            row = cursor.fetchone()
+            return row[0] if row and row[0] is not None else 0
+        except mariadb.Error:
+            if not self.dry_run:
+                raise
+            # A dry run doesn't create schema_version, so it may not exist yet
+            return 0
+        finally:
+            cursor.close()
+
+    def pending(self):
+        """
+        pending: Returns the migrations newer than the current version.
+        """
+        current = self.current_version()
+        return [migration for migration in self.migrations if migration.version > current]
+
+    def acquire_lock(self):
+        """
+        acquire_lock: Takes the migration lock so only one ingester migrates at a time.
+        """
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("SELECT GET_LOCK(?, ?)", (MIGRATION_LOCK, self.lock_timeout))
+            row = cursor.fetchone()
+            return bool(row and row[0] == 1)
+        finally:
+            cursor.close()
+
+    def release_lock(self):
+        """
+        release_lock: Releases the migration lock.
+        """
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("SELECT RELEASE_LOCK(?)", (MIGRATION_LOCK,))
+            cursor.fetchone()
+        finally:
+            cursor.close()
+
+    def apply(self, migration):
+        """
+        apply: Runs a migration's steps in order & records its version.
+        """
+        if self.dry_run:
+            print(f"[dry-run] Would apply schema migration {migration.version}: "
+                  f"{migration.description}")
+            for step in migration.steps:
+                print(f"[dry-run]   {step.describe()}")
+            return
+        cursor = self.conn.cursor()
+        try:
+            for step in migration.steps:
+                step.run(cursor)
+            cursor.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (migration.version, migration.description)
+            )
+            self.conn.commit()
+            print(f"Applied schema migration {migration.version}: {migration.description}")
+        finally:
+            cursor.close()
+
+    def migrate(self):
+        """
+        migrate: Brings the schema up to date. Stops at the first failing
+        migration & re-raises its error, so later ones never run against an
+        unexpected schema & the caller doesn't carry on with it. Returns the
+        list of applied (or, in a dry run, pending) versions.
+        """
+        applied = []
+        locked = False
+        try:
+            if not self.dry_run:
+                locked = self.acquire_lock()
+                if not locked:
+                    print("Timed out waiting for the schema migration lock")
+                    return applied
+                self.ensure_version_table()
+            # Read pending versions after taking the lock, another ingester may have migrated
+            for migration in self.pending():
+                self.apply(migration)
+                applied.append(migration.version)
+        except mariadb.Error as e:
+            print(f"Error applying schema migrations: {e}")
+            self.conn.rollback()
+            raise
+        finally:
+            if locked:
+                self.release_lock()
+        if not applied:
+            print("Schema is up to date")
+        return applied
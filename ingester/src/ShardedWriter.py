@@ -0,0 +1,149 @@
+"""
+ShardedWriter.py: Parallel database write stage.
+Rows are sharded by a hash of their natural key across N writer threads, each
+writing through its own pooled connection, so no two writers ever touch the
+same rows and commits don't serialize on a single connection.
+"""
+
+import queue
+import threading
+import zlib
+
+STOP = object()
+
+
+class ShardedWriter:
+    """
+    ShardedWriter class: Buffers rows per shard, writes full batches on the
+    shard's thread & accounts for every batch per dataset.
+    """
+    # pylint: disable=too-many-instance-attributes,too-many-arguments,too-many-positional-arguments
+
+    def __init__(self, db, shards=4, batch_size=1000, on_error=None, queue_size=8,
+                 on_written=None):
+        """
+        __init__: Initializes the writer for a storage backend. `on_error` is called
+        as on_error(dataset, records, error) from the writer thread when a batch fails,
+        `on_written` as on_written(dataset, rows) when one was stored.
+        """
+        self.db = db
+        self.shards = max(1, shards)
+        self.batch_size = batch_size
+        self.on_error = on_error
+        self.on_written = on_written
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(self.shards)]
+        self.buffers = [{} for _ in range(self.shards)]
+        self.threads = []
+        self.lock = threading.Lock()
+        self.summary = {}
+
+    def start(self):
+        """
+        start: Starts one writer thread per shard.
+        """
+        for shard in range(self.shards):
+            thread = threading.Thread(
+                target=self._run, args=(shard,), name=f"writer-{shard}", daemon=True
+            )
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def shard_of(self, dataset, row):
+        """
+        shard_of: Returns the shard a row belongs to, stable across runs.
+        """
+        return zlib.crc32(repr(dataset.key_of(row)).encode()) % self.shards
+
+    def submit(self, dataset, rows, records=None):
+        """
+        submit: Queues rows (and the API records they came from, for dead-lettering)
+        to their shards. Shards with a full buffer hand a batch to their thread.
+        Blocks when a shard's thread is too far behind, bounding memory.
+        """
+        if records is None:
+            records = [None] * len(rows)
+        for row, record in zip(rows, records):
+            shard = self.shard_of(dataset, row)
+            pending = self.buffers[shard].setdefault(dataset.name, (dataset, [], []))
+            pending[1].append(row)
+            pending[2].append(record)
+            if len(pending[1]) >= self.batch_size:
+                self._dispatch(shard, dataset.name)
+
+    def _dispatch(self, shard, name):
+        """
+        _dispatch: Hands a shard's buffered rows for one dataset to its thread.
+        """
+        dataset, rows, records = self.buffers[shard].pop(name)
+        self.queues[shard].put((dataset, rows, records))
+
+    def flush(self):
+        """
+        flush: Hands every partially filled buffer to its thread.
+        """
+        for shard in range(self.shards):
+            for name in list(self.buffers[shard]):
+                self._dispatch(shard, name)
+
+    def _run(self, shard):
+        """
+        _run: Writer thread loop, writes batches until told to stop.
+        """
+        work = self.queues[shard]
+        while True:
+            item = work.get()
+            if item is STOP:
+                return
+            dataset, rows, records = item
+            try:
+                written = self.db.insert_rows(dataset, rows)
+            except Exception as write_error:
+                self._record(dataset, failed=len(rows))
+                self._callback(self.on_error, dataset, records, write_error)
+                continue
+            self._record(dataset, written=written)
+            self._callback(self.on_written, dataset, rows)
+
+    @staticmethod
+    def _callback(callback, dataset, *args):
+        """
+        _callback: Calls on_error or on_written, if set. Their errors are only
+        logged: a writer thread that died would leave its queue to fill up &
+        block submit() forever.
+        """
+        if callback is None:
+            return
+        try:
+            callback(dataset, *args)
+        except Exception as callback_error:
+            print(f"Error in writer callback {getattr(callback, '__name__', callback)} "
+                  f"for {dataset.name} batch: {callback_error}")
+
+    def _record(self, dataset, written=0, failed=0):
+        """
+        _record: Accounts for a finished batch.
+        """
+        with self.lock:
+            totals = self.summary.setdefault(
+                dataset.name, {"written": 0, "failed": 0, "batches": 0}
+            )
+            totals["written"] += written
+            totals["failed"] += failed
+            totals["batches"] += 1
+
+    def close(self):
+        """
+        close: Flushes the buffers, waits for every batch to finish & returns
+        the per-dataset summary.
+        """
+        self.flush()
+        for work in self.queues:
+            work.put(STOP)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        with self.lock:
+            summary = {name: dict(totals) for name, totals in self.summary.items()}
+        print(f"Sharded writes: shards={self.shards}, {summary}")
+        return summary
@@ -0,0 +1,200 @@
+"""
+SnapshotWriter.py: Columnar Parquet snapshots of the ingested datasets.
+Every stored batch is also appended to zstd-compressed Parquet files laid out
+as <dataset>/<period>/part-*.parquet, where the period is the partition
+column (e.g. year=2024) or, for datasets without one, the month the rows were
+ingested (e.g. ingested=2024-03).
+Analysts scan these files instead of querying the tables the backend serves.
+Each run only adds new part files; compact() folds a dataset's parts keeping
+the newest version of every natural key, in the period of that version.
+
+Requires pyarrow; without it snapshots are disabled & the ingester runs as before.
+"""
+
+import glob
+import os
+import threading
+from datetime import datetime, timezone
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+ARROW_TYPES = [
+    # Checked in order, so the most specific SQL type prefixes come first
+    ("TINYINT UNSIGNED", "uint8"),
+    ("SMALLINT UNSIGNED", "uint16"),
+    ("TINYINT", "int8"),
+    ("SMALLINT", "int16"),
+    ("INT", "int32"),
+    ("VARCHAR", "string"),
+]
+
+
+def arrow_type(sql_type):
+    """
+    arrow_type: Returns the Arrow type matching a column's SQL type.
+    """
+    for prefix, type_name in ARROW_TYPES:
+        if sql_type.upper().startswith(prefix):
+            return getattr(pa, type_name)()
+    raise ValueError(f"No Arrow type for SQL type {sql_type}")
+
+
+class SnapshotWriter:
+    """
+    SnapshotWriter class: Buffers stored rows per dataset & period and writes
+    them as Parquet part files on flush().
+    """
+
+    def __init__(self, directory=None, flush_rows=100000, compression="zstd"):
+        """
+        __init__: Initializes the writer. The directory defaults to the
+        SNAPSHOT_DIR environment variable, or "snapshots"; an empty
+        SNAPSHOT_DIR disables snapshots.
+        """
+        self.directory = (
+            directory if directory is not None else os.getenv("SNAPSHOT_DIR", "snapshots")
+        )
+        self.flush_rows = flush_rows
+        self.compression = compression
+        self.enabled = bool(self.directory) and pa is not None
+        if self.directory and pa is None:
+            print("pyarrow is not installed, Parquet snapshots are disabled")
+        self.pending = {}
+        self.buffered = 0
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def schema(dataset):
+        """
+        schema: Returns the Arrow schema of a dataset's rows.
+        """
+        return pa.schema([(field.column, arrow_type(field.sql_type)) for field in dataset.fields])
+
+    @staticmethod
+    def period_of(dataset, row, ingested):
+        """
+        period_of: Returns the directory name of the period a row belongs to,
+        its partition or else `ingested`, the month it was ingested in.
+        """
+        if dataset.partitioning:
+            return f"{dataset.partitioning.column}={row[dataset.partition_index]}"
+        return f"ingested={ingested}"
+
+    def add(self, dataset, rows):
+        """
+        add: Queues rows that were stored in the database. Writes the buffers
+        once more than `flush_rows` rows are queued.
+        """
+        if not self.enabled or not rows:
+            return
+        ingested = datetime.now(timezone.utc).strftime("%Y-%m")
+        with self.lock:
+            for row in rows:
+                period = self.period_of(dataset, row, ingested)
+                self.pending.setdefault((dataset, period), []).append(row)
+            self.buffered += len(rows)
+            full = self.buffered >= self.flush_rows
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        flush: Writes every buffered dataset & period as a new part file.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            batches = self.pending
+            self.pending = {}
+            self.buffered = 0
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        for (dataset, period), rows in batches.items():
+            with self.lock:
+                self.sequence += 1
+                name = f"part-{stamp}-{os.getpid()}-{self.sequence:04d}.parquet"
+            self.write(dataset, os.path.join(self.directory, dataset.name, period, name), rows)
+        if batches:
+            print(f"Wrote {len(batches)} Parquet snapshot parts to {self.directory}")
+
+    def write(self, dataset, path, rows):
+        """
+        write: Atomically writes rows as one Parquet file.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        schema = self.schema(dataset)
+        columns = list(zip(*rows))
+        table = pa.Table.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+            schema=schema,
+        )
+        tmp_path = f"{path}.tmp"
+        pq.write_table(table, tmp_path, compression=self.compression)
+        os.replace(tmp_path, path)
+
+    def parts(self, dataset, period="*"):
+        """
+        parts: Returns a dataset's part files, oldest first.
+        """
+        return sorted(
+            glob.glob(os.path.join(self.directory, dataset.name, period, "part-*.parquet")),
+            key=os.path.basename,
+        )
+
+    def fold(self, dataset, paths):
+        """
+        fold: Rewrites part files, oldest first, keeping the newest version of
+        every natural key in the period it was written to; each period keeps
+        one part, named like its newest. Returns the number of rows kept.
+        """
+        latest = {}
+        newest = {}
+        for path in paths:
+            period_dir = os.path.dirname(path)
+            newest[period_dir] = path
+            for row in zip(*pq.read_table(path).to_pydict().values()):
+                latest[dataset.key_of(row)] = (period_dir, row)
+        periods = {}
+        for period_dir, row in latest.values():
+            periods.setdefault(period_dir, []).append(row)
+        # Replace the newest parts first so readers never miss rows, only
+        # briefly see duplicates until the older parts are removed
+        for period_dir, rows in periods.items():
+            self.write(dataset, newest[period_dir], rows)
+        for path in paths:
+            if path != newest.get(os.path.dirname(path)) or os.path.dirname(path) not in periods:
+                os.remove(path)
+        for period_dir in newest:
+            if not os.listdir(period_dir):
+                os.rmdir(period_dir)
+        return len(latest)
+
+    def compact(self, dataset):
+        """
+        compact: Folds a dataset's part files, see fold(). Partitions are
+        folded one at a time, as a key never moves between them; ingest
+        periods are folded together, as a key ingested again in a later month
+        has a copy in each. Returns the number of rows kept.
+        """
+        if not self.enabled:
+            return 0
+        self.flush()
+        if dataset.partitioning:
+            periods = sorted({os.path.dirname(path) for path in self.parts(dataset)})
+            groups = [self.parts(dataset, os.path.basename(period)) for period in periods]
+        else:
+            groups = [self.parts(dataset)]
+        kept = 0
+        for paths in groups:
+            if len(paths) < 2:
+                kept += sum(pq.read_metadata(path).num_rows for path in paths)
+                continue
+            kept += self.fold(dataset, paths)
+        print(f"Compacted {dataset.name} snapshots: {kept} rows")
+        return kept
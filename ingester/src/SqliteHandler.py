@@ -0,0 +1,445 @@
+"""
+SqliteHandler.py: Embedded SQLite storage backend.
+Stores the registered datasets in a local file (SQLITE_PATH, default
+"metropolitan.db") with the same batched upserts, dictionary ids & data
+versions as the MariaDB backend, so ingestion can run & be measured without a
+database server. Select it with DB_BACKEND=sqlite.
+"""
+
+import fcntl
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from src.DatasetRegistry import COMBINED_STATS, DATA_VERSIONS, DATASETS
+from src.StorageBackend import StorageBackend
+
+
+# (version, description, statements) applied in order & recorded in
+# schema_version, as SchemaMigrations does for MariaDB. A released migration is
+# never changed; schema changes go in a new one.
+SQLITE_MIGRATIONS = [
+    (1, "Create the schema", [
+        "CREATE TABLE IF NOT EXISTS cma_dictionary "
+        "(id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE)",
+        "CREATE TABLE IF NOT EXISTS data_version (dataset TEXT NOT NULL, "
+        "scope TEXT NOT NULL DEFAULT '', version INTEGER NOT NULL DEFAULT 0, "
+        "changed_rows INTEGER NOT NULL DEFAULT 0, "
+        "updated_at TEXT DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (dataset, scope))",
+        "CREATE TABLE IF NOT EXISTS combined_stats (census_metropolitan_area TEXT NOT NULL, "
+        "year INTEGER NOT NULL DEFAULT 0, month INTEGER NOT NULL DEFAULT 0, "
+        "education_level INTEGER NOT NULL DEFAULT 0, province INTEGER DEFAULT NULL, "
+        "total_starts INTEGER DEFAULT 0, total_complete INTEGER DEFAULT 0, "
+        "employed INTEGER DEFAULT 0, unemployed INTEGER DEFAULT 0, "
+        "not_in_labour_force INTEGER DEFAULT 0, "
+        "PRIMARY KEY (census_metropolitan_area, year, month, education_level))",
+        "CREATE TABLE IF NOT EXISTS run_request (dataset TEXT NOT NULL PRIMARY KEY, "
+        "requested_by TEXT DEFAULT NULL, requested_at TEXT DEFAULT CURRENT_TIMESTAMP)",
+        "CREATE TABLE IF NOT EXISTS housing_data (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+        "jsonid INT NOT NULL DEFAULT 0, census_metropolitan_area VARCHAR(64) NOT NULL DEFAULT '', "
+        "month TINYINT UNSIGNED DEFAULT NULL, year SMALLINT UNSIGNED NOT NULL DEFAULT 0, "
+        "total_starts INT DEFAULT 0, total_complete INT DEFAULT 0, singles_starts INT DEFAULT 0, "
+        "semis_starts INT DEFAULT 0, row_starts INT DEFAULT 0, apartment_starts INT DEFAULT 0, "
+        "singles_complete INT DEFAULT 0, semis_complete INT DEFAULT 0, "
+        "row_complete INT DEFAULT 0, apartment_complete INT DEFAULT 0, "
+        "cma_id INTEGER DEFAULT NULL, UNIQUE (jsonid))",
+        "CREATE INDEX IF NOT EXISTS idx_housing_data_cma_totals "
+        "ON housing_data (census_metropolitan_area, total_starts, total_complete)",
+        "CREATE INDEX IF NOT EXISTS idx_housing_data_cma_id_period "
+        "ON housing_data (cma_id, year, month)",
+        "CREATE TABLE IF NOT EXISTS labour_market_data (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+        "jsonid INT NOT NULL DEFAULT 0, province TINYINT UNSIGNED DEFAULT 0, "
+        "education_level TINYINT UNSIGNED DEFAULT 0, "
+        "labour_force_status TINYINT UNSIGNED DEFAULT 0, UNIQUE (jsonid))",
+        "CREATE INDEX IF NOT EXISTS idx_labour_market_data_prov_status_educ "
+        "ON labour_market_data (province, labour_force_status, education_level)",
+        "CREATE INDEX IF NOT EXISTS idx_labour_market_data_educ_status "
+        "ON labour_market_data (education_level, labour_force_status)",
+    ]),
+]
+
+
+class BitXor:
+    """
+    BitXor class: SQLite aggregate matching MariaDB's BIT_XOR.
+    """
+
+    def __init__(self):
+        """
+        __init__: Starts from 0 like BIT_XOR over no rows.
+        """
+        self.value = 0
+
+    def step(self, value):
+        """
+        step: XORs in one value.
+        """
+        if value is not None:
+            self.value ^= value
+
+    def finalize(self):
+        """
+        finalize: Returns the aggregate.
+        """
+        return self.value
+
+
+def concat_ws(separator, *values):
+    """
+    concat_ws: SQLite function matching MariaDB's CONCAT_WS, which skips NULLs.
+    """
+    return separator.join(str(value) for value in values if value is not None)
+
+
+def crc32(value):
+    """
+    crc32: SQLite function matching MariaDB's CRC32 of a UTF-8 string.
+    """
+    return None if value is None else zlib.crc32(str(value).encode("utf-8"))
+
+
+class SqliteHandler(StorageBackend):
+    """
+    SqliteHandler class: StorageBackend on a single SQLite connection. Writers
+    are serialized with a lock, as SQLite allows one writer at a time anyway.
+    """
+
+    def __init__(self, connect, path=None, migrate_on_connect=True):
+        """
+        __init__: Initializes the handler & opens the database file if `connect`.
+        """
+        self.path = path or os.getenv("SQLITE_PATH", "metropolitan.db")
+        self.migrate_on_connect = migrate_on_connect
+        self.conn = None
+        self.write_lock = threading.Lock()
+        self.lock_files = {}
+        if connect:
+            self.connect()
+
+    def connect(self):
+        """
+        connect: Opens the database file, registers the MariaDB-compatible
+        checksum functions & creates the schema.
+        """
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.create_function("CRC32", 1, crc32, deterministic=True)
+        self.conn.create_function("CONCAT_WS", -1, concat_ws, deterministic=True)
+        self.conn.create_aggregate("BIT_XOR", 1, BitXor)
+        print(f"Opened SQLite database {self.path}")
+        if self.migrate_on_connect:
+            self.migrate()
+            self.maintain_keys()
+
+    @staticmethod
+    def create_table_sql(dataset, table=None):
+        """
+        create_table_sql: Returns a dataset's CREATE TABLE statement in SQLite's
+        dialect, for its table or another name.
+        """
+        definitions = ["id INTEGER PRIMARY KEY AUTOINCREMENT"]
+        definitions += [f"{field.column} {field.sql_type}" for field in dataset.fields]
+        definitions += [
+            f"{dictionary.id_column} INTEGER DEFAULT NULL"
+            for _, dictionary in dataset.dictionary_fields
+        ]
+        definitions.append(f"UNIQUE ({', '.join(dataset.natural_key)})")
+        return f"CREATE TABLE IF NOT EXISTS {table or dataset.table} ({', '.join(definitions)})"
+
+    @staticmethod
+    def create_indexes_sql(dataset):
+        """
+        create_indexes_sql: Returns the statements creating a dataset's secondary indexes.
+        """
+        return [
+            f"CREATE INDEX IF NOT EXISTS {name} ON {dataset.table} ({', '.join(columns)})"
+            for name, columns in dataset.indexes.items()
+        ]
+
+    def current_version(self):
+        """
+        current_version: Returns the highest applied migration, 0 for a new file.
+        """
+        row = self.conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'"
+        ).fetchone()
+        if row is None:
+            return 0
+        return self.conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0] or 0
+
+    def migrate(self, dry_run=False):
+        """
+        migrate: Applies the pending SQLITE_MIGRATIONS in version order & records
+        each in schema_version. The file's write lock is held throughout, so
+        concurrent ingesters migrate one at a time & a failed migration leaves
+        nothing applied. Returns the list of applied (or, in a dry run,
+        pending) versions.
+        """
+        with self.write_lock:
+            if dry_run:
+                current = self.current_version()
+                pending = [migration for migration in SQLITE_MIGRATIONS if migration[0] > current]
+                for version, description, statements in pending:
+                    print(f"[dry-run] Would apply schema migration {version}: {description}")
+                    for statement in statements:
+                        print(f"[dry-run]   {statement}")
+                return [version for version, _, _ in pending]
+            applied = []
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute(
+                    "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, "
+                    "description TEXT, applied_at TEXT DEFAULT CURRENT_TIMESTAMP)"
+                )
+                # Read the version under the lock, another ingester may have migrated
+                current = self.current_version()
+                for version, description, statements in SQLITE_MIGRATIONS:
+                    if version <= current:
+                        continue
+                    for statement in statements:
+                        self.conn.execute(statement)
+                    self.conn.execute(
+                        "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                        (version, description)
+                    )
+                    applied.append((version, description))
+                self.conn.commit()
+            except sqlite3.Error as e:
+                print(f"Error applying schema migrations: {e}")
+                self.conn.rollback()
+                raise
+        for version, description in applied:
+            print(f"Applied schema migration {version}: {description}")
+        if not applied:
+            print("Schema is up to date")
+        return [version for version, _ in applied]
+
+    def stored_key(self, table):
+        """
+        stored_key: Returns the columns of a table's UNIQUE constraint, None
+        if the table doesn't have one.
+        """
+        for _, name, unique, origin, _ in self.conn.execute(f"PRAGMA index_list({table})"):
+            if unique and origin == "u":
+                columns = sorted(self.conn.execute(f"PRAGMA index_info({name})"))
+                return tuple(column for _, _, column in columns)
+        return None
+
+    def rekey_table(self, dataset):
+        """
+        rekey_table: Rebuilds a dataset's table if its natural key changed in
+        the registry, e.g. once HOUSING_YEAR_FIELD is set, as SQLite can't alter
+        a UNIQUE constraint. Rows keep their ids; if the key got narrower, the
+        newest row per key is kept. Returns whether the table was rebuilt.
+        """
+        with self.write_lock:
+            stored = self.stored_key(dataset.table)
+            if stored is None or stored == tuple(dataset.natural_key):
+                return False
+            print(f"Rebuilding {dataset.table} with natural key {', '.join(dataset.natural_key)}")
+            rebuilt = f"{dataset.table}_rekeyed"
+            stored_columns = {row[1] for row in self.conn.execute(
+                f"PRAGMA table_info({dataset.table})")}
+            columns = ", ".join(
+                column for column in ("id", *dataset.columns, *(
+                    dictionary.id_column for _, dictionary in dataset.dictionary_fields))
+                if column in stored_columns
+            )
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute(f"DROP TABLE IF EXISTS {rebuilt}")
+                self.conn.execute(self.create_table_sql(dataset, rebuilt))
+                self.conn.execute(
+                    f"INSERT OR REPLACE INTO {rebuilt} ({columns}) "
+                    f"SELECT {columns} FROM {dataset.table} ORDER BY id"
+                )
+                self.conn.execute(f"DROP TABLE {dataset.table}")
+                self.conn.execute(f"ALTER TABLE {rebuilt} RENAME TO {dataset.table}")
+                for statement in self.create_indexes_sql(dataset):
+                    self.conn.execute(statement)
+                self.conn.commit()
+            except sqlite3.Error:
+                self.conn.rollback()
+                raise
+            return True
+
+    def maintain_keys(self):
+        """
+        maintain_keys: Rebuilds the tables whose natural key changed since they
+        were created, see rekey_table(). The SQLite counterpart of
+        DatabaseHandler.maintain_partitions().
+        """
+        for dataset in DATASETS.values():
+            self.rekey_table(dataset)
+
+    def insert_sql(self, dataset, partition=None):
+        """
+        insert_sql: Returns Dataset.insert_sql() in SQLite's upsert syntax,
+        with the same parameters; SQLite has no partitions to select.
+        """
+        columns = list(dataset.columns)
+        values = ["?" for _ in dataset.columns]
+        for _, dictionary in dataset.dictionary_fields:
+            columns.append(dictionary.id_column)
+            values.append(dictionary.lookup_sql())
+        updated = [column for column in columns if column not in dataset.natural_key]
+        updates = ", ".join(f"{column} = excluded.{column}" for column in updated)
+        # Identical rows are left alone so they don't count as changed
+        current = ", ".join(f"{dataset.table}.{column}" for column in updated)
+        incoming = ", ".join(f"excluded.{column}" for column in updated)
+        return (
+            f"INSERT INTO {dataset.table} ({', '.join(columns)}) VALUES ({', '.join(values)}) "
+            f"ON CONFLICT ({', '.join(dataset.natural_key)}) DO UPDATE SET {updates} "
+            f"WHERE ({current}) IS NOT ({incoming})"
+        )
+
+    def dictionary_insert_sql(self, dictionary):
+        """
+        dictionary_insert_sql: Returns Dictionary.insert_sql() in SQLite's syntax.
+        """
+        return f"INSERT OR IGNORE INTO {dictionary.table} (name) VALUES (?)"
+
+    def bump_sql(self):
+        """
+        bump_sql: Returns DataVersions.bump_sql() in SQLite's upsert syntax.
+        """
+        return (
+            f"INSERT INTO {DATA_VERSIONS.table} (dataset, scope, version, changed_rows) "
+            f"VALUES (?, ?, 1, ?) ON CONFLICT (dataset, scope) DO UPDATE SET "
+            f"version = version + 1, changed_rows = excluded.changed_rows, "
+            f"updated_at = CURRENT_TIMESTAMP"
+        )
+
+    def insert_rows(self, dataset, rows):
+        """
+        insert_rows: Writes a batch in one transaction through the shared
+        StorageBackend.write_rows() path.
+        """
+        if not rows:
+            return 0
+        with self.write_lock, self.conn:
+            cursor = self.conn.cursor()
+            try:
+                self.write_rows(cursor, dataset, rows)
+            finally:
+                cursor.close()
+        return len(rows)
+
+    def is_transient(self, error):
+        """
+        is_transient: Returns whether a write error is another connection holding the file's lock.
+        """
+        return isinstance(error, sqlite3.OperationalError) and "locked" in str(error)
+
+    def delete_keys(self, dataset, keys):
+        """
+        delete_keys: Deletes rows by natural key in one transaction.
+        """
+        if not keys:
+            return 0
+        with self.write_lock, self.conn:
+            self.conn.executemany(dataset.delete_sql(), list(keys))
+        return len(keys)
+
+    def refresh_combined(self, cmas):
+        """
+        refresh_combined: Replaces the combined rows of some CMAs & bumps their
+        versions in one transaction.
+        """
+        if not cmas:
+            return 0
+        cmas = list(cmas)
+        with self.write_lock, self.conn:
+            self.conn.executemany(COMBINED_STATS.delete_sql(), [(cma,) for cma in cmas])
+            refreshed = {}
+            for params in COMBINED_STATS.refresh_params(cmas):
+                cursor = self.conn.execute(COMBINED_STATS.refresh_sql(), params)
+                refreshed[params[1]] = cursor.rowcount
+            self.conn.executemany(self.bump_sql(), COMBINED_STATS.bump_params(refreshed))
+        return len(cmas)
+
+    def query(self, sql, params=()):
+        """
+        query: Runs a read-only statement & returns every row.
+        """
+        with self.write_lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def execute(self, sql, params=()):
+        """
+        execute: Runs & commits one write statement.
+        """
+        with self.write_lock, self.conn:
+            return self.conn.execute(sql, params).rowcount
+
+    def lock(self, name, timeout=0):
+        """
+        lock: Takes an exclusive flock on a lock file next to the database,
+        which the OS releases if the process dies.
+        """
+        # pylint: disable-next=consider-using-with
+        f = open(f"{self.path}.{name}.lock", "a", encoding="utf-8")
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self.lock_files[name] = f
+                return True
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    f.close()
+                    return False
+                time.sleep(min(1.0, max(0.0, deadline - time.monotonic())))
+
+    def unlock(self, name):
+        """
+        unlock: Releases a lock taken with lock().
+        """
+        f = self.lock_files.pop(name, None)
+        if f is not None:
+            fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+
+    def checksum_sql(self, dataset, where=""):
+        """
+        checksum_sql: Returns Dataset.checksum_sql() in SQLite's dialect, which
+        divides integers with / & stores strings as UTF-8 already.
+        """
+        return dataset.checksum_sql(div="/", charset=None, where=where)
+
+    def checksums(self, dataset, bucket_size, where=("", ())):
+        """
+        checksums: Returns {bucket: (count, checksum)} from one set-based aggregate.
+        """
+        condition, params = where
+        sql = self.checksum_sql(dataset, condition)
+        return {
+            bucket: (count, checksum)
+            for bucket, count, checksum in self.query(sql, (bucket_size, *params))
+        }
+
+    def bucket_keys_sql(self, dataset):
+        """
+        bucket_keys_sql: Returns Dataset.bucket_keys_sql() in SQLite's dialect.
+        """
+        return dataset.bucket_keys_sql(div="/")
+
+    def bucket_keys(self, dataset, bucket_size, bucket):
+        """
+        bucket_keys: Returns the natural keys stored in one checksum bucket.
+        """
+        sql = self.bucket_keys_sql(dataset)
+        return [tuple(key) for key in self.query(sql, (bucket_size, bucket))]
+
+    def close(self):
+        """
+        close: Closes the database file.
+        """
+        for name in list(self.lock_files):
+            self.unlock(name)
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+            print("Closed SQLite database\n")
@@ -0,0 +1,211 @@
+"""
+StorageBackend.py: The interface the ingester stores data through.
+DatabaseHandler implements it for MariaDB and SqliteHandler for an embedded
+SQLite file; DB_BACKEND (mariadb or sqlite) picks one, see
+DataIngester.storage_class(). Batches are written by the shared write_rows()
+path, backends only supply their dialect's statements.
+"""
+
+from abc import ABC, abstractmethod
+from src.DatasetRegistry import DATA_VERSIONS
+
+
+class StorageUnavailable(Exception):
+    """
+    StorageUnavailable class: The backend couldn't be reached, as opposed to a
+    batch it refused; the batch can be written again later unchanged.
+    """
+
+
+def changed_rows(cursor, rows):
+    """
+    changed_rows: Returns the rows an upsert changed according to its
+    rowcount (MariaDB reports 1 per insert, 2 per update & 0 for identical
+    rows), all of them when the driver doesn't report it.
+    """
+    rowcount = cursor.rowcount
+    return rowcount if isinstance(rowcount, int) and rowcount >= 0 else len(rows)
+
+
+class StorageBackend(ABC):
+    """
+    StorageBackend class: Operations every storage backend provides. Rows are
+    tuples in a dataset's column order, as produced by Dataset.extract.
+    """
+    # pylint: disable=too-many-public-methods
+    # Whether replicas on other hosts can coordinate through it, see WorkQueue
+    shared = False
+
+    @abstractmethod
+    def connect(self):
+        """
+        connect: Opens the backend & applies pending schema changes unless disabled.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def migrate(self, dry_run=False):
+        """
+        migrate: Creates or upgrades the schema of every registered dataset.
+        """
+        raise NotImplementedError
+
+    def maintain_partitions(self):
+        """
+        maintain_partitions: Prepares storage for upcoming periods, if the backend partitions.
+        """
+
+    @abstractmethod
+    def insert_rows(self, dataset, rows):
+        """
+        insert_rows: Upserts a batch of rows by natural key & returns how many were written.
+        """
+        raise NotImplementedError
+
+    def insert_sql(self, dataset, partition=None):
+        """
+        insert_sql: Returns the upsert write_rows() uses for a dataset, see
+        Dataset.insert_sql().
+        """
+        return dataset.insert_sql(partition)
+
+    def bump_sql(self):
+        """
+        bump_sql: Returns the statement bumping a data version, see DataVersions.bump_sql().
+        """
+        return DATA_VERSIONS.bump_sql()
+
+    def dictionary_insert_sql(self, dictionary):
+        """
+        dictionary_insert_sql: Returns the statement registering new dictionary
+        names, see Dictionary.insert_sql().
+        """
+        return dictionary.insert_sql()
+
+    def checksum_sql(self, dataset, where=""):
+        """
+        checksum_sql: Returns the per-bucket checksum aggregate checksums()
+        runs, see Dataset.checksum_sql().
+        """
+        return dataset.checksum_sql(where=where)
+
+    def bucket_keys_sql(self, dataset):
+        """
+        bucket_keys_sql: Returns the query bucket_keys() runs, see
+        Dataset.bucket_keys_sql().
+        """
+        return dataset.bucket_keys_sql()
+
+    def group_by_partition(self, dataset, rows):  # pylint: disable=unused-argument
+        """
+        group_by_partition: Splits a batch by target partition, {partition: rows};
+        None writes without partition selection.
+        """
+        return {None: rows}
+
+    def register_dictionary_names(self, cursor, dataset, rows):
+        """
+        register_dictionary_names: Adds the dictionary names a batch uses &
+        returns {table: names} it registered.
+        """
+        registered = {}
+        for dictionary, names in dataset.dictionary_names(rows).items():
+            cursor.executemany(
+                self.dictionary_insert_sql(dictionary), [(name,) for name in sorted(names)]
+            )
+            registered[dictionary.table] = names
+        return registered
+
+    def write_rows(self, cursor, dataset, rows):
+        """
+        write_rows: Writes a batch on a cursor in the caller's transaction:
+        registers its dictionary names, upserts it grouped by partition & CMA
+        scope & bumps the data versions of the scopes whose rows changed.
+        Returns the dictionary names registered, see register_dictionary_names().
+        """
+        registered = self.register_dictionary_names(cursor, dataset, rows)
+        changed = {}
+        for partition, partition_rows in self.group_by_partition(dataset, rows).items():
+            for scope, scope_rows in DATA_VERSIONS.scopes(dataset, partition_rows).items():
+                cursor.executemany(
+                    self.insert_sql(dataset, partition), dataset.insert_params(scope_rows)
+                )
+                changed[scope] = changed.get(scope, 0) + changed_rows(cursor, scope_rows)
+        bumps = DATA_VERSIONS.bump_params(dataset, changed)
+        if bumps:
+            cursor.executemany(self.bump_sql(), bumps)
+        return registered
+
+    def is_transient(self, error):  # pylint: disable=unused-argument
+        """
+        is_transient: Returns whether a write error, such as a deadlock, is
+        likely to go away when the same batch is written again later.
+        """
+        return False
+
+    @abstractmethod
+    def delete_keys(self, dataset, keys):
+        """
+        delete_keys: Deletes rows by natural key.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def refresh_combined(self, cmas):
+        """
+        refresh_combined: Rebuilds the combined table's rows of some CMAs in one
+        transaction, see DatasetRegistry.CombinedStats.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def query(self, sql, params=()):
+        """
+        query: Runs a read-only statement & returns every row.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def execute(self, sql, params=()):
+        """
+        execute: Runs & commits one write statement, returning the affected row count.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def lock(self, name, timeout=0):
+        """
+        lock: Takes a named lock shared by every instance using the backend,
+        waiting up to `timeout` seconds. Returns whether it was taken.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def unlock(self, name):
+        """
+        unlock: Releases a named lock taken with lock().
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def checksums(self, dataset, bucket_size, where=("", ())):
+        """
+        checksums: Returns {bucket: (row count, checksum)} as defined by
+        Dataset.checksum_sql() & Dataset.row_checksum(), of the rows matching
+        `where`, a (condition, parameters) pair from RecordFilter.where().
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def bucket_keys(self, dataset, bucket_size, bucket):
+        """
+        bucket_keys: Returns the natural keys stored in one checksum bucket.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def close(self):
+        """
+        close: Releases the backend's connections.
+        """
+        raise NotImplementedError
@@ -0,0 +1,207 @@
+"""
+WorkQueue.py: Coordinates ingesters on several hosts through MariaDB.
+Each (dataset, date window) of a backfill is a row of the ingest_work table.
+Replicas claim one pending row at a time with SELECT ... FOR UPDATE SKIP LOCKED,
+so two replicas never get the same window, and hold it with a lease they renew
+while working. A replica that dies stops renewing; once its lease has expired
+the window is claimed again by another replica.
+
+Usage: python src/DataIngester.py backfill --from 2020-01-01 --distributed
+(run the same command on every replica)
+"""
+
+import os
+import socket
+import threading
+from contextlib import contextmanager
+
+WORK_TABLE = "ingest_work"
+
+
+class WorkQueue:
+    """
+    WorkQueue class: Enqueues, claims, renews & completes units of work on a
+    DatabaseHandler's connections.
+    """
+
+    def __init__(self, db, owner=None, lease_seconds=None, max_attempts=3):
+        """
+        __init__: Initializes the queue. `owner` identifies this replica in the
+        table (default host:pid), leases last INGEST_LEASE_SECONDS (default 300)
+        & a unit that failed `max_attempts` times is parked as failed.
+        """
+        self.db = db
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_seconds = lease_seconds or int(os.getenv("INGEST_LEASE_SECONDS", "300"))
+        self.max_attempts = max_attempts
+
+    @staticmethod
+    def create_table_sql():
+        """
+        create_table_sql: Returns the CREATE TABLE statement for the queue.
+        """
+        return (
+            f"CREATE TABLE IF NOT EXISTS {WORK_TABLE} (\n"
+            f"    id INT AUTO_INCREMENT PRIMARY KEY COMMENT 'Primary Key',\n"
+            f"    dataset VARCHAR(32) NOT NULL COMMENT 'Dataset',\n"
+            f"    after_date DATE NOT NULL COMMENT 'First day of the window',\n"
+            f"    before_date DATE NOT NULL COMMENT 'Day after the window',\n"
+            f"    position INT NOT NULL DEFAULT 0 COMMENT 'Claim order',\n"
+            f"    status ENUM('pending', 'leased', 'done', 'failed') NOT NULL DEFAULT 'pending' "
+            f"COMMENT 'Status',\n"
+            f"    owner VARCHAR(128) DEFAULT NULL COMMENT 'Replica holding the lease',\n"
+            f"    lease_until DATETIME DEFAULT NULL COMMENT 'Lease expiry',\n"
+            f"    attempts INT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'Claims so far',\n"
+            f"    processed INT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'Rows stored',\n"
+            f"    error VARCHAR(255) DEFAULT NULL COMMENT 'Last error',\n"
+            f"    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP "
+            f"COMMENT 'Updated At',\n"
+            f"    UNIQUE KEY uq_{WORK_TABLE}_window (dataset, after_date, before_date),\n"
+            f"    KEY idx_{WORK_TABLE}_claim (status, position)\n"
+            f")"
+        )
+
+    @contextmanager
+    def transaction(self):
+        """
+        transaction: Yields a cursor on a pooled connection & commits when the
+        block succeeds, rolling back otherwise.
+        """
+        conn = self.db.acquire()
+        cursor = conn.cursor()
+        try:
+            yield cursor
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            self.db.release(conn)
+
+    def enqueue(self, windows):
+        """
+        enqueue: Adds (dataset, after, before) windows in claim order. Windows
+        already queued, by this or another replica, are left as they are.
+        """
+        if not windows:
+            return 0
+        with self.transaction() as cursor:
+            cursor.executemany(
+                f"INSERT IGNORE INTO {WORK_TABLE} (dataset, after_date, before_date, position) "
+                f"VALUES (?, ?, ?, ?)",
+                [(name, after, before, position)
+                 for position, (name, after, before) in enumerate(windows)]
+            )
+        return len(windows)
+
+    def claim(self):
+        """
+        claim: Leases the first pending unit, or one whose lease expired.
+        Returns (id, dataset, after, before), or None when nothing is claimable.
+        Rows locked by another replica's claim are skipped rather than waited on.
+        An expired lease on a unit's last attempt marks it failed, as its
+        replica died without releasing it; those rows are locked with SKIP
+        LOCKED too, so concurrent claims never block on each other.
+        """
+        with self.transaction() as cursor:
+            cursor.execute(
+                f"SELECT id FROM {WORK_TABLE} "
+                f"WHERE status = 'leased' AND lease_until < NOW() AND attempts >= ? "
+                f"FOR UPDATE SKIP LOCKED",
+                (self.max_attempts,)
+            )
+            expired = [(row[0],) for row in cursor.fetchall()]
+            if expired:
+                cursor.executemany(
+                    f"UPDATE {WORK_TABLE} SET status = 'failed', owner = NULL, "
+                    f"lease_until = NULL, error = 'Lease expired on the last attempt' "
+                    f"WHERE id = ?",
+                    expired
+                )
+            cursor.execute(
+                f"SELECT id, dataset, after_date, before_date FROM {WORK_TABLE} "
+                f"WHERE attempts < ? AND (status = 'pending' "
+                f"OR (status = 'leased' AND lease_until < NOW())) "
+                f"ORDER BY position, id LIMIT 1 FOR UPDATE SKIP LOCKED",
+                (self.max_attempts,)
+            )
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            cursor.execute(
+                f"UPDATE {WORK_TABLE} SET status = 'leased', owner = ?, "
+                f"lease_until = NOW() + INTERVAL ? SECOND, attempts = attempts + 1 WHERE id = ?",
+                (self.owner, self.lease_seconds, row[0])
+            )
+        unit_id, name, after, before = row
+        return unit_id, name, str(after), str(before)
+
+    def heartbeat(self, unit_id):
+        """
+        heartbeat: Extends the lease on a unit. Returns False if this replica
+        no longer holds it (the lease expired & was claimed elsewhere).
+        """
+        with self.transaction() as cursor:
+            cursor.execute(
+                f"UPDATE {WORK_TABLE} SET lease_until = NOW() + INTERVAL ? SECOND "
+                f"WHERE id = ? AND owner = ? AND status = 'leased'",
+                (self.lease_seconds, unit_id, self.owner)
+            )
+            return cursor.rowcount > 0
+
+    @contextmanager
+    def hold(self, unit_id):
+        """
+        hold: Renews a unit's lease every third of the lease period while the
+        block runs.
+        """
+        stop = threading.Event()
+
+        def renew():
+            while not stop.wait(self.lease_seconds / 3):
+                try:
+                    if not self.heartbeat(unit_id):
+                        print(f"Lost the lease on work unit {unit_id}")
+                        return
+                except Exception as heartbeat_error:
+                    print(f"Error renewing the lease on work unit {unit_id}: {heartbeat_error}")
+
+        thread = threading.Thread(target=renew, name=f"lease-{unit_id}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def complete(self, unit_id, processed):
+        """
+        complete: Marks a held unit done. Returns False if this replica no
+        longer holds it, so its work must not be recorded as this replica's.
+        """
+        with self.transaction() as cursor:
+            cursor.execute(
+                f"UPDATE {WORK_TABLE} SET status = 'done', owner = NULL, lease_until = NULL, "
+                f"processed = ?, error = NULL WHERE id = ? AND owner = ? AND status = 'leased'",
+                (processed, unit_id, self.owner)
+            )
+            return cursor.rowcount > 0
+
+    def fail(self, unit_id, error):
+        """
+        fail: Releases a held unit after an error, back to pending unless it has
+        used up its attempts.
+        """
+        with self.transaction() as cursor:
+            cursor.execute(
+                f"UPDATE {WORK_TABLE} SET status = IF(attempts >= ?, 'failed', 'pending'), "
+                f"owner = NULL, lease_until = NULL, error = ? WHERE id = ? AND owner = ?",
+                (self.max_attempts, str(error)[:255], unit_id, self.owner)
+            )
+
+    def counts(self):
+        """
+        counts: Returns {status: units} over the whole queue.
+        """
+        return dict(self.db.query(f"SELECT status, COUNT(*) FROM {WORK_TABLE} GROUP BY status"))
@@ -0,0 +1,447 @@
+"""
+WriteSpool.py: Durable queue between the fetch & write stages.
+When the database is unreachable, batches of extracted rows are appended to
+compressed segment files on disk instead of failing, and fetching carries on.
+Spooled batches are written back in the order they were spooled once the
+database answers again; new batches queue up behind them meanwhile, so a row
+is never overwritten by an older copy of itself. Only ingest runs spool, see
+DataIngester.begin_writes.
+
+Each segment file (INGEST_SPOOL_DIR, default "spool") holds frames of a 4-byte
+length followed by a zlib-compressed JSON batch. cursor.json records how far
+the spool was drained; fully drained segments are deleted. A batch the
+database refuses (or that can't be decoded) is moved to quarantine.spool, in
+the same frame format, so it doesn't hold up the batches behind it; errors the
+backend reports as transient (StorageBackend.is_transient) keep it spooled
+instead. Quarantined batches are written again with the replay-quarantine
+command, see replay_quarantine.
+Only one process at a time uses a spool directory: the first to spool or find
+spooled batches takes a flock on its spool.lock until close(), others write
+without a spool.
+"""
+
+import fcntl
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from src.DatasetRegistry import DATASETS
+from src.JsonDecoder import loads
+from src.StorageBackend import StorageUnavailable
+
+FRAME_HEADER = struct.Struct(">I")
+
+
+class WriteSpool:
+    """
+    WriteSpool class: Wraps a storage backend's insert_rows, spooling batches
+    while the backend is unavailable & draining them when it is back.
+    """
+    # pylint: disable=too-many-instance-attributes,too-many-arguments,too-many-positional-arguments
+
+    def __init__(self, db, directory=None, segment_bytes=64 * 1024 * 1024, fsync=None,
+                 retry_interval=None, on_written=None):
+        """
+        __init__: Initializes the spool. `on_written` is called as
+        on_written(dataset, rows) with every batch once it is committed,
+        whether written straight away or drained later. `fsync` (INGEST_SPOOL_FSYNC) is "always"
+        to sync every appended batch, "segment" to sync when a segment is
+        closed or "never". While batches are spooled the database is retried
+        every `retry_interval` seconds (INGEST_SPOOL_RETRY, default 30). An
+        empty INGEST_SPOOL_DIR disables spooling, write errors then propagate.
+        """
+        self.db = db
+        self.on_written = on_written
+        self.directory = (
+            directory if directory is not None else os.getenv("INGEST_SPOOL_DIR", "spool")
+        )
+        self.enabled = bool(self.directory)
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync or os.getenv("INGEST_SPOOL_FSYNC", "always")
+        self.retry_interval = (
+            retry_interval if retry_interval is not None
+            else float(os.getenv("INGEST_SPOOL_RETRY", "30"))
+        )
+        self.cursor_path = os.path.join(self.directory, "cursor.json")
+        self.quarantine_path = os.path.join(self.directory, "quarantine.spool")
+        self.lock = threading.RLock()
+        self.file = None
+        self.segment_number = None
+        self.retry_at = 0.0
+        self.pending = []
+        self.lock_file = None
+        if self.enabled and os.path.isdir(self.directory) and not self.locked():
+            print(f"Spool {self.directory} is in use by another process, leaving it alone")
+
+    def locked(self):
+        """
+        locked: Returns whether this instance holds the spool directory's lock,
+        taking it if no other process does. Batches already on disk are
+        scanned when the lock is taken.
+        """
+        if self.lock_file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            # pylint: disable-next=consider-using-with
+            f = open(os.path.join(self.directory, "spool.lock"), "a", encoding="utf-8")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                return False
+            self.lock_file = f
+            self.pending = self.scan()
+        return True
+
+    def segment_path(self, number):
+        """
+        segment_path: Returns the path of a segment file.
+        """
+        return os.path.join(self.directory, f"segment-{number:08d}.spool")
+
+    def segments(self):
+        """
+        segments: Returns the numbers of the segment files on disk, oldest first.
+        """
+        return sorted(
+            int(name[len("segment-"):-len(".spool")]) for name in os.listdir(self.directory)
+            if name.startswith("segment-") and name.endswith(".spool")
+        )
+
+    def load_cursor(self):
+        """
+        load_cursor: Returns the (segment, position) up to which the spool was drained.
+        """
+        try:
+            with open(self.cursor_path, "r", encoding="utf-8") as f:
+                cursor = json.load(f)
+            return cursor["segment"], cursor["position"]
+        except FileNotFoundError:
+            return 0, 0
+
+    def save_cursor(self, segment, position):
+        """
+        save_cursor: Atomically records how far the spool was drained.
+        """
+        tmp_path = f"{self.cursor_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"segment": segment, "position": position}, f)
+        os.replace(tmp_path, self.cursor_path)
+
+    def scan(self):
+        """
+        scan: Returns the undrained frames on disk as (segment, start, end,
+        spooled at) tuples. A frame cut short by a crash is truncated away.
+        """
+        drained_segment, drained_position = self.load_cursor()
+        frames = []
+        for number in self.segments():
+            if number < drained_segment:
+                os.remove(self.segment_path(number))
+                continue
+            path = self.segment_path(number)
+            position = drained_position if number == drained_segment else 0
+            with open(path, "rb") as f:
+                data = f.read()
+            while position + FRAME_HEADER.size <= len(data):
+                (length,) = FRAME_HEADER.unpack_from(data, position)
+                end = position + FRAME_HEADER.size + length
+                if end > len(data):
+                    break
+                try:
+                    spooled_at = self.decode(data[position + FRAME_HEADER.size:end])["at"]
+                except (KeyError, TypeError, ValueError, zlib.error):
+                    # Left for drain() to quarantine
+                    spooled_at = time.time()
+                frames.append((number, position, end, spooled_at))
+                position = end
+            if position < len(data):
+                print(f"Truncating a partly written frame at {path}:{position}")
+                with open(path, "r+b") as f:
+                    f.truncate(position)
+        return frames
+
+    @staticmethod
+    def encode(dataset, rows):
+        """
+        encode: Returns the compressed frame body of a batch.
+        """
+        body = json.dumps({"dataset": dataset.name, "at": time.time(), "rows": rows},
+                          separators=(",", ":"))
+        return zlib.compress(body.encode("utf-8"), 1)
+
+    @staticmethod
+    def decode(body):
+        """
+        decode: Returns the batch of a frame body.
+        """
+        return loads(zlib.decompress(body))
+
+    def open_segment(self):
+        """
+        open_segment: Returns the segment file to append to, starting a new one
+        when the current one is full.
+        """
+        if self.file is not None and self.file.tell() >= self.segment_bytes:
+            self.close_segment()
+        if self.file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            numbers = self.segments()
+            number = numbers[-1] if numbers else self.load_cursor()[0]
+            if numbers and os.path.getsize(self.segment_path(number)) >= self.segment_bytes:
+                number += 1
+            self.file = open(self.segment_path(number), "ab")  # pylint: disable=consider-using-with
+            self.segment_number = number
+        return self.file
+
+    def close_segment(self):
+        """
+        close_segment: Syncs & closes the segment being appended to.
+        """
+        if self.file is not None:
+            self.file.flush()
+            if self.fsync != "never":
+                os.fsync(self.file.fileno())
+            self.file.close()
+            self.file = None
+
+    def append(self, dataset, rows):
+        """
+        append: Durably adds a batch at the end of the spool.
+        """
+        body = self.encode(dataset, [list(row) for row in rows])
+        with self.lock:
+            f = self.open_segment()
+            start = f.tell()
+            f.write(FRAME_HEADER.pack(len(body)) + body)
+            f.flush()
+            if self.fsync == "always":
+                os.fsync(f.fileno())
+            self.pending.append((self.segment_number, start, f.tell(), time.time()))
+        stats = self.stats()
+        print(f"Spooled {len(rows)} {dataset.name} rows: spool={stats['batches']} batches, "
+              f"{stats['bytes']} bytes, lag={stats['lag']:.0f}s")
+
+    @staticmethod
+    def frames(data):
+        """
+        frames: Returns the complete frames of a spool file's contents, header included.
+        """
+        frames = []
+        position = 0
+        while position + FRAME_HEADER.size <= len(data):
+            (length,) = FRAME_HEADER.unpack_from(data, position)
+            end = position + FRAME_HEADER.size + length
+            if end > len(data):
+                break
+            frames.append(data[position:end])
+            position = end
+        return frames
+
+    @classmethod
+    def batch(cls, body):
+        """
+        batch: Returns (dataset, rows, spooled at) of a frame body.
+        """
+        batch = cls.decode(body)
+        return DATASETS[batch["dataset"]], [tuple(row) for row in batch["rows"]], batch["at"]
+
+    def read(self, frame):
+        """
+        read: Returns (dataset, rows) of a spooled frame.
+        """
+        number, start, end, _ = frame
+        with open(self.segment_path(number), "rb") as f:
+            f.seek(start + FRAME_HEADER.size)
+            dataset, rows, _ = self.batch(f.read(end - start - FRAME_HEADER.size))
+        return dataset, rows
+
+    def committed(self, dataset, rows):
+        """
+        committed: Calls on_written for a committed batch, if set. Its errors
+        are only logged, the batch is stored either way.
+        """
+        if self.on_written is None:
+            return
+        try:
+            self.on_written(dataset, rows)
+        except Exception as callback_error:  # pylint: disable=broad-exception-caught
+            print(f"Error handling committed {dataset.name} batch: {callback_error}")
+
+    def quarantine(self, frame, error):
+        """
+        quarantine: Durably appends a frame that can't be written to the
+        quarantine file, so the spool can move past it.
+        """
+        number, start, end, _ = frame
+        with open(self.segment_path(number), "rb") as f:
+            f.seek(start)
+            data = f.read(end - start)
+        with open(self.quarantine_path, "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        print(f"Quarantined spooled batch at {self.segment_path(number)}:{start} "
+              f"in {self.quarantine_path}: {error}")
+
+    def drain(self):
+        """
+        drain: Writes spooled batches in order until the spool is empty, the
+        database is unavailable again or a batch fails with a transient error.
+        A batch failing for any other reason is quarantined & draining carries
+        on. Returns the number of rows written.
+        """
+        written = 0
+        with self.lock:
+            while self.pending:
+                frame = self.pending[0]
+                try:
+                    dataset, rows = self.read(frame)
+                    written += self.db.insert_rows(dataset, rows)
+                except StorageUnavailable as unavailable:
+                    self.retry_at = time.monotonic() + self.retry_interval
+                    print(f"Database still unavailable, {len(self.pending)} batches stay spooled: "
+                          f"{unavailable}")
+                    break
+                except Exception as frame_error:  # pylint: disable=broad-exception-caught
+                    if self.db.is_transient(frame_error):
+                        self.retry_at = time.monotonic() + self.retry_interval
+                        print(f"Transient error writing spooled batch, {len(self.pending)} "
+                              f"batches stay spooled: {frame_error}")
+                        break
+                    self.quarantine(frame, frame_error)
+                else:
+                    self.committed(dataset, rows)
+                self.pending.pop(0)
+                number, _, end, _ = frame
+                if self.pending and self.pending[0][0] == number:
+                    self.save_cursor(number, end)
+                    continue
+                # The segment is drained, later appends go to a new one
+                if self.file is not None and self.segment_number == number:
+                    self.close_segment()
+                self.save_cursor(number + 1, 0)
+                os.remove(self.segment_path(number))
+            if written:
+                print(f"Drained {written} spooled rows, {len(self.pending)} batches left")
+        return written
+
+    def replay_quarantine(self, dry_run=False):
+        """
+        replay_quarantine: Writes the quarantined batches again in the order
+        they were quarantined, once whatever made the database refuse them is
+        fixed. The spool is drained first. Batches refused again stay in
+        quarantine; a dry run only lists them. Returns the number of rows written.
+        """
+        with self.lock:
+            if not self.locked():
+                raise RuntimeError(f"Spool {self.directory} is in use by another process")
+            if self.pending and not dry_run:
+                self.drain()
+                if self.pending:
+                    print("Spool not drained, quarantined batches not replayed")
+                    return 0
+            try:
+                with open(self.quarantine_path, "rb") as f:
+                    frames = self.frames(f.read())
+            except FileNotFoundError:
+                frames = []
+            written = 0
+            kept = []
+            for index, frame in enumerate(frames):
+                try:
+                    dataset, rows, spooled_at = self.batch(frame[FRAME_HEADER.size:])
+                except (KeyError, TypeError, ValueError, zlib.error) as frame_error:
+                    print(f"Can't decode quarantined batch {index}: {frame_error}")
+                    kept.append(frame)
+                    continue
+                if dry_run:
+                    print(f"[dry-run] Quarantined batch {index}: {len(rows)} {dataset.name} "
+                          f"rows, spooled at {time.ctime(spooled_at)}")
+                    continue
+                try:
+                    written += self.db.insert_rows(dataset, rows)
+                except StorageUnavailable as unavailable:
+                    print(f"Database unavailable, quarantined batches left: {unavailable}")
+                    kept.extend(frames[index:])
+                    break
+                except Exception as frame_error:  # pylint: disable=broad-exception-caught
+                    print(f"Quarantined batch {index} refused again: {frame_error}")
+                    kept.append(frame)
+                    continue
+                self.committed(dataset, rows)
+            if not dry_run and frames:
+                tmp_path = f"{self.quarantine_path}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(b"".join(kept))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.quarantine_path)
+            print(f"Replayed quarantined batches: written={written} rows, "
+                  f"{len(kept)} of {len(frames)} batches left")
+        return written
+
+    def insert_rows(self, dataset, rows):
+        """
+        insert_rows: Writes a batch, or spools it when the database is
+        unavailable or older batches are still spooled. Returns the number of
+        rows committed, 0 for a spooled batch; on_written hears of it once
+        it is drained.
+        """
+        if not self.enabled:
+            written = self.db.insert_rows(dataset, rows)
+            self.committed(dataset, rows)
+            return written
+        with self.lock:
+            if self.pending and time.monotonic() >= self.retry_at:
+                self.drain()
+            if self.pending:
+                self.append(dataset, rows)
+                return 0
+        try:
+            written = self.db.insert_rows(dataset, rows)
+        except StorageUnavailable as unavailable:
+            with self.lock:
+                if not self.locked():
+                    print(f"Database unavailable & spool {self.directory} is in use by another "
+                          f"process, not spooling {dataset.name} batch")
+                    raise
+                print(f"Database unavailable, spooling {dataset.name} batch: {unavailable}")
+                self.retry_at = time.monotonic() + self.retry_interval
+                self.append(dataset, rows)
+            return 0
+        self.committed(dataset, rows)
+        return written
+
+    def stats(self):
+        """
+        stats: Returns the spool's size in batches & bytes & its lag, the age
+        in seconds of the oldest spooled batch.
+        """
+        with self.lock:
+            return {
+                "batches": len(self.pending),
+                "bytes": sum(end - start for _, start, end, _ in self.pending),
+                "lag": time.time() - self.pending[0][3] if self.pending else 0.0,
+            }
+
+    def close(self):
+        """
+        close: Tries a last drain & closes the current segment.
+        """
+        if not self.enabled:
+            return
+        if self.pending:
+            self.drain()
+        with self.lock:
+            self.close_segment()
+        if self.pending:
+            stats = self.stats()
+            print(f"Spool left with {stats['batches']} batches, {stats['bytes']} bytes, "
+                  f"lag={stats['lag']:.0f}s; they are written on the next run")
+        with self.lock:
+            if self.lock_file is not None:
+                fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+                self.lock_file.close()
+                self.lock_file = None
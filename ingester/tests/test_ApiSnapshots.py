@@ -0,0 +1,94 @@
+import gzip
+import json
+from unittest.mock import MagicMock
+import pytest
+from src.ApiSnapshots import ApiSnapshots, area_files, slug
+
+
+def fake_db():
+    db = MagicMock()
+    housing = [
+        (1, "Toronto", 10, 5, 1, 1, 2, 3, 4, 1, 1, 1, 2),
+        (2, "Toronto", 20, 7, 2, 5, 5, 5, 5, 2, 2, 2, 1),
+        (3, "St. Catharines-Niagara", 3, 1, 1, 1, 1, 1, 0, 1, 0, 0, 0),
+    ]
+    labour = [(1, 35, 2, 1)]
+    db.query.side_effect = lambda sql, params=(): housing if "housing_data" in sql else labour
+    return db
+
+
+def read_json(path):
+    with open(path, "rb") as f:
+        return json.loads(f.read())
+
+
+def test_publish_renders_endpoint_payloads(tmp_path):
+    snapshots = ApiSnapshots(fake_db(), directory=str(tmp_path))
+    assert snapshots.publish() == 7
+
+    housing = read_json(tmp_path / "housingStats.json")
+    assert housing[0]["censusArea"] == "Toronto"
+    assert housing[0]["singleStarts"] == 1
+    assert read_json(tmp_path / "housingStats" / "starts" / "toronto.json") == 30
+    assert read_json(tmp_path / "housingStats" / "completions" / "toronto.json") == 12
+    assert read_json(tmp_path / "housingStats" / "starts" / "st-catharines-niagara.json") == 3
+    assert read_json(tmp_path / "housingStats" / "areas.json") == {
+        "St. Catharines-Niagara": "st-catharines-niagara.json", "Toronto": "toronto.json"
+    }
+    assert read_json(tmp_path / "labourMarket.json") == [
+        {"id": 1, "province": 35, "educationLevel": 2, "labourForceStatus": 1}
+    ]
+    with gzip.open(tmp_path / "labourMarket.json.gz") as f:
+        assert json.loads(f.read())[0]["province"] == 35
+    manifest = read_json(tmp_path / "manifest.json")
+    assert set(manifest["labourMarket.json"]) == {"etag", "bytes"}
+
+
+def test_area_file_names_need_no_url_encoding():
+    assert slug("St. John's") == "st-john-s"
+    assert slug("Québec") == "quebec"
+    assert slug("Belleville - Quinte West") == "belleville-quinte-west"
+    files = area_files(["St. John's", "St John's"])
+    assert len(set(files.values())) == 2
+
+
+def test_tables_are_read_page_by_page(tmp_path):
+    labour = [(jsonid, 35, 2, 1) for jsonid in range(1, 6)]
+    db = MagicMock()
+    db.query.side_effect = lambda sql, params: (
+        [] if "housing_data" in sql
+        else [row for row in labour if row[0] > params[0]][:params[1]]
+    )
+    snapshots = ApiSnapshots(db, directory=str(tmp_path), page_rows=2)
+    snapshots.publish()
+
+    pages = [c.args[1] for c in db.query.call_args_list if "labour_market_data" in c.args[0]]
+    assert pages == [(0, 2), (2, 2), (4, 2)]
+    assert [record["id"] for record in read_json(tmp_path / "labourMarket.json")] == [1, 2, 3, 4, 5]
+    assert read_json(tmp_path / "housingStats.json") == []
+
+
+def test_unchanged_payloads_are_not_rewritten(tmp_path):
+    snapshots = ApiSnapshots(fake_db(), directory=str(tmp_path))
+    snapshots.publish()
+    assert snapshots.publish() == 0
+    assert not list(tmp_path.rglob("*.tmp"))
+
+
+def test_failed_render_leaves_no_temporary_files(tmp_path):
+    def chunks():
+        yield b"["
+        raise RuntimeError("lost connection")
+
+    snapshots = ApiSnapshots(fake_db(), directory=str(tmp_path))
+    with pytest.raises(RuntimeError):
+        snapshots.write("labourMarket.json", chunks())
+
+    assert not list(tmp_path.rglob("*.tmp"))
+    assert not (tmp_path / "labourMarket.json").exists()
+
+
+def test_disabled_without_directory():
+    db = fake_db()
+    assert ApiSnapshots(db, directory="").publish() == 0
+    db.query.assert_not_called()
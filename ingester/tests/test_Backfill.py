@@ -0,0 +1,147 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+from src.Backfill import Backfill, date_windows, window_params
+from src.DeadLetterStore import DeadLetterStore
+
+
+def test_date_windows_cover_range():
+    assert date_windows("2024-01-01", "2024-03-01", 30) == [
+        ("2024-01-01", "2024-01-31"),
+        ("2024-01-31", "2024-03-01"),
+    ]
+    assert date_windows("2024-01-01", "2024-01-01", 30) == []
+
+
+def test_window_params():
+    assert window_params("2024-01-01", "2024-01-31") == {"after": "2024-01-01", "before": "2024-01-31"}
+
+
+def test_run_merges_windows_and_skips_finished(tmp_path):
+    checkpoint = tmp_path / "checkpoint.json"
+    checkpoint.write_text(json.dumps({"housing:2024-01-01:2024-01-31": {"processed": 5}}))
+    store = DeadLetterStore(directory=str(tmp_path / "deadletter"))
+    backfill = Backfill(store, workers=1, window_days=30, checkpoint_file=str(checkpoint))
+    rejected = [{"record": {"CMA": "TestCMA"}, "reason": "Missing field 'id'", "offset": 0}]
+
+    backfill.run_window = mock_run = MagicMock(return_value=(3, rejected))
+    summary = backfill.run("2024-01-01", "2024-03-01", ["housing"])
+
+    mock_run.assert_called_once()
+    assert mock_run.call_args[0][:3] == ("housing", "2024-01-31", "2024-03-01")
+    assert summary == {"housing": {"processed": 3, "rejected": 1, "windows": 1}}
+    assert "housing:2024-01-31:2024-03-01" in json.loads(checkpoint.read_text())
+    assert [entry["record"] for entry in store.read("housing")] == [{"CMA": "TestCMA"}]
+
+
+def test_failed_window_is_retried_next_run(tmp_path):
+    checkpoint = tmp_path / "checkpoint.json"
+    store = DeadLetterStore(directory=str(tmp_path / "deadletter"))
+    backfill = Backfill(store, workers=1, window_days=30, checkpoint_file=str(checkpoint))
+
+    backfill.run_window = MagicMock(side_effect=RuntimeError("API down"))
+    assert backfill.run("2024-01-01", "2024-01-31", ["housing"]) == {}
+
+    assert backfill.plan(["housing"], "2024-01-01", "2024-01-31") == [("housing", "2024-01-01", "2024-01-31")]
+
+
+def test_plan_runs_newest_windows_first(tmp_path):
+    store = DeadLetterStore(directory=str(tmp_path / "deadletter"))
+    checkpoint = str(tmp_path / "checkpoint.json")
+
+    newest = Backfill(store, workers=1, window_days=30, checkpoint_file=checkpoint)
+    assert newest.plan(["housing", "labour_market"], "2024-01-01", "2024-03-01") == [
+        ("housing", "2024-01-31", "2024-03-01"),
+        ("labour_market", "2024-01-31", "2024-03-01"),
+        ("housing", "2024-01-01", "2024-01-31"),
+        ("labour_market", "2024-01-01", "2024-01-31"),
+    ]
+
+    oldest = Backfill(store, workers=1, window_days=30, checkpoint_file=checkpoint, newest_first=False)
+    assert oldest.plan(["housing"], "2024-01-01", "2024-03-01")[0] == ("housing", "2024-01-01", "2024-01-31")
+
+
+class FakeQueue:
+    owner = "host:1"
+
+    def __init__(self, lost=()):
+        self.units = []
+        self.done = {}
+        self.failed = []
+        self.lost = set(lost)
+
+    def enqueue(self, windows):
+        self.units = [(position, *window) for position, window in enumerate(windows)]
+
+    def claim(self):
+        return self.units.pop(0) if self.units else None
+
+    @staticmethod
+    def hold(unit_id):
+        return MagicMock()
+
+    def complete(self, unit_id, processed):
+        if unit_id in self.lost:
+            return False
+        self.done[unit_id] = processed
+        return True
+
+    def fail(self, unit_id, error):
+        self.failed.append(unit_id)
+
+    def counts(self):
+        return {"done": len(self.done), "pending": len(self.units)}
+
+
+def test_run_distributed_works_through_the_queue(tmp_path):
+    store = DeadLetterStore(directory=str(tmp_path / "deadletter"))
+    backfill = Backfill(store, workers=1, window_days=30,
+                        checkpoint_file=str(tmp_path / "checkpoint.json"))
+    queue = FakeQueue()
+
+    backfill.run_window = mock_run = MagicMock(side_effect=[(3, []), RuntimeError("gaps")])
+    summary = backfill.run_distributed("2024-01-01", "2024-03-01", queue, ["housing"])
+
+    assert [call[0][:3] for call in mock_run.call_args_list] == [
+        ("housing", "2024-01-31", "2024-03-01"), ("housing", "2024-01-01", "2024-01-31")
+    ]
+    assert queue.done == {0: 3}
+    assert queue.failed == [1]
+    assert summary == {"housing": {"processed": 3, "rejected": 0, "windows": 1}}
+
+
+def test_run_distributed_skips_windows_whose_lease_was_lost(tmp_path):
+    store = DeadLetterStore(directory=str(tmp_path / "deadletter"))
+    checkpoint = str(tmp_path / "checkpoint.json")
+    backfill = Backfill(store, workers=1, window_days=30, checkpoint_file=checkpoint)
+    queue = FakeQueue(lost={0})
+
+    backfill.run_window = MagicMock(return_value=(3, []))
+    summary = backfill.run_distributed("2024-01-01", "2024-03-01", queue, ["housing"])
+
+    assert queue.done == {1: 3}
+    assert summary == {"housing": {"processed": 3, "rejected": 0, "windows": 1}}
+    assert list(Backfill(store, checkpoint_file=checkpoint).checkpoint) == [
+        "housing:2024-01-01:2024-01-31"
+    ]
+
+
+def test_run_distributed_keeps_workers_busy(tmp_path):
+    store = DeadLetterStore(directory=str(tmp_path / "deadletter"))
+    backfill = Backfill(store, workers=2, window_days=30,
+                        checkpoint_file=str(tmp_path / "checkpoint.json"))
+    queue = FakeQueue()
+    pools = []
+
+    def pool(max_workers):
+        pools.append(max_workers)
+        return ThreadPoolExecutor(max_workers)
+
+    backfill.run_window = mock_run = MagicMock(return_value=(2, []))
+    with patch("src.Backfill.ProcessPoolExecutor", pool):
+        summary = backfill.run_distributed("2024-01-01", "2024-04-01", queue, ["housing"])
+
+    assert pools == [2]
+    assert mock_run.call_count == 4
+    assert queue.done == {0: 2, 1: 2, 2: 2, 3: 2}
+    assert summary == {"housing": {"processed": 8, "rejected": 0, "windows": 4}}
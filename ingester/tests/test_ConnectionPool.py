@@ -0,0 +1,90 @@
+"""
+Test module for ConnectionPool.py
+"""
+import queue
+import threading
+from unittest.mock import MagicMock
+import pytest
+from src.ConnectionPool import ConnectionPool
+
+
+def test_connections_are_created_on_demand_and_reused():
+    factory = MagicMock(side_effect=lambda: MagicMock())
+    pool = ConnectionPool(factory, size=2)
+
+    conn = pool.acquire()
+    pool.release(conn)
+
+    assert pool.acquire() is conn
+    factory.assert_called_once()
+
+def test_pool_never_exceeds_size():
+    pool = ConnectionPool(lambda: MagicMock(), size=1)
+    pool.acquire()
+
+    with pytest.raises(queue.Empty):
+        pool.acquire(timeout=0.01)
+
+def test_waiting_thread_gets_released_connection():
+    pool = ConnectionPool(lambda: MagicMock(), size=1)
+    conn = pool.acquire()
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(pool.acquire(timeout=1)))
+    waiter.start()
+
+    pool.release(conn)
+    waiter.join()
+
+    assert acquired == [conn]
+
+def test_unhealthy_connection_is_replaced():
+    dead, fresh = MagicMock(), MagicMock()
+    dead.ping.side_effect = Exception("gone away")
+    factory = MagicMock(side_effect=[dead, fresh])
+    pool = ConnectionPool(factory, size=1, health_check_interval=0)
+
+    pool.release(pool.acquire())
+
+    assert pool.acquire() is fresh
+    dead.close.assert_called_once()
+
+def test_broken_connection_frees_its_slot():
+    factory = MagicMock(side_effect=lambda: MagicMock())
+    pool = ConnectionPool(factory, size=1)
+
+    pool.release(pool.acquire(), broken=True)
+    pool.acquire(timeout=0.01)
+
+    assert factory.call_count == 2
+
+def test_failed_create_frees_its_slot():
+    factory = MagicMock(side_effect=[Exception("refused"), MagicMock()])
+    pool = ConnectionPool(factory, size=1)
+
+    with pytest.raises(Exception):
+        pool.acquire()
+    assert pool.acquire() is not None
+
+def test_close_closes_idle_connections():
+    conn = MagicMock()
+    pool = ConnectionPool(lambda: conn, size=1)
+    pool.release(pool.acquire())
+
+    pool.close()
+
+    conn.close.assert_called_once()
+
+def test_discard_wakes_waiting_thread():
+    factory = MagicMock(side_effect=lambda: MagicMock())
+    pool = ConnectionPool(factory, size=1)
+    conn = pool.acquire()
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(pool.acquire(timeout=1)),
+                              daemon=True)
+    waiter.start()
+
+    pool.release(conn, broken=True)
+    waiter.join(timeout=2)
+
+    assert len(acquired) == 1 and acquired[0] is not conn
+    assert factory.call_count == 2
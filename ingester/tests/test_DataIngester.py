@@ -1,13 +1,20 @@
+import json
 import pytest
 import requests
 from datetime import datetime, timedelta
 from unittest.mock import patch, MagicMock, mock_open
-from src.DataIngester import DataIngester
+from src.DataIngester import DataIngester, PageFetchError
+from src.DatasetRegistry import LABOUR_MARKET
 
 @pytest.fixture
 def data_ingester():
-    with patch('src.DataIngester.DatabaseHandler'):
+    with patch('src.DataIngester.storage_class'):
         ingester = DataIngester(False)
+        ingester.snapshots.enabled = False
+        ingester.api_snapshots.enabled = False
+        # No handed off runs are waiting
+        ingester.db.execute.return_value = 0
+        ingester.db.query.return_value = []
         
         # Create a fully compatible fetch_data implementation for tests
         def fetch_data_for_tests(url, params=None):
@@ -39,13 +46,11 @@ def data_ingester():
         # Rest of your fixture can remain the same
         ingester.fetch_data = fetch_data_for_tests
         
-        def mock_fetch_and_process(url, processor_func):
+        def mock_fetch_and_process(url, processor_func, dataset=None, params=None):
             data = ingester.fetch_data(url)
-            processed = 0
-            for record in data:
-                if processor_func(record):
-                    processed += 1
-            return processed
+            if not data:
+                return 0
+            return processor_func(data)
             
         ingester.fetch_and_process_data = mock_fetch_and_process
         
@@ -183,12 +188,28 @@ def test_process_and_store_labour_only(data_ingester):
         data_ingester.process_and_store()
         mock_save.assert_called_once()
 
+def test_process_and_store_failure_still_finishes_writes(data_ingester):
+    with patch.object(data_ingester, 'process_housing_data', side_effect=PageFetchError("gaps")), \
+         patch.object(data_ingester, 'process_labour_market_data', return_value=1) as mock_labour, \
+         patch.object(data_ingester, 'finish_writes', return_value=None) as mock_finish, \
+         patch.object(data_ingester, 'save_last_update') as mock_save:
+        with pytest.raises(PageFetchError):
+            data_ingester.process_and_store()
+
+    mock_labour.assert_called_once()
+    mock_finish.assert_called_once()
+    mock_save.assert_not_called()
+
 def test_process_housing_data_success(data_ingester, mock_api_response):
     with patch.object(data_ingester, 'fetch_data', return_value=mock_api_response), \
-         patch.object(data_ingester.db, 'insert_housing_data') as mock_db:
+         patch.object(data_ingester.db, 'insert_rows', return_value=1) as mock_db:
         
         records = data_ingester.process_housing_data()
         mock_db.assert_called_once()
+        dataset, rows = mock_db.call_args[0]
+        assert dataset.table == "housing_data"
+        # Year is optional in the API and defaults to 0
+        assert rows == [(1, "TestCMA", 10, 0, 10, 5, 3, 2, 1, 4, 1, 1, 1, 2)]
         assert records == 1
 
 def test_save_last_update(data_ingester):
@@ -209,7 +230,8 @@ def test_process_housing_data_key_error(data_ingester):
     # Missing required field
     incomplete_data = [{"CMA": "TestCMA", "Month": 10}]  # Missing other required fields
     
-    with patch.object(data_ingester, 'fetch_data', return_value=incomplete_data):
+    with patch.object(data_ingester, 'fetch_data', return_value=incomplete_data), \
+         patch.object(data_ingester.db, 'insert_rows', return_value=0):
         records = data_ingester.process_housing_data()
         assert records == 0  # No records should be processed due to KeyError
 
@@ -218,17 +240,20 @@ def test_process_housing_data_exception(data_ingester):
                      "Total_complete": 5, "Singles_starts": 3, "Semis_starts": 2, "Row_starts": 1,
                      "Apt_Other_starts": 4, "Singles_complete": 1, "Semis_complete": 1, "Row_complete": 1,
                      "Apt_other_complete": 2}]), \
-         patch.object(data_ingester.db, 'insert_housing_data', side_effect=Exception("DB Error")):
+         patch.object(data_ingester.db, 'insert_rows', side_effect=Exception("DB Error")):
         
         records = data_ingester.process_housing_data()
         assert records == 0  # No records should be processed due to Exception
 
 def test_process_labour_market_data_success(data_ingester, mock_labour_api_response):
     with patch.object(data_ingester, 'fetch_data', return_value=mock_labour_api_response), \
-         patch.object(data_ingester.db, 'insert_labour_market_data') as mock_db:
+         patch.object(data_ingester.db, 'insert_rows', return_value=1) as mock_db:
         
         records = data_ingester.process_labour_market_data()
         mock_db.assert_called_once()
+        dataset, rows = mock_db.call_args[0]
+        assert dataset.table == "labour_market_data"
+        assert rows == [(1, 48, 2, 4)]
         assert records == 1
 
 def test_process_labour_market_data_empty(data_ingester):
@@ -240,13 +265,14 @@ def test_process_labour_market_data_key_error(data_ingester):
     # Missing required field
     incomplete_data = [{"PROV": "48"}]  # Missing other required fields
     
-    with patch.object(data_ingester, 'fetch_data', return_value=incomplete_data):
+    with patch.object(data_ingester, 'fetch_data', return_value=incomplete_data), \
+         patch.object(data_ingester.db, 'insert_rows', return_value=0):
         records = data_ingester.process_labour_market_data()
         assert records == 0  # No records should be processed due to KeyError
 
 def test_process_labour_market_data_exception(data_ingester, mock_labour_api_response):
     with patch.object(data_ingester, 'fetch_data', return_value=mock_labour_api_response), \
-         patch.object(data_ingester.db, 'insert_labour_market_data', side_effect=Exception("DB Error")):
+         patch.object(data_ingester.db, 'insert_rows', side_effect=Exception("DB Error")):
         
         records = data_ingester.process_labour_market_data()
         assert records == 0  # No records should be processed due to Exception
@@ -261,4 +287,285 @@ def test_fetch_data_invalid_date_format(data_ingester):
         data_ingester.fetch_data(data_ingester.api_housing)
         # Should still make the request but with the raw invalid date
         mock_get.assert_called_once()
-        assert 'after' in mock_get.call_args[1]['params']
\ No newline at end of file
+        assert 'after' in mock_get.call_args[1]['params']
+def test_process_housing_data_dead_letters_rejects(data_ingester):
+    incomplete_data = [{"CMA": "TestCMA", "Month": 10}]
+    data_ingester.current_offset = 5000
+
+    with patch.object(data_ingester, 'fetch_data', return_value=incomplete_data), \
+         patch.object(data_ingester.db, 'insert_rows', return_value=0), \
+         patch.object(data_ingester.dead_letters, 'add') as mock_add:
+        data_ingester.process_housing_data()
+
+    mock_add.assert_called_once()
+    dataset, record, reason, offset = mock_add.call_args[0]
+    assert dataset == "housing"
+    assert record == incomplete_data[0]
+    assert "Missing field" in reason
+    assert offset == 5000
+
+def test_process_batch_reports_field_errors(data_ingester, capsys):
+    records = [{"id": 1, "PROV": "n/a", "EDUC": 2}, {"id": 2, "PROV": 35, "EDUC": 2, "LFSSTAT": 1}]
+    data_ingester.current_offset = 0
+
+    with patch.object(data_ingester.db, 'insert_rows', return_value=1), \
+         patch.object(data_ingester.dead_letters, 'add') as mock_add:
+        assert data_ingester.process_batch(LABOUR_MARKET, records) == 1
+
+    reason = mock_add.call_args[0][2]
+    assert "Invalid value for 'PROV'" in reason
+    assert "Missing field 'LFSSTAT'" in reason
+    assert "Rejected 1 of 2 labour_market records at offset 0: LFSSTAT=1, PROV=1" in capsys.readouterr().out
+
+def test_finish_writes_refreshes_changed_cmas(data_ingester):
+    with patch.object(data_ingester.db, 'insert_rows', return_value=1):
+        data_ingester.process_batch(LABOUR_MARKET, [{"id": 1, "PROV": 47, "EDUC": 2, "LFSSTAT": 1}])
+
+    data_ingester.finish_writes()
+    data_ingester.db.refresh_combined.assert_called_once_with(["Regina", "Saskatoon"])
+    assert data_ingester.combined_changes == set()
+
+def test_spooled_batch_counts_once_drained(data_ingester, tmp_path):
+    from src.StorageBackend import StorageUnavailable
+    from src.WriteSpool import WriteSpool
+    data_ingester.spool = WriteSpool(data_ingester.db, directory=str(tmp_path), retry_interval=0,
+                                     on_written=data_ingester.rows_written)
+    record = {"id": 1, "PROV": 47, "EDUC": 2, "LFSSTAT": 1}
+
+    with patch.object(data_ingester.db, 'insert_rows', side_effect=StorageUnavailable("down")):
+        assert data_ingester.process_batch(LABOUR_MARKET, [record]) == 0
+    assert data_ingester.combined_changes == set()
+
+    with patch.object(data_ingester.db, 'insert_rows', return_value=1):
+        data_ingester.spool.drain()
+    assert data_ingester.combined_changes == {"Regina", "Saskatoon"}
+    data_ingester.spool.close()
+
+def test_process_batch_drops_filtered_records(data_ingester):
+    from src.RecordFilter import RecordFilter
+    data_ingester.filters["labour_market"] = RecordFilter(LABOUR_MARKET, {"PROV": [35]})
+    records = [{"id": 1, "PROV": 35, "EDUC": 2, "LFSSTAT": 1}, {"id": 2, "PROV": 48, "EDUC": 2, "LFSSTAT": 1}]
+
+    with patch.object(data_ingester.db, 'insert_rows', return_value=1) as mock_insert:
+        data_ingester.process_batch(LABOUR_MARKET, records)
+
+    mock_insert.assert_called_once_with(LABOUR_MARKET, [(1, 35, 2, 1)])
+
+def test_replay_dead_letters(data_ingester, tmp_path, mock_api_response):
+    from src.DeadLetterStore import DeadLetterStore
+    data_ingester.dead_letters = DeadLetterStore(directory=str(tmp_path))
+    data_ingester.dead_letters.add("housing", mock_api_response[0], "DB Error", 0)
+    data_ingester.dead_letters.add("housing", {"CMA": "TestCMA"}, "Missing field 'id'", 0)
+    data_ingester.dead_letters.flush()
+
+    with patch.object(data_ingester.db, 'insert_rows', side_effect=lambda dataset, rows: len(rows)) as mock_db:
+        replayed = data_ingester.replay_dead_letters("housing")
+
+    mock_db.assert_called_once()
+    assert replayed == {"housing": 1}
+    remaining = data_ingester.dead_letters.read("housing")
+    assert [entry["record"] for entry in remaining] == [{"CMA": "TestCMA"}]
+
+def test_process_and_store_with_sharded_writers(data_ingester, mock_labour_api_response):
+    data_ingester.writers = 2
+    data_ingester.db.insert_rows.side_effect = lambda dataset, rows: len(rows)
+
+    with patch.object(data_ingester, 'fetch_data', side_effect=[[], mock_labour_api_response]), \
+         patch.object(data_ingester, 'save_last_update') as mock_save:
+        data_ingester.process_and_store()
+
+    data_ingester.db.insert_rows.assert_called_once()
+    assert data_ingester.writer is None
+    mock_save.assert_called_once()
+
+def test_fetch_stops_after_batch_when_stop_requested(data_ingester, mock_api_response):
+    data_ingester.stop_event.set()
+    processor = MagicMock(return_value=1)
+
+    with patch.object(data_ingester, 'fetch_batch', return_value=mock_api_response) as mock_fetch, \
+         patch.object(data_ingester, 'get_last_update', return_value=None):
+        assert DataIngester.fetch_and_process_data(data_ingester, "url", processor) == 1
+
+    mock_fetch.assert_called_once()
+
+def test_run_scheduled_saves_dataset_last_update(data_ingester, mock_labour_api_response):
+    from src.DatasetRegistry import LABOUR_MARKET
+    data_ingester.db.insert_rows.side_effect = lambda dataset, rows: len(rows)
+
+    with patch.object(data_ingester, 'fetch_data', return_value=mock_labour_api_response), \
+         patch.object(data_ingester, 'save_last_update') as mock_save:
+        assert data_ingester.run_scheduled(LABOUR_MARKET) == 1
+
+    mock_save.assert_called_once_with("labour_market")
+
+def test_failed_scheduled_run_still_finishes_writes(data_ingester):
+    from src.DatasetRegistry import LABOUR_MARKET
+    data_ingester.writers = 2
+
+    with patch.object(data_ingester, 'process_dataset', side_effect=PageFetchError("gaps")), \
+         patch.object(data_ingester, 'save_last_update') as mock_save:
+        with pytest.raises(PageFetchError):
+            data_ingester.run_scheduled(LABOUR_MARKET)
+
+    assert data_ingester.writer is None
+    mock_save.assert_not_called()
+
+def test_only_ingest_runs_open_the_disk_spool(data_ingester, tmp_path, monkeypatch):
+    monkeypatch.setenv("INGEST_SPOOL_DIR", str(tmp_path / "spool"))
+    assert not data_ingester.spool.enabled
+
+    data_ingester.begin_writes()
+    assert data_ingester.spool.enabled
+    assert data_ingester.spool.directory == str(tmp_path / "spool")
+    data_ingester.finish_writes()
+
+def test_last_update_per_dataset_falls_back_to_shared_file(data_ingester, tmp_path):
+    data_ingester.last_update_file = str(tmp_path / "lastUpdated.txt")
+    (tmp_path / "lastUpdated.txt").write_text("2024-01-01", encoding="utf-8")
+    assert data_ingester.get_last_update("housing") == "2024-01-01"
+
+    data_ingester.save_last_update("housing")
+    assert (tmp_path / "lastUpdated_housing.txt").exists()
+    assert data_ingester.get_last_update("housing") != "2024-01-01"
+
+def test_fetch_batch_retries_throttled_requests(data_ingester, mock_api_response):
+    throttled = MagicMock(status_code=429, headers={"Retry-After": "0"})
+    ok = MagicMock(status_code=200, headers={})
+    ok.content = json.dumps(mock_api_response).encode()
+
+    with patch.object(data_ingester.session, 'get', side_effect=[throttled, ok]) as mock_get, \
+         patch('src.DataIngester.time.sleep'):
+        batch = DataIngester.fetch_batch(data_ingester, "url", 0)
+
+    assert batch == mock_api_response
+    assert mock_get.call_count == 2
+    assert data_ingester.rate.in_flight == 0
+
+def test_fetch_batch_raises_after_retries(data_ingester):
+    with patch.object(data_ingester.session, 'get',
+                      side_effect=requests.exceptions.ConnectionError("reset")) as mock_get, \
+         patch('src.DataIngester.time.sleep') as mock_sleep:
+        with pytest.raises(PageFetchError):
+            DataIngester.fetch_batch(data_ingester, "url", 0)
+
+    assert mock_get.call_count == data_ingester.page_retries
+    assert [call.args[0] for call in mock_sleep.call_args_list] == [1, 2, 4, 8]
+
+def test_failed_page_becomes_gap_and_is_filled(data_ingester, tmp_path, mock_labour_api_response):
+    from src.DatasetRegistry import LABOUR_MARKET
+    from src.GapStore import GapStore
+    data_ingester.gaps = GapStore(str(tmp_path / "gaps.json"))
+    data_ingester.process_dataset = DataIngester.process_dataset.__get__(data_ingester)
+    data_ingester.fetch_and_process_data = DataIngester.fetch_and_process_data.__get__(data_ingester)
+    pages = {0: mock_labour_api_response, 5000: PageFetchError("offset 5000"),
+             10000: mock_labour_api_response, 15000: []}
+
+    def fetch(url, offset, params=None):
+        page = pages[offset]
+        if isinstance(page, Exception):
+            raise page
+        return page
+
+    data_ingester.db.insert_rows.side_effect = lambda dataset, rows: len(rows)
+    with patch.object(data_ingester, 'fetch_batch', side_effect=fetch), \
+         patch.object(data_ingester, 'get_last_update', return_value=None), \
+         patch.object(data_ingester, 'fill_gaps', return_value=0):
+        assert data_ingester.process_dataset(LABOUR_MARKET, "url") == 2
+    assert [gap["offset"] for gap in data_ingester.gaps.for_dataset("labour_market")] == [5000]
+
+    pages[5000] = mock_labour_api_response
+    with patch.object(data_ingester, 'fetch_batch', side_effect=fetch) as mock_fetch:
+        assert data_ingester.fill_gaps(LABOUR_MARKET, "url") == 1
+    mock_fetch.assert_called_once_with("url", 5000, {})
+    assert data_ingester.gaps.for_dataset("labour_market") == []
+
+def labour_records(*ids):
+    return [{"id": jsonid, "PROV": 35, "EDUC": 2, "LFSSTAT": 1} for jsonid in ids]
+
+def test_keyset_paging_follows_last_id(data_ingester):
+    data_ingester.fetch_and_process_data = DataIngester.fetch_and_process_data.__get__(data_ingester)
+    data_ingester.paging = "keyset"
+    pages = {None: labour_records(1, 2), 2: labour_records(2, 3), 3: []}
+    calls = []
+
+    def fetch(url, offset, params=None):
+        calls.append((offset, params.get("after_id")))
+        return pages[params.get("after_id")]
+
+    processed = []
+    with patch.object(data_ingester, 'fetch_batch', side_effect=fetch), \
+         patch.object(data_ingester, 'get_last_update', return_value=None):
+        data_ingester.fetch_and_process_data(
+            "url", lambda records: processed.extend(r["id"] for r in records) or len(records),
+            dataset="labour_market"
+        )
+
+    assert calls == [(None, None), (None, 2), (None, 3)]
+    assert processed == [1, 2, 3]
+
+def test_keyset_paging_falls_back_to_offsets(data_ingester):
+    data_ingester.fetch_and_process_data = DataIngester.fetch_and_process_data.__get__(data_ingester)
+    data_ingester.paging = "keyset"
+    data_ingester.page_size = 2
+    # The API ignores after_id, so every offset-less request returns the first page
+    pages = {None: labour_records(1, 2), 2: labour_records(2, 3), 4: labour_records(4, 5), 6: []}
+
+    def fetch(url, offset, params=None):
+        return pages[offset]
+
+    processed = []
+    with patch.object(data_ingester, 'fetch_batch', side_effect=fetch), \
+         patch.object(data_ingester, 'get_last_update', return_value=None):
+        data_ingester.fetch_and_process_data(
+            "url", lambda records: processed.extend(r["id"] for r in records) or len(records),
+            dataset="labour_market"
+        )
+
+    # id 2 shifted onto the second page & is only processed once
+    assert processed == [1, 2, 3, 4, 5]
+
+def test_ingest_file_uses_batched_writes(data_ingester, tmp_path):
+    from src.DatasetRegistry import LABOUR_MARKET
+    path = tmp_path / "labour.csv"
+    path.write_text("id,PROV,EDUC,LFSSTAT\n1,35,2,1\n2,48,1,4\n", encoding="utf-8")
+    data_ingester.db.insert_rows.side_effect = lambda dataset, rows: len(rows)
+
+    assert data_ingester.ingest_file(LABOUR_MARKET, str(path), batch_size=1) == 2
+
+    assert data_ingester.db.insert_rows.call_count == 2
+    data_ingester.db.insert_rows.assert_called_with(LABOUR_MARKET, [(2, 48, 1, 4)])
+
+def test_ingest_file_dead_letters_bad_lines(data_ingester, tmp_path):
+    from src.DatasetRegistry import LABOUR_MARKET
+    path = tmp_path / "labour.ndjson"
+    path.write_text('{"id": 1, "PROV": 35, "EDUC": 2, "LFSSTAT": 1}\n{"id": 2,\n[3]\n',
+                    encoding="utf-8")
+    data_ingester.db.insert_rows.side_effect = lambda dataset, rows: len(rows)
+    data_ingester.dead_letters = MagicMock()
+
+    assert data_ingester.ingest_file(LABOUR_MARKET, str(path)) == 1
+
+    rejected = [c.args for c in data_ingester.dead_letters.add.call_args_list]
+    assert [(record, offset) for _, record, _, offset in rejected] == [('{"id": 2,', 1), ([3], 0)]
+    assert rejected[0][2].startswith("Invalid JSON")
+
+def test_newest_first_ingests_recent_windows_first(data_ingester):
+    from src.DatasetRegistry import LABOUR_MARKET
+    data_ingester.process_dataset = DataIngester.process_dataset.__get__(data_ingester)
+    data_ingester.order = "newest"
+    data_ingester.window_days = 7
+    windows = []
+
+    def record_window(url, processor_func, dataset=None, params=None):
+        windows.append((params["after"], params["before"]))
+        return 1
+
+    data_ingester.fetch_and_process_data = record_window
+    start = (datetime.now() - timedelta(days=15)).strftime("%Y-%m-%d")
+    with patch.object(data_ingester, 'get_last_update', return_value=start), \
+         patch.object(data_ingester, 'fill_gaps', return_value=0):
+        assert data_ingester.process_dataset(LABOUR_MARKET, "url") == len(windows)
+
+    assert len(windows) == 3
+    assert windows == sorted(windows, reverse=True)
+    assert windows[-1][0] == (datetime.now() - timedelta(days=16)).strftime("%Y-%m-%d")
@@ -0,0 +1,165 @@
+"""
+Test module for DatasetRegistry.py
+"""
+import zlib
+import pytest
+from src.DatasetRegistry import (
+    CMA_DICTIONARY, COMBINED_STATS, DATASETS, HOUSING, LABOUR_MARKET, Dataset, Field,
+    housing_dataset, to_int, to_str, to_year
+)
+
+# Housing as declared with HOUSING_YEAR_FIELD=REF_DATE
+DATED_HOUSING = housing_dataset("REF_DATE")
+
+
+def test_to_int():
+    assert to_int("") == 0
+    assert to_int(None) == 0
+    assert to_int(42) == 42
+    assert to_int("1,234") == 1234
+    with pytest.raises(ValueError):
+        to_int("n/a")
+
+def test_to_year():
+    assert to_year(2024) == 2024
+    assert to_year("2024-03-15") == 2024
+    assert to_year(" 2024 ") == 2024
+    assert to_year("") == 0
+
+def test_to_str():
+    assert to_str(None) == ""
+    assert to_str(" Hamilton ") == "Hamilton"
+
+def test_registry_contains_datasets():
+    assert DATASETS == {"housing": HOUSING, "labour_market": LABOUR_MARKET}
+
+def test_extract_housing_record():
+    record = {
+        "id": 7, "CMA": "Toronto", "Month": "3", "Total_starts": "1,200", "Total_complete": "",
+        "Singles_starts": 1, "Semis_starts": 2, "Row_starts": 3, "Apt_Other_starts": 4,
+        "Singles_complete": 5, "Semis_complete": 6, "Row_complete": 7, "Apt_other_complete": 8,
+    }
+    assert HOUSING.extract(record) == (7, "Toronto", 3, 0, 1200, 0, 1, 2, 3, 4, 5, 6, 7, 8)
+    assert HOUSING.extract(dict(record, Year="2024"))[3] == 2024
+
+def test_extract_missing_field_raises_key_error():
+    with pytest.raises(KeyError):
+        LABOUR_MARKET.extract({"id": 1, "PROV": 35})
+
+def test_field_errors_reports_every_failing_field():
+    errors = LABOUR_MARKET.field_errors({"id": "1,000", "PROV": "n/a", "EDUC": ""})
+    assert set(errors) == {"PROV", "LFSSTAT"}
+    assert errors["LFSSTAT"] == "missing"
+    assert "n/a" in errors["PROV"]
+    assert LABOUR_MARKET.field_errors(None) == {"record": "expected an object, got NoneType"}
+
+def test_key_and_insert_params():
+    rows = [(1, 48, 2, 4)]
+    assert LABOUR_MARKET.key_of(rows[0]) == (1,)
+    assert LABOUR_MARKET.insert_params(rows) == rows
+    sql = LABOUR_MARKET.insert_sql()
+    assert sql.count("?") == len(LABOUR_MARKET.columns)
+    assert "INSERT INTO labour_market_data (jsonid, province, education_level, labour_force_status)" in sql
+    assert "ON DUPLICATE KEY UPDATE province = VALUES(province)" in sql
+    assert "jsonid = VALUES(jsonid)" not in sql
+
+def test_dictionary_lookup_params():
+    row = (7, "Toronto", 3, 0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10)
+    # The CMA name is passed again to resolve its dictionary id
+    assert HOUSING.insert_params([row]) == [row + ("Toronto",)]
+    assert "(SELECT id FROM cma_dictionary WHERE name = ?)" in HOUSING.insert_sql()
+    assert HOUSING.dictionary_names([row]) == {CMA_DICTIONARY: {"Toronto"}}
+
+def test_create_table_sql():
+    sql = HOUSING.create_table_sql()
+    assert sql.startswith("CREATE TABLE IF NOT EXISTS housing_data")
+    for column in HOUSING.columns:
+        assert column in sql
+    assert "cma_id SMALLINT UNSIGNED" in sql
+    assert "UNIQUE KEY uq_housing_data_key (jsonid)" in sql
+    # The feed sends no year, so housing is only partitioned with HOUSING_YEAR_FIELD
+    assert "PARTITION" not in sql
+    dated_sql = DATED_HOUSING.create_table_sql()
+    assert "UNIQUE KEY uq_housing_data_key (jsonid, year)" in dated_sql
+    assert "PRIMARY KEY (id, year)" in dated_sql
+    assert "PARTITION BY RANGE (year)" in dated_sql
+    assert "PRIMARY KEY" in LABOUR_MARKET.create_table_sql()
+    assert "PARTITION" not in LABOUR_MARKET.create_table_sql()
+    assert "KEY idx_housing_data_cma_totals (census_metropolitan_area, total_starts, total_complete)" in sql
+
+def test_new_dataset_is_derived_from_declaration():
+    dataset = Dataset(
+        name="rents", table="rent_data",
+        fields=[Field("id", "jsonid", "INT"), Field("CMA", "cma", "VARCHAR(64)", to_str)],
+        natural_key=["jsonid"], endpoint_env="API_URL_RENTS",
+    )
+    assert dataset.extract({"id": "5", "CMA": "Guelph"}) == (5, "Guelph")
+    assert "rent_data" in dataset.create_table_sql()
+
+def test_partition_routing():
+    # Records as the feed sends them, plus the date field named by HOUSING_YEAR_FIELD
+    records = [
+        {"id": 7, "CMA": "Toronto", "Month": 11, "REF_DATE": "2023-11", "Total_starts": 1200,
+         "Total_complete": 900, "Singles_starts": 1, "Semis_starts": 2, "Row_starts": 3,
+         "Apt_Other_starts": 4, "Singles_complete": 5, "Semis_complete": 6, "Row_complete": 7,
+         "Apt_other_complete": 8},
+        {"id": 8, "CMA": "Hamilton", "Month": 2, "REF_DATE": "2024-02", "Total_starts": 300,
+         "Total_complete": 250, "Singles_starts": 1, "Semis_starts": 2, "Row_starts": 3,
+         "Apt_Other_starts": 4, "Singles_complete": 5, "Semis_complete": 6, "Row_complete": 7,
+         "Apt_other_complete": 8},
+    ]
+    rows = [DATED_HOUSING.extract(record) for record in records]
+    assert [DATED_HOUSING.partition_of(row) for row in rows] == ["p2023", "p2024"]
+    assert DATED_HOUSING.partition_years(rows) == {2023, 2024}
+    assert DATED_HOUSING.key_of(rows[0]) == (7, 2023)
+    # Without the field a record has no year to partition by
+    with pytest.raises(KeyError):
+        DATED_HOUSING.extract({key: value for key, value in records[0].items() if key != "REF_DATE"})
+    assert DATED_HOUSING.insert_sql("p2024").startswith("INSERT INTO housing_data PARTITION (p2024) (")
+    assert HOUSING.partition_of(rows[0]) is None
+    assert LABOUR_MARKET.partition_of((1, 48, 2, 4)) is None
+
+def test_partition_table_sql():
+    assert DATED_HOUSING.partition_table_sql() == [
+        "ALTER TABLE housing_data DROP PRIMARY KEY, ADD PRIMARY KEY (id, year), "
+        "DROP KEY IF EXISTS uq_housing_data_key, ADD UNIQUE KEY uq_housing_data_key (jsonid, year)",
+        f"ALTER TABLE housing_data {DATED_HOUSING.partitioning.create_clause()}",
+    ]
+
+def test_split_partition_sql():
+    sql = DATED_HOUSING.partitioning.split_sql("housing_data", 2019, "p2024", 2025)
+    assert sql == (
+        "ALTER TABLE housing_data REORGANIZE PARTITION p2024 INTO ("
+        "PARTITION p2019 VALUES LESS THAN (2020), PARTITION p2024 VALUES LESS THAN (2025))"
+    )
+
+def test_checksum_sql_and_buckets():
+    assert LABOUR_MARKET.checksum_sql() == (
+        "SELECT jsonid DIV ? AS bucket, COUNT(*), BIT_XOR(CRC32(CONVERT(CONCAT_WS('|', "
+        "COALESCE(jsonid, 'NULL'), COALESCE(province, 'NULL'), "
+        "COALESCE(education_level, 'NULL'), COALESCE(labour_force_status, 'NULL')) "
+        "USING utf8mb4))) FROM labour_market_data GROUP BY bucket"
+    )
+    # Same value as MariaDB's CRC32(CONCAT_WS('|', 1, 35, 2, 1))
+    assert LABOUR_MARKET.row_checksum((1, 35, 2, 1)) == 0x38F06C3A
+    # NULLs keep their place & names are hashed as UTF-8
+    assert LABOUR_MARKET.row_checksum((1, None, 2, 1)) == zlib.crc32(b"1|NULL|2|1")
+    assert HOUSING.row_checksum((1, "Québec", None)) == zlib.crc32("1|Québec|NULL".encode("utf-8"))
+    assert LABOUR_MARKET.bucket_of((2500, 35, 2, 1), 1000) == 2
+    assert HOUSING.delete_sql() == "DELETE FROM housing_data WHERE jsonid = ?"
+    assert DATED_HOUSING.delete_sql() == "DELETE FROM housing_data WHERE jsonid = ? AND year = ?"
+
+def test_combined_stats_changed_cmas():
+    assert COMBINED_STATS.changed_cmas(HOUSING, [
+        (1, "Toronto", 1, 2024, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (2, "Nowhere", 1, 2024, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0),
+    ]) == {"Toronto", "Nowhere"}
+    alberta = COMBINED_STATS.changed_cmas(LABOUR_MARKET, [(1, 48, 2, 1)])
+    assert {"Calgary", "Edmonton"} <= alberta and "Toronto" not in alberta
+    assert COMBINED_STATS.refresh_params(["Toronto", "Nowhere"]) == [
+        (35, "Toronto", 35), (None, "Nowhere", None)
+    ]
+    assert COMBINED_STATS.bump_params({"Toronto": 4, "Nowhere": 1}) == [
+        ("combined_stats", "", 5), ("combined_stats", "Toronto", 4),
+        ("combined_stats", "Nowhere", 1),
+    ]
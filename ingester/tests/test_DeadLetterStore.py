@@ -0,0 +1,66 @@
+"""
+Test module for DeadLetterStore.py
+"""
+import gzip
+import json
+import pytest
+from src.DeadLetterStore import DeadLetterStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DeadLetterStore(directory=str(tmp_path))
+
+
+def test_add_is_buffered_until_flush(store):
+    store.add("housing", {"CMA": "Hamilton"}, "Missing field 'id'", offset=5000)
+    assert store.pending["housing"][0]["offset"] == 5000
+
+    store.flush()
+
+    assert store.pending == {}
+    with gzip.open(store.path_for("housing"), "rt", encoding="utf-8") as f:
+        entry = json.loads(f.readline())
+    assert entry["dataset"] == "housing"
+    assert entry["reason"] == "Missing field 'id'"
+    assert entry["record"] == {"CMA": "Hamilton"}
+    assert entry["timestamp"]
+
+def test_flush_appends_across_batches(store):
+    store.add("housing", {"id": 1}, "bad", offset=0)
+    store.flush()
+    store.add("housing", {"id": 2}, "bad", offset=5000)
+    store.flush()
+
+    entries = store.read("housing")
+    assert [entry["record"]["id"] for entry in entries] == [1, 2]
+    assert store.count("housing") == 2
+
+def test_read_missing_dataset(store):
+    assert store.read("labour_market") == []
+
+def test_replace_rewrites_and_removes(store):
+    store.add("housing", {"id": 1}, "bad")
+    store.add("housing", {"id": 2}, "bad")
+    store.flush()
+
+    store.replace("housing", store.read("housing")[1:])
+    assert [entry["record"]["id"] for entry in store.read("housing")] == [2]
+
+    store.replace("housing", [])
+    assert store.read("housing") == []
+
+def test_replace_replayed_keeps_rejects_added_meanwhile(store):
+    store.add("housing", {"id": 1}, "bad")
+    store.add("housing", {"id": 2}, "bad")
+    entries = store.read("housing")
+    # Another writer dead-letters a record while the replay runs
+    store.add("housing", {"id": 3}, "bad")
+    store.flush()
+    # The replay rejects id 2 again
+    store.add("housing", {"id": 2}, "still bad")
+
+    store.replace_replayed("housing", entries)
+
+    assert [entry["record"]["id"] for entry in store.read("housing")] == [3, 2]
+    assert store.pending == {}
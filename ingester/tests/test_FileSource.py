@@ -0,0 +1,71 @@
+"""
+Test module for FileSource.py
+"""
+import json
+import pytest
+from src.DatasetRegistry import HOUSING, LABOUR_MARKET
+from src.FileSource import FileSource
+
+
+def test_csv_columns_are_matched_to_api_fields(tmp_path):
+    path = tmp_path / "labour.csv"
+    path.write_text("﻿ID,prov,Educ,LFSSTAT,extra\n1,35,2,1,x\n2,48,\"1\",4,y\n3,10,3,1,z\n",
+                    encoding="utf-8")
+
+    batches = list(FileSource(LABOUR_MARKET, str(path), batch_size=2).batches())
+
+    assert [offset for offset, _ in batches] == [0, 2]
+    assert batches[0][1][0] == {"id": "1", "PROV": "35", "EDUC": "2", "LFSSTAT": "1"}
+    assert [LABOUR_MARKET.extract(record) for record in batches[1][1]] == [(3, 10, 3, 1)]
+
+
+def test_ndjson_with_column_map(tmp_path):
+    path = tmp_path / "housing.ndjson"
+    record = {"id": 7, "Census Area": "Hamilton", "Month": 3, "Total_starts": 5}
+    path.write_text(json.dumps(record) + "\n\n", encoding="utf-8")
+
+    source = FileSource(HOUSING, str(path), column_map={"Census Area": "CMA"})
+    [(offset, records)] = list(source.batches())
+
+    assert offset == 0
+    assert records == [{"id": 7, "CMA": "Hamilton", "Month": 3, "Total_starts": 5}]
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / "empty.csv"
+    path.write_text("")
+    assert list(FileSource(LABOUR_MARKET, str(path)).batches()) == []
+
+
+def test_json_file_is_an_array_of_records(tmp_path):
+    path = tmp_path / "labour.json"
+    path.write_text(json.dumps([{"id": 1, "PROV": 35}, {"id": 2, "PROV": 48}, "oops"]),
+                    encoding="utf-8-sig")
+
+    [(offset, records)] = list(FileSource(LABOUR_MARKET, str(path)).batches())
+
+    assert offset == 0
+    # Anything but an object is left for the extractor to reject
+    assert records == [{"id": 1, "PROV": 35}, {"id": 2, "PROV": 48}, "oops"]
+
+
+def test_json_file_must_hold_an_array(tmp_path):
+    path = tmp_path / "labour.json"
+    path.write_text(json.dumps({"id": 1}), encoding="utf-8")
+
+    with pytest.raises(ValueError):
+        list(FileSource(LABOUR_MARKET, str(path)).batches())
+
+
+def test_invalid_ndjson_lines_are_reported(tmp_path):
+    path = tmp_path / "labour.ndjson"
+    path.write_text('{"id": 1}\nnot json\n{"id": 2}\n', encoding="utf-8")
+    invalid = []
+
+    source = FileSource(LABOUR_MARKET, str(path),
+                        on_invalid=lambda offset, line, reason: invalid.append((offset, line)))
+    assert list(source.batches()) == [(0, [{"id": 1}, {"id": 2}])]
+    assert invalid == [(1, "not json")]
+
+    with pytest.raises(ValueError):
+        list(FileSource(LABOUR_MARKET, str(path)).batches())
@@ -0,0 +1,60 @@
+"""
+Test module for RateController.py
+"""
+from datetime import datetime, timezone
+from src.RateController import RateController, parse_retry_after
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_parse_retry_after():
+    now = datetime(2025, 3, 1, 12, 0, 0, tzinfo=timezone.utc)
+    assert parse_retry_after("30") == 30
+    assert parse_retry_after("Sat, 01 Mar 2025 12:00:10 GMT", now) == 10
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+
+
+def test_limit_grows_additively_and_halves_on_throttling():
+    clock = FakeClock()
+    rate = RateController(initial=1, maximum=4, clock=clock)
+    for _ in range(6):
+        rate.acquire()
+        rate.release(0.5, 200)
+    assert rate.window() == 3
+
+    rate.acquire()
+    rate.release(0.5, 429)
+    assert rate.window() == 1
+
+
+def test_slow_responses_and_errors_count_as_congestion():
+    clock = FakeClock()
+    rate = RateController(initial=4, maximum=8, latency_target=5, cooldown=1, clock=clock)
+    rate.acquire()
+    rate.release(12, 200)
+    assert rate.window() == 2
+
+    # A second congestion signal within the cooldown doesn't cut again
+    rate.acquire()
+    rate.release(0.1, None)
+    assert rate.window() == 2
+
+    clock.now = 2
+    rate.acquire()
+    rate.release(0.1, 503)
+    assert rate.window() == 1
+
+
+def test_retry_after_pauses_requests():
+    clock = FakeClock()
+    rate = RateController(clock=clock)
+    rate.acquire()
+    rate.release(0.1, 429, retry_after=30)
+    assert rate.paused_until == 30
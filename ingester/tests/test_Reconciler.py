@@ -0,0 +1,95 @@
+"""
+Test module for Reconciler.py
+"""
+from unittest.mock import MagicMock
+from src.DatasetRegistry import LABOUR_MARKET
+from src.RecordFilter import RecordFilter
+from src.Reconciler import Reconciler
+from src.SqliteHandler import SqliteHandler
+
+
+def record(jsonid, province=35):
+    return {"id": jsonid, "PROV": province, "EDUC": 2, "LFSSTAT": 1}
+
+
+class FakeIngester:
+    """DataIngester stand-in serving fixed pages & a table held in memory"""
+
+    def __init__(self, pages, stored_rows):
+        self.pages = pages
+        self.page_size = 2
+        self.fetched = []
+        self.current_offset = None
+        self.dead_letters = MagicMock()
+        self.filters = {LABOUR_MARKET.name: RecordFilter(LABOUR_MARKET, pushdown=False, fields_param="")}
+        self.stored = {LABOUR_MARKET.key_of(row): row for row in stored_rows}
+        self.db = MagicMock()
+        self.db.checksums.side_effect = self.checksums
+        self.db.bucket_keys.side_effect = self.bucket_keys
+        self.db.delete_keys.side_effect = self.delete_keys
+
+    def fetch_batch(self, url, offset, params=None):
+        self.fetched.append(offset)
+        return self.pages.get(offset, [])
+
+    def checksums(self, dataset, bucket_size, where=("", ())):
+        sums = {}
+        for row in self.stored.values():
+            bucket = dataset.bucket_of(row, bucket_size)
+            count, checksum = sums.get(bucket, (0, 0))
+            sums[bucket] = (count + 1, checksum ^ dataset.row_checksum(row))
+        return sums
+
+    def bucket_keys(self, dataset, bucket_size, bucket):
+        return [key for key, row in self.stored.items()
+                if dataset.bucket_of(row, bucket_size) == bucket]
+
+    def delete_keys(self, dataset, keys):
+        for key in keys:
+            del self.stored[key]
+        return len(keys)
+
+    def process_batch(self, dataset, records):
+        for rec in records:
+            row = dataset.extract(rec)
+            self.stored[dataset.key_of(row)] = row
+        return len(records)
+
+
+def test_only_differing_ranges_are_refetched_and_repaired():
+    pages = {0: [record(1), record(2)], 2: [record(11), record(12, province=10)]}
+    stored = [LABOUR_MARKET.extract(rec) for rec in (record(1), record(2), record(11), record(12))]
+    stored.append(LABOUR_MARKET.extract(record(13)))  # deleted upstream
+    ingester = FakeIngester(pages, stored)
+
+    summary = Reconciler(ingester, bucket_size=10).verify(LABOUR_MARKET)
+
+    assert summary == {"buckets": 2, "differing": 1, "upserted": 2, "deleted": 1}
+    # Full scan, then only the page holding bucket 1 again
+    assert ingester.fetched == [0, 2, 4, 2]
+    assert Reconciler(ingester, bucket_size=10).verify(LABOUR_MARKET)["differing"] == 0
+
+
+def test_dry_run_only_reports():
+    ingester = FakeIngester({0: [record(1)]}, [])
+
+    summary = Reconciler(ingester, bucket_size=10, dry_run=True).verify(LABOUR_MARKET)
+
+    assert summary["differing"] == 1
+    assert summary["upserted"] == 0
+    ingester.db.delete_keys.assert_not_called()
+
+def test_stored_rows_outside_the_filter_are_not_compared(tmp_path):
+    ingester = FakeIngester({0: [record(1), record(2, province=10)]}, [])
+    ingester.filters[LABOUR_MARKET.name] = RecordFilter(
+        LABOUR_MARKET, {"PROV": [35]}, pushdown=False, fields_param=""
+    )
+    ingester.db = SqliteHandler(True, path=str(tmp_path / "test.db"))
+    # Stored before the filter was narrowed to Ontario
+    ingester.db.insert_rows(LABOUR_MARKET, [LABOUR_MARKET.extract(record(1)),
+                                            LABOUR_MARKET.extract(record(3, province=10))])
+
+    summary = Reconciler(ingester, bucket_size=10).verify(LABOUR_MARKET)
+
+    assert summary["differing"] == 0
+    ingester.db.close()
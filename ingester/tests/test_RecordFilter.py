@@ -0,0 +1,43 @@
+"""
+Test module for RecordFilter.py
+"""
+import pytest
+from src.DatasetRegistry import HOUSING, LABOUR_MARKET
+from src.RecordFilter import RecordFilter
+
+
+def test_filters_records_client_side():
+    record_filter = RecordFilter(LABOUR_MARKET, {"PROV": ["35", 48]}, pushdown=False, fields_param="")
+    records = [{"id": 1, "PROV": 35}, {"id": 2, "PROV": "10"}, {"id": 3, "PROV": "48"},
+               {"id": 4, "PROV": "n/a"}]
+    # Unconvertible values are kept so extraction dead-letters them
+    assert [record["id"] for record in record_filter.apply(records)] == [1, 3, 4]
+    assert record_filter.params() == {}
+
+
+def test_pushes_filter_and_projection_down():
+    record_filter = RecordFilter(LABOUR_MARKET, {"PROV": [35, 48]}, pushdown=True, fields_param="fields")
+    assert record_filter.params() == {"PROV": "35,48", "fields": "id,PROV,EDUC,LFSSTAT"}
+
+
+def test_from_env_and_start_date(monkeypatch):
+    monkeypatch.setenv("INGEST_FILTER_HOUSING", '{"CMA": ["Hamilton", "Toronto"], "after": "2020-01-01"}')
+    record_filter = RecordFilter.from_env(HOUSING)
+    assert record_filter.accepts({"CMA": " Toronto "})
+    assert not record_filter.accepts({"CMA": "Ottawa-Gatineau"})
+    assert record_filter.start_date(None) == "2020-01-01"
+    assert record_filter.start_date("2019-06-01") == "2020-01-01"
+    assert record_filter.start_date("2024-06-01") == "2024-06-01"
+
+
+def test_rejects_unknown_field():
+    with pytest.raises(ValueError):
+        RecordFilter(HOUSING, {"Province": ["ON"]})
+
+def test_where_selects_stored_rows_passing_the_filter():
+    record_filter = RecordFilter(HOUSING, {"CMA": ["Toronto", "Hamilton"]}, pushdown=False,
+                                 fields_param="")
+    assert record_filter.where() == (
+        "census_metropolitan_area IN (?, ?)", ("Hamilton", "Toronto")
+    )
+    assert RecordFilter(HOUSING, pushdown=False, fields_param="").where() == ("", ())
@@ -0,0 +1,95 @@
+"""
+Test module for RunLock.py
+"""
+import pytest
+from src.DatasetRegistry import HOUSING
+from src.RunLock import RunLock
+
+
+class FakeBackend:
+    def __init__(self, held=False):
+        self.held = held
+        self.requests = set()
+        self.timeouts = []
+
+    def lock(self, name, timeout=0):
+        self.timeouts.append(timeout)
+        if self.held:
+            return False
+        self.held = True
+        return True
+
+    def unlock(self, name):
+        self.held = False
+
+    def query(self, sql, params=()):
+        return [(1,)] if params[0] in self.requests else []
+
+    def execute(self, sql, params=()):
+        if sql.startswith("REPLACE"):
+            self.requests.add(params[0])
+            return 1
+        if params[0] in self.requests:
+            self.requests.discard(params[0])
+            return 1
+        return 0
+
+
+def test_runs_under_the_lock():
+    db = FakeBackend()
+    assert RunLock(db, mode="skip").run(HOUSING, lambda: 5) == 5
+    assert db.held is False
+
+
+def test_skips_when_another_instance_runs():
+    db = FakeBackend(held=True)
+    calls = []
+    assert RunLock(db, mode="skip").run(HOUSING, lambda: calls.append(1) or 5) == 0
+    assert calls == []
+    assert db.timeouts == [0]
+
+
+def test_wait_uses_the_timeout():
+    db = FakeBackend(held=True)
+    RunLock(db, mode="wait", timeout=30).run(HOUSING, lambda: 5)
+    assert db.timeouts == [30]
+
+
+def test_handoff_leaves_a_request_for_the_holder():
+    db = FakeBackend(held=True)
+    assert RunLock(db, mode="handoff").run(HOUSING, lambda: 5) == 0
+    assert db.requests == {"housing"}
+
+    db.held = False
+    runs = []
+
+    def ingest():
+        runs.append(1)
+        if len(runs) == 1:
+            # Another instance hands a run off while this one is running
+            db.requests.add("housing")
+        return 5
+
+    assert RunLock(db, mode="skip").run(HOUSING, ingest) == 10
+    assert db.requests == set()
+
+
+def test_handoff_while_releasing_the_lock_is_run():
+    class RacingBackend(FakeBackend):
+        def unlock(self, name):
+            super().unlock(name)
+            if not self.timeouts[1:]:
+                # A run is handed off after the holder's last check, before it unlocked
+                self.requests.add("housing")
+
+    db = RacingBackend()
+    runs = []
+    assert RunLock(db, mode="skip").run(HOUSING, lambda: runs.append(1) or 5) == 10
+    assert runs == [1, 1]
+    assert db.requests == set()
+    assert db.held is False
+
+
+def test_rejects_unknown_mode():
+    with pytest.raises(ValueError):
+        RunLock(FakeBackend(), mode="queue")
@@ -0,0 +1,54 @@
+import threading
+from src.Scheduler import Scheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_jobs_run_when_due():
+    clock = FakeClock()
+    scheduler = Scheduler(clock=clock)
+    calls = []
+    scheduler.every("housing", 60, lambda: calls.append("housing"))
+    scheduler.every("labour_market", 300, lambda: calls.append("labour_market"), run_now=False)
+
+    assert scheduler.run_pending() == ["housing"]
+    assert scheduler.seconds_until_next() == 60
+
+    clock.now = 60
+    assert scheduler.run_pending() == ["housing"]
+
+    clock.now = 300
+    assert scheduler.run_pending() == ["housing", "labour_market"]
+    assert calls == ["housing", "housing", "housing", "labour_market"]
+
+
+def test_failing_job_is_rescheduled():
+    clock = FakeClock()
+    scheduler = Scheduler(clock=clock)
+
+    def fail():
+        raise RuntimeError("API down")
+
+    scheduler.every("housing", 60, fail)
+    assert scheduler.run_pending() == ["housing"]
+    assert scheduler.jobs[0].next_run == 60
+
+
+def test_run_forever_stops_on_event():
+    scheduler = Scheduler()
+    stop_event = threading.Event()
+    runs = []
+
+    def job():
+        runs.append(1)
+        stop_event.set()
+
+    scheduler.every("housing", 3600, job)
+    scheduler.run_forever(stop_event)
+    assert runs == [1]
@@ -0,0 +1,179 @@
+"""
+Test module for SchemaMigrations.py
+"""
+import os
+import re
+from unittest.mock import MagicMock
+import pytest
+import mariadb
+from src.SchemaMigrations import (
+    MIGRATIONS, AddIndex, AlterTable, Deduplicate, Migration, SchemaMigrator, Sql, When
+)
+
+SETUP_SQL = os.path.join(os.path.dirname(__file__), "../../database/scripts/setup.sql")
+
+
+class FakeCursor:
+    """Cursor answering the migrator's queries from a given schema version"""
+
+    def __init__(self, version=0, failing=(), has_version_table=True):
+        self.version = version
+        self.failing = failing
+        self.has_version_table = has_version_table
+        self.executed = []
+        self.result = None
+
+    def execute(self, statement, params=None):
+        if any(fail in statement for fail in self.failing):
+            raise mariadb.Error(f"cannot run {statement}")
+        self.executed.append(statement)
+        if statement.startswith("SELECT MAX(version)"):
+            if not self.has_version_table:
+                raise mariadb.Error("Table 'schema_version' doesn't exist")
+            self.result = (self.version,)
+        elif statement.startswith("SELECT GET_LOCK"):
+            self.result = (1,)
+        else:
+            self.result = None
+
+    def fetchone(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+def make_conn(cursor):
+    conn = MagicMock()
+    conn.cursor.return_value = cursor
+    return conn
+
+
+def test_migrations_are_ordered_and_unique():
+    versions = [migration.version for migration in MIGRATIONS]
+    assert versions == sorted(set(versions))
+    assert versions[0] == 1
+
+@pytest.mark.skipif(not os.path.exists(SETUP_SQL), reason="database/ is not in the ingester image")
+def test_migration_1_matches_setup_sql():
+    """The database bootstrap & migration 1 create the same original tables"""
+    with open(SETUP_SQL, "r", encoding="utf-8") as f:
+        setup = f.read()
+    created = [
+        " ".join(statement.split())
+        for statement in re.findall(r"CREATE TABLE.*?\n\);", setup, re.S)
+    ]
+    migration = [" ".join(step.describe().split()) + ";" for step in MIGRATIONS[0].steps]
+    assert created == migration
+
+def test_current_version_new_database():
+    assert SchemaMigrator(make_conn(FakeCursor(version=None))).current_version() == 0
+
+def test_migrate_applies_only_pending_under_lock():
+    cursor = FakeCursor(version=1)
+    migrations = [Migration(1, "one", ["SELECT 1"]), Migration(2, "two", ["SELECT 2"])]
+
+    applied = SchemaMigrator(make_conn(cursor), migrations).migrate()
+
+    assert applied == [2]
+    assert "SELECT 1" not in cursor.executed
+    assert cursor.executed.index("SELECT GET_LOCK(?, ?)") < cursor.executed.index("SELECT 2")
+    assert cursor.executed[-1] == "SELECT RELEASE_LOCK(?)"
+
+def test_migrate_stops_at_failure():
+    cursor = FakeCursor(version=0, failing=["BROKEN"])
+    conn = make_conn(cursor)
+    migrations = [Migration(1, "bad", ["BROKEN"]), Migration(2, "two", ["SELECT 2"])]
+
+    with pytest.raises(mariadb.Error):
+        SchemaMigrator(conn, migrations).migrate()
+    assert "SELECT 2" not in cursor.executed
+    conn.rollback.assert_called_once()
+    # The lock is released even when a migration fails
+    assert cursor.executed[-1] == "SELECT RELEASE_LOCK(?)"
+
+def test_dry_run_executes_nothing():
+    cursor = FakeCursor(has_version_table=False)
+    migrations = [Migration(1, "one", ["CREATE TABLE a (id INT)"])]
+
+    pending = SchemaMigrator(make_conn(cursor), migrations, dry_run=True).migrate()
+
+    assert pending == [1]
+    # Only the version lookup runs, no lock, no DDL
+    assert cursor.executed == ["SELECT MAX(version) FROM schema_version"]
+
+def test_add_index_is_online():
+    step = AddIndex("housing_data", "idx_cma", ["census_metropolitan_area"])
+    cursor = FakeCursor()
+
+    step.run(cursor)
+
+    assert cursor.executed == [
+        "ALTER TABLE housing_data ADD KEY IF NOT EXISTS idx_cma (census_metropolitan_area), "
+        "ALGORITHM=INPLACE, LOCK=NONE"
+    ]
+
+def test_add_index_falls_back_to_shared_lock():
+    step = AddIndex("housing_data", "uq_key", ["jsonid"], unique=True)
+    cursor = FakeCursor(failing=["LOCK=NONE"])
+
+    step.run(cursor)
+
+    assert cursor.executed == [
+        "ALTER TABLE housing_data ADD UNIQUE KEY IF NOT EXISTS uq_key (jsonid), "
+        "ALGORITHM=INPLACE, LOCK=SHARED"
+    ]
+
+def test_alter_table_falls_back_to_shared_lock_without_algorithm():
+    step = AlterTable("labour_market_data", "MODIFY province TINYINT UNSIGNED")
+    cursor = FakeCursor(failing=["LOCK=NONE"])
+
+    step.run(cursor)
+
+    # Type changes copy the table, which allows reads but not LOCK=NONE
+    assert cursor.executed == [
+        "ALTER TABLE labour_market_data MODIFY province TINYINT UNSIGNED, LOCK=SHARED"
+    ]
+
+def test_deduplicate_deletes_older_rows_in_batches():
+    cursor = MagicMock()
+    cursor.fetchall.side_effect = [[(1, 10), (4, 12)], [(9, 20)]]
+    step = Deduplicate("housing_data", batch_size=2)
+
+    step.run(cursor)
+
+    finds = [c.args[1] for c in cursor.execute.call_args_list]
+    # Each batch resumes after the last key of the previous one
+    assert finds == [(-2 ** 31 - 1, 2), (4, 2)]
+    deletes = [c.args for c in cursor.executemany.call_args_list]
+    assert deletes == [
+        ("DELETE FROM housing_data WHERE jsonid = ? AND id < ?", [(1, 10), (4, 12)]),
+        ("DELETE FROM housing_data WHERE jsonid = ? AND id < ?", [(9, 20)]),
+    ]
+    assert cursor.connection.commit.call_count == 2
+
+def test_duplicates_are_removed_through_an_index():
+    steps = MIGRATIONS[1].steps
+    for table in ("housing_data", "labour_market_data"):
+        [dedup] = [i for i, step in enumerate(steps)
+                   if isinstance(step, Deduplicate) and step.table == table]
+        index = steps[dedup - 1]
+        assert isinstance(index, AddIndex) and index.columns == ["jsonid"]
+    assert not any("JOIN" in step.describe() and "DELETE" in step.describe() for step in steps)
+
+def test_strings_become_sql_steps():
+    migration = Migration(3, "three", ["SELECT 3"])
+    assert isinstance(migration.steps[0], Sql)
+    assert migration.steps[0].describe() == "SELECT 3"
+
+def test_when_runs_steps_only_if_condition_holds():
+    cursor = MagicMock()
+    step = When("SELECT COUNT(*) = 0 FROM information_schema.PARTITIONS", ["ALTER TABLE t"])
+
+    cursor.fetchone.return_value = (0,)
+    step.run(cursor)
+    assert cursor.execute.call_count == 1
+
+    cursor.fetchone.return_value = (1,)
+    step.run(cursor)
+    assert cursor.execute.call_args_list[-1].args[0] == "ALTER TABLE t"
@@ -0,0 +1,106 @@
+"""
+Test module for ShardedWriter.py
+"""
+import threading
+from unittest.mock import MagicMock
+from src.DatasetRegistry import LABOUR_MARKET
+from src.ShardedWriter import ShardedWriter
+
+
+def labour_rows(count):
+    return [(jsonid, 35, 1, 1) for jsonid in range(count)]
+
+
+class RecordingDb:
+    """DatabaseHandler stand-in remembering which thread wrote which keys"""
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.lock = threading.Lock()
+        self.writes = []
+
+    def insert_rows(self, dataset, rows):
+        if self.fail_on is not None and any(row[0] == self.fail_on for row in rows):
+            raise RuntimeError("deadlock")
+        with self.lock:
+            self.writes.append((threading.current_thread().name, [row[0] for row in rows]))
+        return len(rows)
+
+
+def test_rows_are_sharded_by_natural_key():
+    db = RecordingDb()
+    writer = ShardedWriter(db, shards=3, batch_size=10).start()
+
+    writer.submit(LABOUR_MARKET, labour_rows(100))
+    writer.submit(LABOUR_MARKET, labour_rows(100))  # same keys again
+    summary = writer.close()
+
+    assert summary == {"labour_market": {"written": 200, "failed": 0, "batches": len(db.writes)}}
+    owner = {}
+    for thread, keys in db.writes:
+        for key in keys:
+            # A key is always written by the same writer
+            assert owner.setdefault(key, thread) == thread
+    assert len(set(owner.values())) == 3
+
+def test_batches_are_filled_up_to_batch_size():
+    db = RecordingDb()
+    writer = ShardedWriter(db, shards=1, batch_size=50).start()
+
+    for start in range(0, 120, 10):
+        writer.submit(LABOUR_MARKET, [(jsonid, 35, 1, 1) for jsonid in range(start, start + 10)])
+    writer.close()
+
+    assert [len(keys) for _, keys in db.writes] == [50, 50, 20]
+
+def test_failed_batch_is_reported_with_its_records():
+    db = RecordingDb(fail_on=7)
+    on_error = MagicMock()
+    writer = ShardedWriter(db, shards=1, batch_size=5, on_error=on_error).start()
+    rows = labour_rows(10)
+    records = [{"id": row[0]} for row in rows]
+
+    writer.submit(LABOUR_MARKET, rows, records)
+    summary = writer.close()
+
+    assert summary["labour_market"] == {"written": 5, "failed": 5, "batches": 2}
+    dataset, failed_records, error = on_error.call_args[0]
+    assert dataset is LABOUR_MARKET
+    assert [record["id"] for record in failed_records] == [5, 6, 7, 8, 9]
+    assert isinstance(error, RuntimeError)
+
+
+def test_on_written_sees_only_stored_rows():
+    written = []
+    writer = ShardedWriter(RecordingDb(fail_on=3), shards=1, batch_size=5,
+                           on_written=lambda dataset, rows: written.extend(rows)).start()
+
+    writer.submit(LABOUR_MARKET, labour_rows(10))
+    writer.close()
+
+    assert sorted(row[0] for row in written) == [5, 6, 7, 8, 9]
+
+
+def test_failing_callbacks_keep_writer_threads_alive():
+    def broken_callback(*args):
+        raise ValueError("callback bug")
+
+    db = RecordingDb(fail_on=3)
+    writer = ShardedWriter(db, shards=1, batch_size=5, queue_size=1,
+                           on_error=broken_callback, on_written=broken_callback).start()
+
+    def produce():
+        # More batches than the queue holds, so a dead thread would block submit()
+        writer.submit(LABOUR_MARKET, labour_rows(40))
+        result.append(writer.close())
+
+    result = []
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    producer.join(timeout=10)
+
+    assert not producer.is_alive()
+    [summary] = result
+    assert summary["labour_market"] == {"written": 35, "failed": 5, "batches": 8}
+    # A batch whose on_written callback failed was still stored, not failed
+    assert sorted(key for _, keys in db.writes for key in keys) == list(range(5, 40))
@@ -0,0 +1,77 @@
+from datetime import datetime, timezone
+import pytest
+from src.DatasetRegistry import HOUSING, LABOUR_MARKET, housing_dataset
+from src.SnapshotWriter import SnapshotWriter
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+def housing_row(jsonid, year, total_starts):
+    return (jsonid, "Toronto", 1, year, total_starts, 0, 0, 0, 0, 0, 0, 0, 0, 0)
+
+
+def test_rows_are_written_per_period(tmp_path):
+    dated_housing = housing_dataset("REF_DATE")
+    snapshots = SnapshotWriter(directory=str(tmp_path))
+    snapshots.add(dated_housing, [housing_row(1, 2023, 10), housing_row(2, 2024, 20)])
+    snapshots.add(LABOUR_MARKET, [(1, 35, 2, 1)])
+    snapshots.flush()
+
+    assert len(snapshots.parts(dated_housing, "year=2023")) == 1
+    assert len(snapshots.parts(dated_housing, "year=2024")) == 1
+    [labour_part] = snapshots.parts(LABOUR_MARKET)
+    table = pq.read_table(labour_part)
+    assert table.column_names == list(LABOUR_MARKET.columns)
+    assert str(table.schema.field("province").type) == "uint8"
+
+
+def test_compact_keeps_newest_row_per_key(tmp_path):
+    snapshots = SnapshotWriter(directory=str(tmp_path))
+    snapshots.add(HOUSING, [housing_row(1, 2024, 10), housing_row(2, 2024, 20)])
+    snapshots.flush()
+    snapshots.add(HOUSING, [housing_row(1, 2024, 15)])
+    snapshots.flush()
+
+    assert snapshots.compact(HOUSING) == 2
+    [part] = snapshots.parts(HOUSING)
+    totals = dict(zip(*pq.read_table(part, columns=["jsonid", "total_starts"]).to_pydict().values()))
+    assert totals == {1: 15, 2: 20}
+
+
+def test_unpartitioned_rows_are_written_per_ingest_month(tmp_path):
+    snapshots = SnapshotWriter(directory=str(tmp_path))
+    snapshots.add(HOUSING, [housing_row(1, 0, 10)])
+    snapshots.flush()
+
+    month = datetime.now(timezone.utc).strftime("%Y-%m")
+    assert len(snapshots.parts(HOUSING, f"ingested={month}")) == 1
+
+
+def test_compact_folds_rows_ingested_again_in_later_months(tmp_path):
+    snapshots = SnapshotWriter(directory=str(tmp_path))
+    # Earlier runs: jsonid 1 & 2 in January, jsonid 1 again in February
+    for month, rows in (("2024-01", [housing_row(1, 0, 10), housing_row(2, 0, 20)]),
+                        ("2024-02", [housing_row(1, 0, 15)])):
+        path = tmp_path / "housing" / f"ingested={month}" / f"part-{month.replace('-', '')}.parquet"
+        snapshots.write(HOUSING, str(path), rows)
+    snapshots.add(HOUSING, [housing_row(3, 0, 30)])
+    snapshots.flush()
+
+    assert snapshots.compact(HOUSING) == 3
+    totals = {}
+    for part in snapshots.parts(HOUSING):
+        period = part.split("/")[-2]
+        columns = pq.read_table(part, columns=["jsonid", "total_starts"]).to_pydict().values()
+        totals.update({jsonid: (period, total) for jsonid, total in zip(*columns)})
+    month = datetime.now(timezone.utc).strftime("%Y-%m")
+    assert totals == {1: ("ingested=2024-02", 15), 2: ("ingested=2024-01", 20),
+                      3: (f"ingested={month}", 30)}
+    assert len(snapshots.parts(HOUSING)) == 3
+
+
+def test_disabled_without_directory(tmp_path):
+    snapshots = SnapshotWriter(directory="")
+    snapshots.add(HOUSING, [housing_row(1, 2024, 10)])
+    snapshots.flush()
+    assert not snapshots.enabled
+    assert snapshots.pending == {}
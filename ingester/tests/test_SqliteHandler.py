@@ -0,0 +1,172 @@
+"""
+Test module for SqliteHandler.py, run against a real embedded database
+"""
+import pytest
+from src.DatasetRegistry import COMBINED_STATS, DATASETS, HOUSING, LABOUR_MARKET, housing_dataset
+from src.SqliteHandler import SqliteHandler
+from src.StorageBackend import StorageBackend
+
+
+@pytest.fixture
+def db(tmp_path):
+    handler = SqliteHandler(True, path=str(tmp_path / "test.db"))
+    yield handler
+    handler.close()
+
+
+def housing_row(jsonid, area, total_starts):
+    return (jsonid, area, 1, 2024, total_starts, 0, 0, 0, 0, 0, 0, 0, 0, 0)
+
+
+def test_upsert_keeps_one_row_per_natural_key(db):
+    db.insert_rows(HOUSING, [housing_row(1, "Hamilton", 10), housing_row(2, "Toronto", 20)])
+    db.insert_rows(HOUSING, [housing_row(1, "Hamilton", 15)])
+
+    rows = db.query("SELECT jsonid, census_metropolitan_area, total_starts, cma_id "
+                    "FROM housing_data ORDER BY jsonid")
+    names = dict(db.query("SELECT name, id FROM cma_dictionary"))
+    assert rows == [(1, "Hamilton", 15, names["Hamilton"]), (2, "Toronto", 20, names["Toronto"])]
+
+
+def test_batches_bump_data_versions(db):
+    db.insert_rows(HOUSING, [housing_row(1, "Hamilton", 10), housing_row(2, "Toronto", 20)])
+    db.insert_rows(HOUSING, [housing_row(1, "Hamilton", 15)])
+
+    versions = dict(((dataset, scope), version) for dataset, scope, version in db.query(
+        "SELECT dataset, scope, version FROM data_version"))
+    assert versions == {("housing", ""): 2, ("housing", "Hamilton"): 2, ("housing", "Toronto"): 1}
+
+
+def test_only_changed_cmas_bump_data_versions(db):
+    db.insert_rows(HOUSING, [housing_row(1, "Hamilton", 10), housing_row(2, "Toronto", 20)])
+    db.insert_rows(HOUSING, [housing_row(1, "Hamilton", 10), housing_row(2, "Toronto", 25)])
+    db.insert_rows(HOUSING, [housing_row(1, "Hamilton", 10), housing_row(2, "Toronto", 25)])
+
+    versions = {(dataset, scope): (version, changed) for dataset, scope, version, changed in db.query(
+        "SELECT dataset, scope, version, changed_rows FROM data_version")}
+    assert versions == {("housing", ""): (2, 1), ("housing", "Hamilton"): (1, 1),
+                        ("housing", "Toronto"): (2, 1)}
+
+
+def test_backends_must_implement_the_interface():
+    class Partial(StorageBackend):  # pylint: disable=abstract-method
+        def connect(self):
+            pass
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_checksums_match_the_registry(db):
+    rows = [(1, 35, 2, 1), (2, 48, 1, 4), (1500, 10, 3, 1)]
+    db.insert_rows(LABOUR_MARKET, rows)
+
+    assert db.checksums(LABOUR_MARKET, 1000) == {
+        0: (2, LABOUR_MARKET.row_checksum(rows[0]) ^ LABOUR_MARKET.row_checksum(rows[1])),
+        1: (1, LABOUR_MARKET.row_checksum(rows[2])),
+    }
+    assert db.bucket_keys(LABOUR_MARKET, 1000, 1) == [(1500,)]
+
+    db.delete_keys(LABOUR_MARKET, [(1500,)])
+    assert db.checksums(LABOUR_MARKET, 1000).keys() == {0}
+
+
+def test_checksums_match_the_registry_for_accented_names_and_nulls(db):
+    rows = [housing_row(1, "Québec", 10), housing_row(2, "Montréal", 20),
+            (3, "Trois-Rivières", None, 2024, 5, 0, 0, 0, 0, 0, 0, 0, 0, 0)]
+    db.insert_rows(HOUSING, rows)
+
+    checksum = 0
+    for row in rows:
+        checksum ^= HOUSING.row_checksum(row)
+    assert db.checksums(HOUSING, 1000) == {0: (3, checksum)}
+    # A NULL isn't skipped, so it doesn't hash like the neighbouring columns shifted over
+    assert HOUSING.row_checksum(rows[2]) != HOUSING.row_checksum(
+        tuple(value for value in rows[2] if value is not None))
+
+
+def test_refresh_combined_joins_housing_and_labour(db):
+    db.insert_rows(HOUSING, [housing_row(1, "Hamilton", 10), housing_row(2, "Hamilton", 5),
+                             housing_row(3, "Nowhere", 7)])
+    db.insert_rows(LABOUR_MARKET, [(1, 35, 2, 1), (2, 35, 2, 2), (3, 35, 4, 1), (4, 48, 2, 1)])
+    db.refresh_combined(["Hamilton", "Nowhere"])
+
+    rows = db.query("SELECT census_metropolitan_area, year, month, education_level, province, "
+                    "total_starts, employed, unemployed FROM combined_stats "
+                    "ORDER BY census_metropolitan_area, education_level")
+    assert rows == [
+        ("Hamilton", 2024, 1, 2, 35, 15, 1, 1),
+        ("Hamilton", 2024, 1, 4, 35, 15, 1, 0),
+        ("Nowhere", 2024, 1, 0, None, 7, 0, 0),
+    ]
+
+    db.insert_rows(HOUSING, [housing_row(1, "Hamilton", 20)])
+    db.refresh_combined(["Hamilton"])
+    assert db.query("SELECT DISTINCT total_starts FROM combined_stats "
+                    "WHERE census_metropolitan_area = 'Hamilton'") == [(25,)]
+    assert db.query("SELECT version FROM data_version WHERE dataset = ? AND scope = 'Hamilton'",
+                    (COMBINED_STATS.table,)) == [(2,)]
+
+
+def test_refresh_combined_repeats_province_labour_counts_per_period(db):
+    march = (2, "Hamilton", 3, 2024, 5, 0, 0, 0, 0, 0, 0, 0, 0, 0)
+    db.insert_rows(HOUSING, [housing_row(1, "Hamilton", 10), march, housing_row(3, "Nowhere", 7)])
+    db.insert_rows(LABOUR_MARKET, [(1, 35, 2, 1), (2, 35, 2, 2)])
+    db.refresh_combined(["Hamilton", "Nowhere"])
+
+    # Labour records have no period: every month gets the province's counts
+    assert db.query("SELECT month, total_starts, employed, unemployed FROM combined_stats "
+                    "WHERE census_metropolitan_area = 'Hamilton' ORDER BY month") == [
+        (1, 10, 1, 1), (3, 5, 1, 1)
+    ]
+    assert db.query("SELECT scope, changed_rows FROM data_version WHERE dataset = ? "
+                    "ORDER BY scope", (COMBINED_STATS.table,)) == [
+        ("", 3), ("Hamilton", 2), ("Nowhere", 1)
+    ]
+
+    db.insert_rows(LABOUR_MARKET, [(3, 35, 2, 3)])
+    db.refresh_combined(["Hamilton"])
+    assert db.query("SELECT DISTINCT not_in_labour_force FROM combined_stats "
+                    "WHERE census_metropolitan_area = 'Hamilton'") == [(1,)]
+
+
+def test_named_lock_is_exclusive(db, tmp_path):
+    other = SqliteHandler(True, path=str(tmp_path / "test.db"), migrate_on_connect=False)
+    try:
+        assert db.lock("ingest_housing") is True
+        assert other.lock("ingest_housing", timeout=0) is False
+        db.unlock("ingest_housing")
+        assert other.lock("ingest_housing", timeout=0) is True
+    finally:
+        other.close()
+
+
+def test_migrate_records_applied_versions(db, tmp_path):
+    assert db.current_version() == 1
+    assert db.migrate() == []
+
+    fresh = SqliteHandler(True, path=str(tmp_path / "fresh.db"), migrate_on_connect=False)
+    try:
+        assert fresh.migrate(dry_run=True) == [1]
+        assert fresh.current_version() == 0
+    finally:
+        fresh.close()
+
+
+def test_changed_natural_key_rebuilds_existing_table(db, tmp_path, monkeypatch):
+    db.insert_rows(HOUSING, [housing_row(1, "Hamilton", 10), housing_row(2, "Toronto", 20)])
+    db.close()
+
+    dated = housing_dataset("Year")
+    monkeypatch.setitem(DATASETS, "housing", dated)
+    reopened = SqliteHandler(True, path=str(tmp_path / "test.db"))
+    try:
+        assert reopened.stored_key(dated.table) == ("jsonid", "year")
+        reopened.insert_rows(dated, [(1, "Hamilton", 1, 2025, 30, 0, 0, 0, 0, 0, 0, 0, 0, 0)])
+        assert reopened.query("SELECT jsonid, year, total_starts FROM housing_data "
+                              "ORDER BY id") == [(1, 2024, 10), (2, 2024, 20), (1, 2025, 30)]
+        assert reopened.query("SELECT name FROM sqlite_master WHERE type = 'index' "
+                              "AND name = 'idx_housing_data_cma_id_period'")
+        assert reopened.rekey_table(dated) is False
+    finally:
+        reopened.close()
@@ -0,0 +1,75 @@
+"""
+Test module for WorkQueue.py
+"""
+from datetime import date
+from unittest.mock import MagicMock
+import pytest
+from src.WorkQueue import WorkQueue
+
+
+@pytest.fixture
+def queue():
+    db = MagicMock()
+    cursor = db.acquire.return_value.cursor.return_value
+    return WorkQueue(db, owner="host:1", lease_seconds=60), db, cursor
+
+
+def test_claim_leases_with_skip_locked(queue):
+    work, db, cursor = queue
+    cursor.fetchall.return_value = [(4,)]
+    cursor.fetchone.return_value = (7, "housing", date(2024, 1, 1), date(2024, 1, 31))
+
+    assert work.claim() == (7, "housing", "2024-01-01", "2024-01-31")
+
+    expired, select, update = cursor.execute.call_args_list
+    assert "lease_until < NOW() AND attempts >= ?" in expired[0][0]
+    assert "FOR UPDATE SKIP LOCKED" in expired[0][0]
+    assert expired[0][1] == (3,)
+    assert "SET status = 'failed'" in cursor.executemany.call_args[0][0]
+    assert cursor.executemany.call_args[0][1] == [(4,)]
+    assert "FOR UPDATE SKIP LOCKED" in select[0][0]
+    assert "lease_until < NOW()" in select[0][0]
+    assert update[0][1] == ("host:1", 60, 7)
+    db.acquire.return_value.commit.assert_called_once()
+    db.release.assert_called_once()
+
+
+def test_claim_returns_none_when_queue_is_drained(queue):
+    work, _, cursor = queue
+    cursor.fetchall.return_value = []
+    cursor.fetchone.return_value = None
+    assert work.claim() is None
+    assert cursor.execute.call_count == 2
+    cursor.executemany.assert_not_called()
+
+
+def test_heartbeat_reports_lost_lease(queue):
+    work, _, cursor = queue
+    cursor.rowcount = 0
+    assert work.heartbeat(7) is False
+    assert cursor.execute.call_args[0][1] == (60, 7, "host:1")
+
+
+def test_complete_reports_lost_lease(queue):
+    work, _, cursor = queue
+    cursor.rowcount = 0
+    assert work.complete(7, 10) is False
+    assert "AND status = 'leased'" in cursor.execute.call_args[0][0]
+    assert cursor.execute.call_args[0][1] == (10, 7, "host:1")
+
+
+def test_failed_statement_rolls_back(queue):
+    work, db, cursor = queue
+    cursor.execute.side_effect = RuntimeError("deadlock")
+    with pytest.raises(RuntimeError):
+        work.fail(7, "boom")
+    db.acquire.return_value.rollback.assert_called_once()
+    db.release.assert_called_once()
+
+
+def test_enqueue_keeps_claim_order(queue):
+    work, _, cursor = queue
+    work.enqueue([("housing", "2024-02-01", "2024-03-01"), ("housing", "2024-01-01", "2024-02-01")])
+    assert cursor.executemany.call_args[0][1] == [
+        ("housing", "2024-02-01", "2024-03-01", 0), ("housing", "2024-01-01", "2024-02-01", 1)
+    ]
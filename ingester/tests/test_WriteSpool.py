@@ -0,0 +1,150 @@
+"""
+Test module for WriteSpool.py
+"""
+from unittest.mock import MagicMock
+import pytest
+from src.DatasetRegistry import LABOUR_MARKET
+from src.StorageBackend import StorageUnavailable
+from src.WriteSpool import FRAME_HEADER, WriteSpool
+
+
+@pytest.fixture
+def db():
+    backend = MagicMock()
+    backend.insert_rows.side_effect = lambda dataset, rows: len(rows)
+    backend.is_transient.return_value = False
+    return backend
+
+
+def test_writes_through_while_database_is_up(db, tmp_path):
+    spool = WriteSpool(db, directory=str(tmp_path / "spool"))
+    assert spool.insert_rows(LABOUR_MARKET, [(1, 35, 2, 1)]) == 1
+    assert spool.stats()["batches"] == 0
+    assert not (tmp_path / "spool").exists()
+
+
+def test_spools_while_down_and_drains_in_order(db, tmp_path):
+    committed = []
+    spool = WriteSpool(db, directory=str(tmp_path / "spool"), retry_interval=0,
+                       on_written=lambda dataset, rows: committed.append(rows))
+    db.insert_rows.side_effect = StorageUnavailable("down")
+
+    assert spool.insert_rows(LABOUR_MARKET, [(1, 35, 2, 1)]) == 0
+    assert spool.insert_rows(LABOUR_MARKET, [(1, 35, 2, 2)]) == 0
+    assert spool.stats()["batches"] == 2
+    assert committed == []
+
+    written = []
+    db.insert_rows.side_effect = lambda dataset, rows: written.append(rows) or len(rows)
+    assert spool.insert_rows(LABOUR_MARKET, [(2, 48, 1, 1)]) == 1
+
+    assert written == [[(1, 35, 2, 1)], [(1, 35, 2, 2)], [(2, 48, 1, 1)]]
+    assert committed == written
+    assert spool.stats() == {"batches": 0, "bytes": 0, "lag": 0.0}
+    assert not list((tmp_path / "spool").glob("segment-*"))
+
+
+def test_spool_survives_a_restart(db, tmp_path):
+    directory = str(tmp_path / "spool")
+    db.insert_rows.side_effect = StorageUnavailable("down")
+    spool = WriteSpool(db, directory=directory, segment_bytes=1)
+    spool.insert_rows(LABOUR_MARKET, [(1, 35, 2, 1)])
+    spool.insert_rows(LABOUR_MARKET, [(2, 35, 2, 1)])
+    spool.close()
+    # A crash mid-append leaves a partial frame behind
+    with open(spool.segment_path(1), "ab") as f:
+        f.write(b"\x00\x00\x01")
+
+    db.insert_rows.side_effect = lambda dataset, rows: len(rows)
+    restarted = WriteSpool(db, directory=directory)
+    assert restarted.stats()["batches"] == 2
+    assert restarted.drain() == 2
+    assert [call[0][1] for call in db.insert_rows.call_args_list[-2:]] == [
+        [(1, 35, 2, 1)], [(2, 35, 2, 1)]
+    ]
+    restarted.close()
+    assert WriteSpool(db, directory=directory).stats()["batches"] == 0
+
+
+def test_refused_batch_is_quarantined_and_draining_continues(db, tmp_path):
+    spool = WriteSpool(db, directory=str(tmp_path / "spool"), retry_interval=0)
+    db.insert_rows.side_effect = StorageUnavailable("down")
+    spool.insert_rows(LABOUR_MARKET, [(1, 35, 2, 1)])
+    spool.insert_rows(LABOUR_MARKET, [(2, 35, 2, 1)])
+
+    def insert_rows(dataset, rows):
+        if rows[0][0] == 1:
+            raise ValueError("refused")
+        return len(rows)
+    db.insert_rows.side_effect = insert_rows
+
+    assert spool.drain() == 1
+    assert spool.stats()["batches"] == 0
+    with open(spool.quarantine_path, "rb") as f:
+        data = f.read()
+    batch = WriteSpool.decode(data[FRAME_HEADER.size:])
+    assert (batch["dataset"], batch["rows"]) == ("labour_market", [[1, 35, 2, 1]])
+    spool.close()
+    assert WriteSpool(db, directory=str(tmp_path / "spool")).stats()["batches"] == 0
+
+
+def test_transient_error_keeps_batch_spooled(db, tmp_path):
+    spool = WriteSpool(db, directory=str(tmp_path / "spool"), retry_interval=0)
+    db.insert_rows.side_effect = StorageUnavailable("down")
+    spool.insert_rows(LABOUR_MARKET, [(1, 35, 2, 1)])
+    db.insert_rows.side_effect = RuntimeError("Deadlock found")
+    db.is_transient.return_value = True
+
+    assert spool.drain() == 0
+    assert spool.stats()["batches"] == 1
+    assert not (tmp_path / "spool" / "quarantine.spool").exists()
+    spool.close()
+
+
+def test_replay_quarantine_keeps_batches_refused_again(db, tmp_path):
+    committed = []
+    spool = WriteSpool(db, directory=str(tmp_path / "spool"), retry_interval=0,
+                       on_written=lambda dataset, rows: committed.append(rows))
+    db.insert_rows.side_effect = StorageUnavailable("down")
+    spool.insert_rows(LABOUR_MARKET, [(1, 35, 2, 1)])
+    spool.insert_rows(LABOUR_MARKET, [(2, 35, 2, 1)])
+    db.insert_rows.side_effect = ValueError("refused")
+    spool.drain()
+
+    def insert_rows(dataset, rows):
+        if rows[0][0] == 2:
+            raise ValueError("still refused")
+        return len(rows)
+    db.insert_rows.side_effect = insert_rows
+    assert spool.replay_quarantine(dry_run=True) == 0
+    assert committed == []
+
+    assert spool.replay_quarantine() == 1
+    assert committed == [[(1, 35, 2, 1)]]
+    with open(spool.quarantine_path, "rb") as f:
+        frames = WriteSpool.frames(f.read())
+    assert [WriteSpool.batch(frame[FRAME_HEADER.size:])[1] for frame in frames] == [[(2, 35, 2, 1)]]
+    spool.close()
+
+
+def test_spool_directory_is_used_by_one_process(db, tmp_path):
+    directory = str(tmp_path / "spool")
+    db.insert_rows.side_effect = StorageUnavailable("down")
+    owner = WriteSpool(db, directory=directory)
+    owner.insert_rows(LABOUR_MARKET, [(1, 35, 2, 1)])
+
+    other = WriteSpool(db, directory=directory)
+    assert other.stats()["batches"] == 0
+    with pytest.raises(StorageUnavailable):
+        other.insert_rows(LABOUR_MARKET, [(2, 35, 2, 1)])
+    assert owner.stats()["batches"] == 1
+
+    owner.close()
+    assert WriteSpool(db, directory=directory).stats()["batches"] == 1
+
+
+def test_disabled_spool_propagates_errors(db):
+    spool = WriteSpool(db, directory="")
+    db.insert_rows.side_effect = StorageUnavailable("down")
+    with pytest.raises(StorageUnavailable):
+        spool.insert_rows(LABOUR_MARKET, [(1, 35, 2, 1)])